@@ -1,16 +1,46 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
 import json
 import os
-from datetime import datetime
+import random
+from datetime import datetime, timedelta
 import difflib
 import hashlib
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 import sqlite3
-from dataclasses import dataclass
+import click
+from dataclasses import dataclass, asdict
 from pathlib import Path
+import shutil
+import tempfile
 import threading
 import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import Executor, ProcessPoolExecutor
+import multiprocessing
+
+import archive
+import blobstore
+import clusters
+import compression
+import db
+import dedupe
+import diffing
+import events
+import fingerprint
+import httpcache
+import idempotency
+import ingest_queue
+import lsh
+import metrics
+import profiling
+import reindex
+import search
+import server
+import shards
+from scoring import ScoringEngine
 
 app = Flask(__name__)
 CORS(app)
@@ -18,7 +48,102 @@ CORS(app)
 # Konfiguracja
 STORAGE_DIR = Path("code_blocks")
 DB_PATH = "code_blocks.db"
+SHARDS = int(os.environ.get('SHARDS', '0'))  # Pliki shardów obok DB_PATH, który jest wtedy bazą katalogu z mapą bloków (0 = jeden plik)
 SIMILARITY_THRESHOLD = 0.85  # Próg podobieństwa dla bloków kodu
+LSH_MAX_CANDIDATES = int(os.environ.get('LSH_MAX_CANDIDATES', lsh.MAX_CANDIDATES))  # Kandydaci z najwięcej wspólnymi pasmami liczeni dokładnie przy zapisie
+SCORING_POOL_SIZE = int(os.environ.get('SCORING_POOL_SIZE', os.cpu_count() or 1))  # 0 = bez puli procesów
+SCORING_PARALLEL_MIN_CHARS = 200_000  # Minimalna ilość tekstu do porównania, od której używamy puli
+
+# Podobieństwo liczone na ciągach tokenów zapisanych przy zapisie bloku (fingerprint.py), a nie na znakach
+TOKEN_SIMILARITY = os.environ.get('TOKEN_SIMILARITY', '1') == '1'
+CANONICAL_IDENTIFIERS = os.environ.get('CANONICAL_IDENTIFIERS', '0') == '1'  # Zmiana nazw nie obniża podobieństwa
+TOKEN_JUNK_LIMIT = 5000  # Dłuższe ciągi tokenów porównujemy z autojunk (koszt ratio() rośnie kwadratowo)
+
+scoring_engine = ScoringEngine(SIMILARITY_THRESHOLD, SCORING_POOL_SIZE, SCORING_PARALLEL_MIN_CHARS,
+                               junk_limit=TOKEN_JUNK_LIMIT if TOKEN_SIMILARITY else 0)
+app.config['SCORING_POOL_SIZE'] = SCORING_POOL_SIZE
+app.config['SCORING_STATS'] = scoring_engine.stats  # Liczniki kaskady filtrów
+
+# Zapis w tle: POST /code-blocks odpowiada 202 z id zadania, a bloki zapisują wątki kolejki
+ASYNC_INGEST = os.environ.get('ASYNC_INGEST', '0') == '1'
+INGEST_WORKERS = 2            # Liczba wątków opróżniających kolejkę (0 = tylko ręcznie)
+INGEST_QUEUE_MAX = 10000      # Maksymalna liczba zadań czekających w kolejce
+INGEST_JOB_TIMEOUT = 300      # Po ilu sekundach zadanie w toku uznajemy za porzucone
+
+# Sposób przechowywania kodu: 'files' - osobny plik na blok i kopia w kolumnie code,
+# 'pack' - dopisywane segmenty w STORAGE_DIR/packs, w bazie tylko położenie danych
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'files')
+PACK_SEGMENT_SIZE = 256 * 1024 * 1024
+
+# Kompresja kodu (kolumna code, pliki i segmenty) słownikiem wytrenowanym na korpusie
+COMPRESSION = os.environ.get('COMPRESSION', '0') == '1'
+COMPRESSION_LEVEL = 6
+COMPRESSION_MIN_SIZE = 64  # Krótszych bloków nie opłaca się kompresować
+COMPRESSED_FILE_SUFFIX = '.z'
+
+# Archiwum starych bloków (python app.py archive); 0 = bez tego kryterium
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_MAX_HOT_MB = int(os.environ.get('ARCHIVE_MAX_HOT_MB', '0'))  # Budżet kodu w każdym pliku bazy roboczej
+ARCHIVE_SEGMENT_AGE = 3600  # Segment bez bloków usuwamy, gdy od ostatniego dopisania minęła godzina
+
+# Indeks pełnotekstowy FTS5 (trigram) dla GET /code-blocks/search
+FULL_TEXT_SEARCH = os.environ.get('FULL_TEXT_SEARCH', '1') == '1'
+
+# Strumień zmian GET /events (Server-Sent Events)
+EVENTS_KEEPALIVE = 15     # Co ile sekund ciszy wysyłamy komentarz podtrzymujący połączenie
+EVENTS_RETRY_MS = 2000    # Po ilu milisekundach przeglądarka ma wznowić zerwany strumień
+EVENTS_REPLAY_BATCH = 1000
+
+event_bus = events.EventBus()
+event_relay: Optional[events.Relay] = None  # Działa w trybie `serve` - zdarzenia wszystkich procesów
+
+# Odrzucanie powtórzonych bloków w pamięci: LRU ostatnich hashy i filtr Blooma
+DEDUPE_CACHE = os.environ.get('DEDUPE_CACHE', '1') == '1'
+DEDUPE_LRU_SIZE = dedupe.LRU_SIZE
+DEDUPE_BLOOM_CAPACITY = dedupe.BLOOM_CAPACITY
+
+# Powtórzone paczki strony (ta sama treść lub ten sam Idempotency-Key)
+PAYLOAD_DEDUPE = os.environ.get('PAYLOAD_DEDUPE', '1') == '1'
+recent_payloads = idempotency.TTLCache(idempotency.PAYLOAD_TTL)
+idempotency_keys = idempotency.TTLCache(idempotency.KEY_TTL)
+app.config['PAYLOAD_DEDUPE_STATS'] = {'digest_hits': 0, 'key_replays': 0}
+
+# POST /code-blocks/similar-query - koszt zapytania ograniczają liczba kandydatów i k, nie rozmiar bazy
+SIMILAR_QUERY_CANDIDATES = 200  # Ilu kandydatów z LSH dostaje dokładny wynik
+SIMILAR_QUERY_K = 10
+SIMILAR_QUERY_MAX_K = 100
+SIMILAR_QUERY_MIN_SCORE = 0.5
+
+# Diff dwóch bloków
+DIFF_CONTEXT = 3                        # Domyślna liczba linii kontekstu
+DIFF_MAX_CONTEXT = 1000
+DIFF_MAX_BYTES = 1024 * 1024            # Domyślny limit rozmiaru odpowiedzi
+DIFF_MAX_BYTES_LIMIT = 16 * 1024 * 1024  # Większego limitu nie da się zażądać
+DIFF_CACHE_BYTES = 64 * 1024 * 1024
+
+diff_cache = diffing.DiffCache(DIFF_CACHE_BYTES)
+
+# ETag i 304 dla list, podobnych bloków i diffów oraz pamięć gotowych odpowiedzi
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', '1') == '1'
+RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+
+response_cache = httpcache.ResponseCache(RESPONSE_CACHE_BYTES if RESPONSE_CACHE else 0)
+
+# Metryki Prometheusa na GET /metrics: czasy tras i etapów zapisu oraz liczniki
+METRICS = os.environ.get('METRICS', '1') == '1'
+METRICS_DIR: Optional[str] = None  # Wspólny katalog stanów procesów w trybie `serve`
+
+metrics_registry = metrics.Registry(enabled=METRICS)
+metrics_writer: Optional[metrics.SnapshotWriter] = None
+if METRICS:
+    db.observer = metrics_registry.observe_stage
+
+# Profil pojedynczego żądania: nagłówek `X-Profile: 1|sample` lub `?profile=1|sample`
+# (tylko z localhost) oraz PROFILE_SAMPLE_RATE losowych żądań pod profilerem próbkującym
+PROFILING = os.environ.get('PROFILING', '0') == '1'
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
 
 @dataclass
 class CodeBlock:
@@ -32,33 +157,272 @@ class CodeBlock:
     file_path: Optional[str] = None
     similar_blocks: List[str] = None
 
+_database: ContextVar[Optional[str]] = ContextVar('database', default=None)
+
+def current_database() -> str:
+    return _database.get() or DB_PATH
+
+def get_db(path: Optional[str] = None):
+    """Połączenie z puli dla bieżącego wątku (blok `with` = jedna transakcja).
+
+    Bez `path` - baza wybrana przez using_database(), domyślnie DB_PATH.
+    """
+    return db.get_pool(path or current_database()).connection()
+
+@contextmanager
+def using_database(path: str):
+    """W tym bloku get_db() bez argumentu łączy się z `path` (np. z jednym shardem)"""
+    token = _database.set(path)
+    try:
+        yield
+    finally:
+        _database.reset(token)
+
+def shard_path(language: str, platform: str) -> str:
+    return shards.shard_path(DB_PATH, shards.shard_index(language, platform, SHARDS))
+
+def database_paths(language: Optional[str] = None, platform: Optional[str] = None) -> List[str]:
+    """Pliki z blokami: jeden shard, gdy podano język i platformę, wszystkie shardy albo DB_PATH"""
+    if not SHARDS:
+        return [DB_PATH]
+    if language and platform:
+        return [shard_path(language, platform)]
+    return [shards.shard_path(DB_PATH, index) for index in range(SHARDS)]
+
+def archive_path() -> Optional[str]:
+    """Plik archiwum, jeśli polecenie `archive` już go utworzyło"""
+    path = archive.archive_path(DB_PATH)
+    return path if os.path.exists(path) else None
+
+def for_each_database(func, *args, **kwargs) -> list:
+    """Wywołuje `func` osobno dla każdego pliku z blokami (polecenia utrzymaniowe)"""
+    results = []
+    for path in database_paths():
+        with using_database(path):
+            results.append(func(*args, **kwargs))
+    return results
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS code_blocks (
-            hash TEXT PRIMARY KEY,
-            code TEXT NOT NULL,
-            language TEXT NOT NULL,
-            platform TEXT NOT NULL,
-            url TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            title TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        )
-        """)
-
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS similar_blocks (
-            block_hash TEXT NOT NULL,
-            similar_hash TEXT NOT NULL,
-            similarity_score REAL NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (block_hash) REFERENCES code_blocks (hash),
-            FOREIGN KEY (similar_hash) REFERENCES code_blocks (hash),
-            PRIMARY KEY (block_hash, similar_hash)
-        )
-        """)
+    with get_db(DB_PATH) as conn:
+        init_block_schema(conn)
+        ingest_queue.init_schema(conn)
+        events.init_schema(conn)
+        httpcache.init_schema(conn)
+        shards.init_catalog(conn)
+        check_shards(conn)
+
+    if SHARDS:
+        for path in database_paths():
+            with get_db(path) as conn:
+                init_block_schema(conn)
+
+    if DEDUPE_CACHE:
+        with get_db(DB_PATH) as conn:
+            warm_dedupe_cache(conn)
+
+def check_shards(conn) -> None:
+    registered = shards.count(conn)
+    if registered == SHARDS:
+        return
+    if registered:
+        raise RuntimeError(f"Database is split into {registered} shards, set SHARDS={registered}")
+    if conn.execute("SELECT 1 FROM code_blocks LIMIT 1").fetchone() is not None:
+        raise RuntimeError("Database is not sharded yet, run `python app.py split-shards` first")
+    shards.register(conn, DB_PATH, SHARDS)
+
+def init_block_schema(conn) -> None:
+    """Tabele bloków, podobieństwa i indeksów - w DB_PATH albo w każdym shardzie"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS code_blocks (
+        hash TEXT PRIMARY KEY,
+        code TEXT NOT NULL,
+        language TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        url TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        title TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS similar_blocks (
+        block_hash TEXT NOT NULL,
+        similar_hash TEXT NOT NULL,
+        similarity_score REAL NOT NULL,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (block_hash) REFERENCES code_blocks (hash),
+        FOREIGN KEY (similar_hash) REFERENCES code_blocks (hash),
+        PRIMARY KEY (block_hash, similar_hash)
+    )
+    """)
+
+    # Kolumny dodane po pierwszej wersji schematu
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(code_blocks)")}
+    for column, column_type in (
+        ('code_length', 'INTEGER'),
+        ('blob_segment', 'INTEGER'),
+        ('blob_offset', 'INTEGER'),
+        ('blob_length', 'INTEGER'),
+        ('codec', 'TEXT'),
+        ('dict_id', 'INTEGER'),
+        ('cluster_id', 'INTEGER'),
+        ('centrality', 'REAL NOT NULL DEFAULT 0'),
+    ):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE code_blocks ADD COLUMN {column} {column_type}")
+    conn.execute("UPDATE code_blocks SET code_length = length(code) WHERE code_length IS NULL")
+
+    # Indeksy pod listowanie od najnowszych z filtrami platformy i języka
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_code_blocks_created ON code_blocks (created_at, hash)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_code_blocks_platform_language_created "
+        "ON code_blocks (platform, language, created_at, hash)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_code_blocks_platform_created "
+        "ON code_blocks (platform, created_at, hash)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_code_blocks_language_created "
+        "ON code_blocks (language, created_at, hash)"
+    )
+
+    lsh.init_schema(conn)
+    fingerprint.init_schema(conn)
+    compression.init_schema(conn)
+    clusters.init_schema(conn)
+    reindex.init_schema(conn)
+    if FULL_TEXT_SEARCH:
+        search.init_schema(conn)
+    else:
+        search.drop_schema(conn)
+    index_missing_blocks(conn)
+    if TOKEN_SIMILARITY:
+        fingerprint_missing_blocks(conn)
+    clusters.assign_missing(conn)
+
+def warm_dedupe_cache(conn) -> dedupe.DedupeCache:
+    cache = dedupe.warm(conn, DEDUPE_BLOOM_CAPACITY, DEDUPE_LRU_SIZE,
+                        table='block_shards' if SHARDS else 'code_blocks')
+    dedupe.set_cache(DB_PATH, cache)
+    app.config['DEDUPE_STATS'] = cache.stats  # Liczniki trafień i chybień
+    return cache
+
+def get_dedupe_cache() -> Optional[dedupe.DedupeCache]:
+    if not DEDUPE_CACHE:
+        return None
+    cache = dedupe.get_cache(DB_PATH)
+    if cache is None:
+        with get_db(DB_PATH) as conn:
+            cache = warm_dedupe_cache(conn)
+    return cache
+
+def index_missing_blocks(conn) -> int:
+    """Dodaje do indeksu LSH bloki zapisane przed jego wprowadzeniem"""
+    rows = conn.execute("""
+        SELECT hash, language, platform
+        FROM code_blocks
+        WHERE hash NOT IN (SELECT hash FROM block_signatures)
+    """).fetchall()
+
+    count = 0
+    for i in range(0, len(rows), 500):
+        chunk = rows[i:i + 500]
+        codes = load_code(conn, [row[0] for row in chunk])
+        for row in chunk:
+            lsh.index_block(conn, row[0], row[1], row[2], lsh.minhash_signature(codes[row[0]]))
+            count += 1
+
+    if count:
+        print(f"Zindeksowano {count} bloków kodu w indeksie LSH")
+    return count
+
+def fingerprint_missing_blocks(conn) -> int:
+    """Liczy odciski tokenów bloków zapisanych bez nich albo w innym wariancie"""
+    name = fingerprint.scheme(CANONICAL_IDENTIFIERS)
+    count = 0
+    while True:
+        rows = fingerprint.missing(conn, name, 500)
+        if not rows:
+            break
+        codes = load_code(conn, [row[0] for row in rows])
+        fingerprint.store(conn, name, [
+            (block_hash, fingerprint.fingerprint(codes[block_hash], language, CANONICAL_IDENTIFIERS))
+            for block_hash, language in rows
+        ])
+        count += len(rows)
+
+    if count:
+        print(f"Policzono odciski tokenów {count} bloków kodu")
+    return count
+
+def load_fingerprints(conn, hashes: List[str], language: str) -> Dict[str, Sequence[int]]:
+    """Zapisane odciski bloków; brakujące liczymy z kodu"""
+    found = fingerprint.load(conn, fingerprint.scheme(CANONICAL_IDENTIFIERS), hashes)
+    missing = [block_hash for block_hash in hashes if block_hash not in found]
+    for block_hash, code in load_code(conn, missing).items():
+        found[block_hash] = fingerprint.fingerprint(code, language, CANONICAL_IDENTIFIERS)
+    return {block_hash: fingerprint.from_bytes(data) for block_hash, data in found.items()}
+
+def get_blob_store() -> blobstore.BlobStore:
+    return blobstore.get_store(STORAGE_DIR / 'packs', PACK_SEGMENT_SIZE)
+
+_dictionaries: Dict[tuple, bytes] = {}
+
+def get_dictionary(conn, dict_id: Optional[int]) -> Optional[bytes]:
+    if dict_id is None:
+        return None
+    # Każdy shard numeruje swoje słowniki od 1
+    key = (getattr(conn, 'path', DB_PATH), dict_id)
+    if key not in _dictionaries:
+        # Słowniki się nie zmieniają - nowy trening dodaje nowy wiersz
+        _dictionaries[key] = compression.load_dictionary(conn, dict_id)
+    return _dictionaries[key]
+
+def encode_code(conn, code: str) -> tuple:
+    """Zwraca (dane, kodek, id słownika) do zapisu bloku"""
+    data = code.encode('utf-8')
+    if not COMPRESSION or len(data) < COMPRESSION_MIN_SIZE:
+        return data, None, None
+
+    dict_id = compression.latest_dictionary_id(conn)
+    compressed = compression.compress(data, get_dictionary(conn, dict_id), COMPRESSION_LEVEL)
+    if len(compressed) >= len(data):
+        return data, None, None
+    return compressed, compression.CODEC, dict_id
+
+def decode_code(conn, data, codec: Optional[str], dict_id: Optional[int]) -> str:
+    if codec == compression.CODEC:
+        data = compression.decompress(bytes(data), get_dictionary(conn, dict_id))
+    if isinstance(data, str):
+        return data
+    return str(data, 'utf-8')
+
+def load_code(conn, hashes: Iterable[str]) -> Dict[str, str]:
+    """Wczytuje kod bloków z kolumny code albo z segmentów, zależnie od miejsca zapisu.
+
+    Rozpakowanie następuje dopiero tutaj, czyli tylko dla bloków,
+    których tekst jest naprawdę potrzebny (diff, dokładne podobieństwo).
+    """
+    hashes = list(hashes)
+    codes = {}
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in conn.execute(f"""
+            SELECT hash, code, blob_segment, blob_offset, blob_length, codec, dict_id
+            FROM code_blocks WHERE hash IN ({placeholders})
+        """, chunk):
+            if row[2] is None:
+                data = row[1]
+            else:
+                data = get_blob_store().get(row[2], row[3], row[4])
+            codes[row[0]] = decode_code(conn, data, row[5], row[6])
+    return codes
 
 def calculate_hash(code: str) -> str:
     return hashlib.sha256(code.encode()).hexdigest()
@@ -66,241 +430,1968 @@ def calculate_hash(code: str) -> str:
 def compute_similarity(text1: str, text2: str) -> float:
     return difflib.SequenceMatcher(None, text1, text2).ratio()
 
-def find_similar_blocks(new_block: CodeBlock, conn) -> List[Dict]:
+def find_similar_blocks(new_block: CodeBlock, conn, signature: Optional[bytes] = None,
+                        engine: Optional[ScoringEngine] = None,
+                        older_than: Optional[int] = None,
+                        tokens: Optional[bytes] = None) -> List[Dict]:
+    """Podobne bloki z bazy; `older_than` ogranicza je do rowid mniejszych od podanego"""
+    with metrics_registry.stage('find_similar'):
+        return _find_similar_blocks(new_block, conn, signature, engine, older_than, tokens)
+
+def _find_similar_blocks(new_block: CodeBlock, conn, signature: Optional[bytes],
+                         engine: Optional[ScoringEngine], older_than: Optional[int],
+                         tokens: Optional[bytes]) -> List[Dict]:
     similar_blocks = []
+    engine = engine or scoring_engine
+
+    if signature is None:
+        signature = lsh.minhash_signature(new_block.code)
 
-    # Pobierz wszystkie bloki kodu z tej samej platformy i języka
-    cursor = conn.execute("""
-        SELECT hash, code, language, platform, url, title, file_path
+    # Kandydaci z indeksu LSH tej samej platformy i języka - dokładne
+    # podobieństwo liczymy tylko dla nich, a nie dla całej tabeli
+    candidates = lsh.query_candidates(
+        conn, new_block.language, new_block.platform, signature, LSH_MAX_CANDIDATES
+    )
+    metrics_registry.inc('lsh_candidates_total', len(candidates))
+    if len(candidates) == LSH_MAX_CANDIDATES:
+        # Limit obciął kandydatów - dalsi, z mniej wspólnymi pasmami, nie są porównywani
+        metrics_registry.inc('lsh_candidates_truncated_total')
+    if not candidates:
+        return similar_blocks
+
+    placeholders = ", ".join("?" * len(candidates))
+    query = f"""
+        SELECT hash, COALESCE(code_length, length(code)), url, title, file_path
         FROM code_blocks
-        WHERE language = ? AND platform = ?
-    """, (new_block.language, new_block.platform))
+        WHERE hash IN ({placeholders})
+    """
+    if older_than is not None:
+        query += " AND rowid < ?"
+        candidates = candidates + [older_than]
+    rows = {row[0]: row for row in conn.execute(query, candidates)}
 
-    for row in cursor:
-        similarity = compute_similarity(new_block.code, row[1])
-        if similarity >= SIMILARITY_THRESHOLD and similarity < 1.0:
+    # Kaskada: długość -> quick ratio -> ratio(); tekst wczytujemy dopiero
+    # dla kandydatów, których nie odrzuciło ograniczenie z długości
+    if TOKEN_SIMILARITY:
+        if tokens is None:
+            tokens = fingerprint.fingerprint(new_block.code, new_block.language, CANONICAL_IDENTIFIERS)
+        sequence = fingerprint.from_bytes(tokens)
+        lengths = fingerprint.lengths(conn, fingerprint.scheme(CANONICAL_IDENTIFIERS), list(rows))
+        matches = engine.score(
+            sequence,
+            # Bez zapisanego odcisku długość nieznana - ograniczenie go nie odrzuci
+            [(block_hash, lengths.get(block_hash, len(sequence))) for block_hash in rows],
+            lambda hashes: load_fingerprints(conn, hashes, new_block.language)
+        )
+    else:
+        matches = engine.score(
+            new_block.code,
+            [(row[0], row[1]) for row in rows.values()],
+            lambda hashes: load_code(conn, hashes)
+        )
+
+    for block_hash, similarity in matches:
+        # Ciągi tokenów mogą być równe dla różnych tekstów - pomijamy tylko ten sam blok
+        if block_hash != new_block.hash:
+            row = rows[block_hash]
             similar_blocks.append({
                 'hash': row[0],
                 'similarity': similarity,
-                'url': row[4],
-                'title': row[5],
-                'file_path': row[6]
+                'url': row[2],
+                'title': row[3],
+                'file_path': row[4]
             })
 
     return similar_blocks
 
-def save_code_block(block: CodeBlock) -> Dict:
-    # Tworzenie struktury katalogów
-    platform_dir = STORAGE_DIR / block.platform / block.language
-    platform_dir.mkdir(parents=True, exist_ok=True)
-
-    # Tworzenie nazwy pliku
+def block_file_path(block: CodeBlock, root: Optional[Path] = None) -> Path:
     timestamp = datetime.fromisoformat(block.timestamp.replace('Z', '+00:00'))
     file_name = f"{timestamp.strftime('%Y%m%d_%H%M%S')}_{block.hash[:8]}.{block.language}"
-    file_path = platform_dir / file_name
-
-    # Zapisywanie kodu do pliku
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(block.code)
-
-    block.file_path = str(file_path)
-
-    # Zapisywanie metadanych do bazy danych
-    with sqlite3.connect(DB_PATH) as conn:
-        # Sprawdzanie podobnych bloków
-        similar_blocks = find_similar_blocks(block, conn)
-
-        # Zapisywanie głównego bloku
-        conn.execute("""
-            INSERT INTO code_blocks
-            (hash, code, language, platform, url, timestamp, title, file_path, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            block.hash, block.code, block.language, block.platform,
-            block.url, block.timestamp, block.title, str(file_path),
-            datetime.utcnow().isoformat()
+    return (root or STORAGE_DIR) / block.platform / block.language / file_name
+
+def existing_hashes(conn, hashes: List[str]) -> set:
+    found = set()
+    # SQLite ogranicza liczbę parametrów w jednym zapytaniu
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        found.update(row[0] for row in conn.execute(
+            f"SELECT hash FROM code_blocks WHERE hash IN ({placeholders})", chunk
         ))
+    return found
 
-        # Zapisywanie powiązań z podobnymi blokami
-        for similar in similar_blocks:
-            conn.execute("""
-                INSERT INTO similar_blocks
-                (block_hash, similar_hash, similarity_score, created_at)
-                VALUES (?, ?, ?, ?)
-            """, (
-                block.hash, similar['hash'], similar['similarity'],
-                datetime.utcnow().isoformat()
-            ))
+def known_hashes(hashes: List[str]) -> set:
+    """Hashe już zapisanych bloków; bazę pytamy tylko, gdy nie rozstrzygnie pamięć"""
+    def lookup(uncertain):
+        with get_db(DB_PATH) as conn:
+            if SHARDS:
+                return set(shards.locate(conn, uncertain))
+            return existing_hashes(conn, uncertain)
 
-    return {
+    with metrics_registry.stage('dedupe'):
+        cache = get_dedupe_cache()
+        if cache is None:
+            return lookup(hashes)
+        return cache.known(hashes, lookup)
+
+def find_similar_in_batch(block: CodeBlock, batch: List[CodeBlock],
+                          engine: Optional[ScoringEngine] = None,
+                          tokens: Optional[Dict[str, bytes]] = None) -> List[Dict]:
+    """Podobne bloki wśród wcześniejszych bloków tej samej paczki; `tokens` - odciski po hashu"""
+    others = {
+        other.hash: other for other in batch
+        if other.language == block.language and other.platform == block.platform
+    }
+    if not others:
+        return []
+
+    engine = engine or scoring_engine
+    if TOKEN_SIMILARITY:
+        tokens = dict(tokens or {})
+        for other in [block, *others.values()]:
+            if other.hash not in tokens:
+                tokens[other.hash] = fingerprint.fingerprint(other.code, other.language, CANONICAL_IDENTIFIERS)
+        matches = engine.score(
+            fingerprint.from_bytes(tokens[block.hash]),
+            [(h, len(tokens[h]) // 4) for h in others],
+            lambda hashes: {h: fingerprint.from_bytes(tokens[h]) for h in hashes}
+        )
+    else:
+        matches = engine.score(
+            block.code,
+            [(other.hash, len(other.code)) for other in others.values()],
+            lambda hashes: {h: others[h].code for h in hashes}
+        )
+    return [{
+        'hash': block_hash,
+        'similarity': similarity,
+        'url': others[block_hash].url,
+        'title': others[block_hash].title,
+        'file_path': others[block_hash].file_path
+    } for block_hash, similarity in matches if block_hash != block.hash]
+
+def merge_similar(similar_blocks: List[Dict]) -> List[Dict]:
+    """Jeden wpis na hash z najwyższym podobieństwem.
+
+    Blok zapisany przez inne żądanie w trakcie paczki znajdujemy i w bazie,
+    i wśród bloków paczki - a similar_blocks ma klucz (block_hash, similar_hash).
+    """
+    best = {}
+    for item in similar_blocks:
+        if item['hash'] not in best or item['similarity'] > best[item['hash']]['similarity']:
+            best[item['hash']] = item
+    return list(best.values())
+
+def save_code_blocks(blocks: List[CodeBlock], engine: Optional[ScoringEngine] = None,
+                     pool: Optional[Executor] = None) -> List[Dict]:
+    """Zapisuje paczkę nowych bloków w jednej transakcji.
+
+    Podobieństwo jest liczone względem bazy i wcześniejszych bloków
+    z tej samej paczki. Bloki, które w międzyczasie zapisało inne
+    żądanie, są pomijane. Z `pool` sygnatury MinHash liczą procesy puli.
+    """
+    if not blocks:
+        return []
+
+    with metrics_registry.stage('save'):
+        results = _save_code_blocks(blocks, engine, pool)
+    metrics_registry.inc('blocks_saved_total', len(results))
+    return results
+
+def _save_code_blocks(blocks: List[CodeBlock], engine: Optional[ScoringEngine],
+                      pool: Optional[Executor]) -> List[Dict]:
+    for block in blocks:
+        block.file_path = str(block_file_path(block))
+    with metrics_registry.stage('signatures'):
+        codes = [block.code for block in blocks]
+        mapper = pool.map if pool is not None else map
+        signatures = list(mapper(lsh.minhash_signature, codes))
+        tokens: List[Optional[bytes]] = [None] * len(blocks)
+        if TOKEN_SIMILARITY:
+            tokens = list(mapper(fingerprint.fingerprint, codes, [block.language for block in blocks],
+                                 [CANONICAL_IDENTIFIERS] * len(blocks)))
+        by_hash = {block.hash: data for block, data in zip(blocks, tokens) if data is not None}
+
+    if SHARDS:
+        saved, recorded, version = _save_sharded(blocks, signatures, tokens, by_hash, engine)
+    else:
+        with get_db() as conn:
+            saved, created_at = _write_blocks(conn, blocks, signatures, tokens, by_hash, engine)
+            recorded = events.record(conn, block_changes(saved, created_at))
+            version = httpcache.bump(conn) if saved else None
+
+    # Po zatwierdzeniu - klienci mogą od razu pobrać zapisane bloki
+    if version is not None:
+        httpcache.get_version(DB_PATH).advance(*version)
+    if event_relay is None:
+        event_bus.publish(recorded)
+    cache = get_dedupe_cache()
+    if cache is not None:
+        cache.add(block.hash for block in blocks)
+
+    return [{
         'hash': block.hash,
-        'file_path': str(file_path),
+        'file_path': block.file_path,
         'similar_blocks': similar_blocks
-    }
+    } for block, _, similar_blocks in saved]
 
-@app.route('/code-blocks', methods=['POST'])
-def receive_code_blocks():
-    data = request.json
-    blocks_data = data.get('blocks', [])
+def _save_sharded(blocks: List[CodeBlock], signatures: List[bytes], tokens: List[Optional[bytes]],
+                  by_hash: Dict[str, bytes], engine: Optional[ScoringEngine]) -> tuple:
+    """Zapisuje bloki w shardach; zwraca (zapisane, zdarzenia, wersja danych).
+
+    Każdy shard dostaje własną transakcję, a na końcu krótka transakcja
+    katalogu zapisuje mapę bloków, zdarzenia i nową wersję danych.
+    """
+    groups: Dict[int, List[int]] = {}
+    for i, block in enumerate(blocks):
+        groups.setdefault(shards.shard_index(block.language, block.platform, SHARDS), []).append(i)
+
+    saved = []
+    located = []
+    changes = []
+    for index, positions in groups.items():
+        group = [blocks[i] for i in positions]
+        with get_db(shards.shard_path(DB_PATH, index)) as conn:
+            group_saved, created_at = _write_blocks(
+                conn, group, [signatures[i] for i in positions], [tokens[i] for i in positions],
+                by_hash, engine
+            )
+        saved.extend(group_saved)
+        changes.extend(block_changes(group_saved, created_at))
+        # Także bloki już obecne w shardzie - mapa mogła ich nie mieć po przerwanym zapisie
+        located.extend((block.hash, index, created_at) for block in group)
+
+    # Ten sam kod zapisany równolegle pod inną parą trafia do dwóch shardów;
+    # mapa wskazuje pierwszy z nich
+    with get_db(DB_PATH) as conn:
+        shards.add(conn, located)
+        recorded = events.record(conn, changes)
+        version = httpcache.bump(conn) if saved else None
+    return saved, recorded, version
+
+def _write_blocks(conn, blocks: List[CodeBlock], signatures: List[bytes], tokens: List[Optional[bytes]],
+                  by_hash: Dict[str, bytes], engine: Optional[ScoringEngine]) -> Tuple[list, str]:
+    """Zapisuje bloki w transakcji `conn`; zwraca ([(blok, sygnatura, podobne)], created_at)"""
+    # Sprawdzanie podobnych bloków
+    similar = []
+    for i, (block, signature) in enumerate(zip(blocks, signatures)):
+        similar.append(merge_similar(
+            find_similar_blocks(block, conn, signature, engine, tokens=tokens[i])
+            + find_similar_in_batch(block, blocks[:i], engine, by_hash)
+        ))
+
+    # Od tego miejsca trzymamy blokadę zapisu aż do zatwierdzenia
+    if not conn.in_transaction:
+        with metrics_registry.stage('db_lock_wait'):
+            conn.execute("BEGIN IMMEDIATE")
+    already_saved = existing_hashes(conn, [block.hash for block in blocks])
+
+    created_at = datetime.utcnow().isoformat()
+    saved = [
+        (block, signature, similar_blocks)
+        for block, signature, similar_blocks in zip(blocks, signatures, similar)
+        if block.hash not in already_saved
+    ]
+
+    # Zapisywanie kodu do plików albo do segmentów
+    stored = {}
+    written = 0
+    with metrics_registry.stage('write_storage'):
+        for block, _, _ in saved:
+            data, codec, dict_id = encode_code(conn, block.code)
+            location = (None, None, None)
+            if STORAGE_BACKEND == 'pack':
+                location = get_blob_store().put(block.hash, data)
+                block.file_path = str(get_blob_store().segment_path(location[0]))
+                column = ''
+            elif codec:
+                block.file_path += COMPRESSED_FILE_SUFFIX
+                column = data
+            else:
+                column = block.code
+
+            if STORAGE_BACKEND != 'pack':
+                file_path = Path(block.file_path)
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(file_path, 'wb') as f:
+                    f.write(data)
+            stored[block.hash] = (column, *location, codec, dict_id)
+            written += len(data)
+
+    metrics_registry.inc('bytes_written_total', written, backend=STORAGE_BACKEND)
+
+    # Zapisywanie bloków, indeksu LSH i powiązań z podobnymi blokami
+    conn.executemany("""
+        INSERT INTO code_blocks
+        (hash, language, platform, url, timestamp, title, file_path, created_at, code_length,
+         code, blob_segment, blob_offset, blob_length, codec, dict_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(
+        block.hash, block.language, block.platform, block.url, block.timestamp,
+        block.title, block.file_path, created_at, len(block.code),
+        *stored[block.hash]
+    ) for block, _, _ in saved])
+
+    # Bloki zapisane jako tekst indeksuje wyzwalacz, pozostałe dodajemy sami
+    not_plain = [
+        block for block, _, _ in saved
+        if stored[block.hash][0] == '' or isinstance(stored[block.hash][0], bytes)
+    ]
+    if FULL_TEXT_SEARCH and not_plain:
+        rowids = dict(conn.execute(f"""
+            SELECT hash, rowid FROM code_blocks
+            WHERE hash IN ({', '.join('?' * len(not_plain))})
+        """, [block.hash for block in not_plain]).fetchall())
+        search.index_blocks(conn, [(rowids[block.hash], block.code) for block in not_plain])
+
+    lsh.index_blocks(conn, [
+        (block.hash, block.language, block.platform, signature)
+        for block, signature, _ in saved
+    ])
+    if TOKEN_SIMILARITY:
+        fingerprint.store(conn, fingerprint.scheme(CANONICAL_IDENTIFIERS),
+                          [(block.hash, by_hash[block.hash]) for block, _, _ in saved])
+
+    conn.executemany("""
+        INSERT INTO similar_blocks
+        (block_hash, similar_hash, similarity_score, created_at)
+        VALUES (?, ?, ?, ?)
+    """, [
+        (block.hash, item['hash'], item['similarity'], created_at)
+        for block, _, similar_blocks in saved
+        for item in similar_blocks
+    ])
+
+    clusters.add_blocks(conn, [block.hash for block, _, _ in saved], [
+        (block.hash, item['hash'], item['similarity'])
+        for block, _, similar_blocks in saved
+        for item in similar_blocks
+    ])
+
+    return saved, created_at
+
+def block_changes(saved: list, created_at: str) -> List[Tuple[str, Dict]]:
+    changes = []
+    for block, _, similar_blocks in saved:
+        changes.append((events.BLOCK_ADDED, {
+            'hash': block.hash,
+            'language': block.language,
+            'platform': block.platform,
+            'url': block.url,
+            'title': block.title,
+            'file_path': block.file_path,
+            'created_at': created_at
+        }))
+        if similar_blocks:
+            changes.append((events.SIMILAR_FOUND, {
+                'hash': block.hash,
+                'similar_blocks': similar_blocks
+            }))
+    return changes
+
+def save_code_block(block: CodeBlock) -> Optional[Dict]:
+    results = save_code_blocks([block])
+    return results[0] if results else None
+
+REQUIRED_BLOCK_FIELDS = ('code', 'language', 'platform', 'url', 'timestamp')
+
+def parse_code_blocks(data: Dict) -> List[CodeBlock]:
+    """Tworzy bloki z żądania, pomijając puste i powtórzone w tej samej paczce"""
     metadata = data.get('metadata', {})
 
-    results = []
-    for block_data in blocks_data:
+    blocks = {}
+    for block_data in data.get('blocks', []):
+        if not isinstance(block_data, dict):
+            raise ValueError("Each block must be an object")
+        missing = [field for field in REQUIRED_BLOCK_FIELDS if field not in block_data]
+        if missing:
+            raise ValueError(f"Missing block fields: {', '.join(missing)}")
+        for field in ('code', 'timestamp'):
+            if not isinstance(block_data[field], str):
+                raise ValueError(f"Block field '{field}' must be a string")
+
         code = block_data['code'].strip()
         if not code:
             continue
 
-        block = CodeBlock(
+        # Błędny timestamp musi wyjść teraz, a nie dopiero przy zapisie pliku
+        datetime.fromisoformat(block_data['timestamp'].replace('Z', '+00:00'))
+
+        block_hash = calculate_hash(code)
+        if block_hash in blocks:
+            continue
+
+        blocks[block_hash] = CodeBlock(
             code=code,
             language=block_data['language'],
             platform=block_data['platform'],
             url=block_data['url'],
             timestamp=block_data['timestamp'],
             title=block_data.get('title', metadata.get('title', 'Untitled')),
-            hash=calculate_hash(code)
+            hash=block_hash
         )
 
-        # Sprawdź czy blok już istnieje
-        with sqlite3.connect(DB_PATH) as conn:
-            existing = conn.execute(
-                "SELECT hash FROM code_blocks WHERE hash = ?",
-                (block.hash,)
-            ).fetchone()
+    return list(blocks.values())
 
-            if existing:
-                continue
+def store_new_blocks(blocks: List[CodeBlock], engine: Optional[ScoringEngine] = None,
+                     pool: Optional[Executor] = None) -> Dict:
+    if blocks:
+        known = known_hashes([block.hash for block in blocks])
+        blocks = [block for block in blocks if block.hash not in known]
 
-        result = save_code_block(block)
-        results.append(result)
+    results = save_code_blocks(blocks, engine, pool)
 
-    return jsonify({
+    return {
         'status': 'success',
         'saved_blocks': len(results),
         'results': results
-    })
+    }
+
+def ingest_blocks(data: Dict) -> Dict:
+    return store_new_blocks(parse_code_blocks(data))
+
+ingest_workers: Optional[ingest_queue.IngestWorkers] = None
+_ingest_workers_lock = threading.Lock()
+
+def start_ingest_workers() -> Optional[ingest_queue.IngestWorkers]:
+    global ingest_workers
+    with _ingest_workers_lock:
+        if ingest_workers is None and INGEST_WORKERS > 0:
+            ingest_workers = ingest_queue.IngestWorkers(process_ingest_job, INGEST_WORKERS)
+            ingest_workers.start()
+    return ingest_workers
+
+def stop_ingest_workers() -> None:
+    global ingest_workers
+    with _ingest_workers_lock:
+        workers, ingest_workers = ingest_workers, None
+    if workers is not None:
+        workers.stop(timeout=server.GRACEFUL_TIMEOUT)
+
+def enqueue_blocks(blocks: List[CodeBlock]) -> Optional[str]:
+    with get_db() as conn:
+        job_id = ingest_queue.enqueue(
+            conn, [asdict(block) for block in blocks], INGEST_QUEUE_MAX
+        )
+
+    # Wątki kolejki uruchamia tylko proces, który ją obsługuje (run_dev_server,
+    # proces 0 w `serve`, start ASGI) - pozostałe procesy jedynie zapisują zadanie
+    if job_id and ingest_workers is not None:
+        ingest_workers.notify()
+    return job_id
+
+def process_ingest_job() -> bool:
+    """Wykonuje jedno zadanie z kolejki; False, gdy kolejka jest pusta"""
+    with get_db() as conn:
+        job = ingest_queue.claim_next(conn, INGEST_JOB_TIMEOUT)
+    if job is None:
+        return False
+
+    try:
+        result = store_new_blocks([CodeBlock(**block) for block in job['blocks']])
+    except Exception as e:
+        with get_db() as conn:
+            ingest_queue.finish(conn, job['id'], error=str(e))
+    else:
+        with get_db() as conn:
+            ingest_queue.finish(conn, job['id'], result=result)
+    return True
+
+def process_ingest_jobs() -> int:
+    """Opróżnia kolejkę w bieżącym wątku"""
+    count = 0
+    while process_ingest_job():
+        count += 1
+    return count
+
+def receive_payload(data, key: Optional[str] = None, engine: Optional[ScoringEngine] = None,
+                    pool: Optional[Executor] = None) -> Tuple[int, bytes, Dict[str, str]]:
+    """Status, treść i nagłówki odpowiedzi na POST /code-blocks.
+
+    Powtórzoną paczkę i ponowiony Idempotency-Key obsługuje bez bazy.
+    Wspólne dla Flaska i aplikacji ASGI.
+    """
+    if not PAYLOAD_DEDUPE or not isinstance(data, dict):
+        status, body, headers = ingest_payload(data, engine, pool)
+        return status, app.json.dumps(body).encode('utf-8'), headers
+
+    stats = app.config['PAYLOAD_DEDUPE_STATS']
+    digest = idempotency.payload_digest(data)
+    if key:
+        entry = idempotency_keys.get((DB_PATH, key))
+        if entry is not None:
+            if entry['digest'] != digest:
+                body = {'error': 'Idempotency-Key was used with a different payload'}
+                return 422, app.json.dumps(body).encode('utf-8'), {}
+            stats['key_replays'] += 1
+            metrics_registry.inc('payload_replays_total', kind='idempotency_key')
+            return entry['status'], entry['body'], dict(entry['headers'], **{'Idempotent-Replayed': 'true'})
+
+    # Ta sama strona z tymi samymi blokami - bez parsowania, hashowania i bazy
+    entry = recent_payloads.get((DB_PATH, digest))
+    if entry is None:
+        status, body, headers = ingest_payload(data, engine, pool)
+        body = app.json.dumps(body).encode('utf-8')
+        if status not in (200, 202):
+            return status, body, headers
+        entry = {
+            'digest': digest,
+            'body': body,
+            'status': status,
+            'headers': {name: headers[name] for name in ('Location',) if name in headers}
+        }
+        if status == 200:
+            # Przy powtórce nic nowego nie zostanie zapisane
+            repeat = dict(entry, body=app.json.dumps(
+                {'status': 'success', 'saved_blocks': 0, 'results': []}
+            ).encode('utf-8'))
+        else:
+            # Zapis w tle - powtórka wskazuje to samo zadanie
+            repeat = entry
+        recent_payloads.put((DB_PATH, digest), repeat)
+        if key:
+            idempotency_keys.put((DB_PATH, key), entry)
+        return status, body, headers
+
+    stats['digest_hits'] += 1
+    metrics_registry.inc('payload_replays_total', kind='digest')
+    if key:
+        idempotency_keys.put((DB_PATH, key), entry)
+    return entry['status'], entry['body'], dict(entry['headers'])
+
+@app.route('/code-blocks', methods=['POST'])
+def receive_code_blocks():
+    status, body, headers = receive_payload(request.json, request.headers.get('Idempotency-Key'))
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers.update(headers)
+    return response
+
+def ingest_payload(data, engine: Optional[ScoringEngine] = None,
+                   pool: Optional[Executor] = None) -> Tuple[int, Dict, Dict[str, str]]:
+    try:
+        with metrics_registry.stage('parse'):
+            blocks = parse_code_blocks(data)
+    except ValueError as e:
+        return 400, {'error': str(e)}, {}
+
+    if not ASYNC_INGEST:
+        return 200, store_new_blocks(blocks, engine, pool), {}
+
+    # Znane bloki odrzucamy od razu, bez zadania w kolejce
+    if blocks:
+        known = known_hashes([block.hash for block in blocks])
+        blocks = [block for block in blocks if block.hash not in known]
+        if not blocks:
+            return 200, {'status': 'success', 'saved_blocks': 0, 'results': []}, {}
+
+    job_id = enqueue_blocks(blocks)
+    if job_id is None:
+        return 503, {'error': 'Ingest queue is full'}, {'Retry-After': '5'}
+
+    return 202, {
+        'status': 'accepted',
+        'job_id': job_id,
+        'hashes': [block.hash for block in blocks]
+    }, {'Location': f'/jobs/{job_id}'}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    with get_db() as conn:
+        job = ingest_queue.get_job(conn, job_id)
+
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job)
+
+def stream_events(last_event_id: Optional[int] = None):
+    """Strumień SSE: zaległości z bazy po `last_event_id`, potem zdarzenia z szyny.
+
+    Bez nowych zapisów strumień tylko czeka na szynie, nie odpytując bazy.
+    """
+    subscription = event_bus.subscribe()
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+
+        # Subskrypcja jest już aktywna, więc nic nie ginie między odczytem
+        # zaległości a przejściem na szynę; powtórki odrzuca numer zdarzenia
+        if last_event_id is not None:
+            while True:
+                with get_db() as conn:
+                    backlog = events.events_after(conn, last_event_id, EVENTS_REPLAY_BATCH)
+                for event in backlog:
+                    yield events.format_sse(event)
+                    last_event_id = event['seq']
+                if len(backlog) < EVENTS_REPLAY_BATCH:
+                    break
+
+        while subscription.active:
+            event = subscription.get(EVENTS_KEEPALIVE)
+            if not subscription.active:
+                break
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            if last_event_id is not None and event['seq'] <= last_event_id:
+                continue
+            yield events.format_sse(event)
+            last_event_id = event['seq']
+        # Klient nie nadążał albo serwer się zamyka - klient wznowi od Last-Event-ID
+    finally:
+        subscription.close()
+
+@app.route('/events', methods=['GET'])
+def get_events():
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': f'Invalid Last-Event-ID: {last_event_id}'}), 400
+
+    response = Response(stream_events(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Proxy nie może buforować strumienia
+    return response
+
+def data_changed() -> None:
+    """Nowa wersja danych po zatwierdzonym zapisie poza ścieżką zapisu bloków
+
+    Licznik jest w DB_PATH (bazie katalogu), więc zwiększamy go osobną transakcją -
+    także gdy zapis szedł do shardu.
+    """
+    with get_db(DB_PATH) as conn:
+        version = httpcache.bump(conn)
+    httpcache.get_version(DB_PATH).advance(*version)
+
+def data_version() -> Tuple[str, int]:
+    """(epoka, wersja) danych - z pamięci, z bazy najwyżej co httpcache.REFRESH_INTERVAL"""
+    def reader():
+        with get_db(DB_PATH) as conn:
+            return httpcache.read(conn)
+    return httpcache.get_version(DB_PATH).current(reader)
+
+def data_version_fresh() -> bool:
+    """Czy data_version() nie zapyta bazy - ASGI sprawdza to przed lookup_response() na pętli"""
+    return httpcache.get_version(DB_PATH).fresh()
+
+def lookup_response(route: str, args: tuple, if_none_match: Optional[str],
+                    immutable: bool = False) -> Tuple[Dict, Optional[Tuple[int, bytes, Dict[str, str]]]]:
+    """Odpowiedź bez zapytań do bazy: 304 dla aktualnego ETagu albo gotowa z pamięci.
+
+    Zwraca (kontekst, (status, treść, nagłówki)); gdy odpowiedzi nie ma,
+    trzeba ją zbudować i przekazać do store_response() z tym kontekstem.
+    Odpowiedzi `immutable` (diff niezmiennych bloków) nie zależą od wersji
+    danych i nie trafiają do response_cache - diffy trzyma już diff_cache.
+    """
+    version = None if immutable else data_version()
+    etag = httpcache.make_etag(route, args, version)
+    context = {
+        'key': (route, args) if not immutable else None,
+        'version': version,
+        'headers': {'ETag': etag,
+                    'Cache-Control': httpcache.IMMUTABLE if immutable else httpcache.NO_CACHE}
+    }
+    if httpcache.matches(if_none_match, etag):
+        metrics_registry.inc('http_not_modified_total', route=route)
+        return context, (304, b'', context['headers'])
+    cached = None if immutable else response_cache.get(context['key'], version)
+    if cached is None:
+        return context, None
+    body, headers = cached
+    return context, (200, body, headers)
+
+def store_response(context: Dict, data, headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes, Dict[str, str]]:
+    body = app.json.dumps(data).encode('utf-8')
+    headers = dict(context['headers'], **(headers or {}))
+    if context['key'] is not None:
+        response_cache.put(context['key'], context['version'], body, headers)
+    return 200, body, headers
+
+def build_response(context: Dict, func, *args) -> Optional[Tuple[int, bytes, Dict[str, str]]]:
+    """store_response() dla wyniku func(*args); None, gdy func zwróciła None"""
+    data = func(*args)
+    return None if data is None else store_response(context, data)
+
+def cached_response(status: int, body: bytes, headers: Dict[str, str]) -> Response:
+    return Response(body, status, headers, mimetype='application/json')
+
+LIST_COLUMNS = ('hash', 'language', 'platform', 'url', 'timestamp', 'title', 'file_path', 'created_at')
+NDJSON_BATCH_SIZE = 1000
+MAX_PAGE_SIZE = 1000  # Najwięcej wyników na stronie listy i wyszukiwania
+
+def page_limit(limit: int) -> int:
+    """Rozmiar strony ograniczony do 1..MAX_PAGE_SIZE"""
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def parse_cursor(value: Optional[str]) -> Optional[tuple]:
+    """Kursor `created_at,hash` ostatniego zwróconego bloku"""
+    if not value:
+        return None
+    created_at, sep, block_hash = value.rpartition(',')
+    if not sep or not created_at or not block_hash:
+        raise ValueError(f"Invalid cursor: {value}")
+    return created_at, block_hash
+
+def format_cursor(block: Dict) -> str:
+    return f"{block['created_at']},{block['hash']}"
+
+def list_code_blocks(platform: Optional[str] = None, language: Optional[str] = None,
+                     limit: int = 100, after: Optional[tuple] = None) -> List[Dict]:
+    """Strona bloków od najnowszych; `after` to (created_at, hash) z poprzedniej strony.
+
+    Przy podziale na shardy każdy shard daje swoją stronę od tego samego
+    kursora, a wynik to `limit` pierwszych bloków ze scalenia tych stron.
+    """
+    paths = database_paths(language, platform)
+    if len(paths) == 1:
+        return _list_code_blocks(paths[0], platform, language, limit, after)
+    return list(shards.merge(
+        [_list_code_blocks(path, platform, language, limit, after) for path in paths], limit
+    ))
+
+def _list_code_blocks(path: str, platform: Optional[str], language: Optional[str],
+                      limit: int, after: Optional[tuple]) -> List[Dict]:
+    query = f"SELECT {', '.join(LIST_COLUMNS)} FROM code_blocks"
+    conditions = []
+    params = []
+
+    if platform:
+        conditions.append("platform = ?")
+        params.append(platform)
+    if language:
+        conditions.append("language = ?")
+        params.append(language)
+    if after:
+        conditions.append("(created_at, hash) < (?, ?)")
+        params.extend(after)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY created_at DESC, hash DESC LIMIT ?"
+    params.append(limit)
+
+    with get_db(path) as conn:
+        cursor = conn.execute(query, params)
+        return [dict(zip(LIST_COLUMNS, row)) for row in cursor.fetchall()]
+
+def iter_code_block_pages(platform: Optional[str] = None, language: Optional[str] = None,
+                          after: Optional[tuple] = None, limit: Optional[int] = None):
+    """Przechodzi bloki stronami po kursorze - pamięć nie zależy od rozmiaru korpusu"""
+    paths = database_paths(language, platform)
+    if len(paths) == 1:
+        yield from _iter_code_block_pages(paths[0], platform, language, after, limit)
+        return
+
+    # k-way merge kursorów shardów - każdy czyta swoje strony dopiero, gdy są potrzebne
+    merged = shards.merge([
+        (block for page in _iter_code_block_pages(path, platform, language, after, limit) for block in page)
+        for path in paths
+    ], limit)
+    page = []
+    for block in merged:
+        page.append(block)
+        if len(page) == NDJSON_BATCH_SIZE:
+            yield page
+            page = []
+    if page:
+        yield page
+
+def _iter_code_block_pages(path: str, platform: Optional[str], language: Optional[str],
+                           after: Optional[tuple], limit: Optional[int]):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        batch = NDJSON_BATCH_SIZE if remaining is None else min(remaining, NDJSON_BATCH_SIZE)
+        blocks = _list_code_blocks(path, platform, language, batch, after)
+        if blocks:
+            yield blocks
+        if len(blocks) < batch:
+            return
+        after = (blocks[-1]['created_at'], blocks[-1]['hash'])
+        if remaining is not None:
+            remaining -= len(blocks)
+
+def iter_code_blocks(platform: Optional[str] = None, language: Optional[str] = None,
+                     after: Optional[tuple] = None, limit: Optional[int] = None):
+    for blocks in iter_code_block_pages(platform, language, after, limit):
+        yield from blocks
 
 @app.route('/code-blocks', methods=['GET'])
 def get_code_blocks():
     platform = request.args.get('platform')
     language = request.args.get('language')
-    limit = int(request.args.get('limit', 100))
+    try:
+        after = parse_cursor(request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    query = "SELECT * FROM code_blocks"
-    params = []
+    if request.args.get('format') == 'ndjson':
+        limit = request.args.get('limit', type=int)
+        lines = (json.dumps(block) + '\n' for block in iter_code_blocks(platform, language, after, limit))
+        return Response(lines, mimetype='application/x-ndjson')
 
-    if platform or language:
-        query += " WHERE"
-        if platform:
-            query += " platform = ?"
-            params.append(platform)
-        if language:
-            if platform:
-                query += " AND"
-            query += " language = ?"
-            params.append(language)
-
-    query += " ORDER BY created_at DESC LIMIT ?"
-    params.append(limit)
+    limit = page_limit(request.args.get('limit', 100, type=int))
+    context, cached = lookup_response('code_blocks', (platform, language, limit, after),
+                                      request.headers.get('If-None-Match'))
+    if cached is None:
+        cached = code_blocks_response(context, platform, language, limit, after)
+    return cached_response(*cached)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute(query, params)
-        blocks = [{
-            'hash': row[0],
-            'language': row[2],
-            'platform': row[3],
-            'url': row[4],
-            'timestamp': row[5],
-            'title': row[6],
-            'file_path': row[7],
-            'created_at': row[8]
-        } for row in cursor.fetchall()]
-
-    return jsonify(blocks)
+def code_blocks_response(context: Dict, platform: Optional[str], language: Optional[str],
+                         limit: int, after: Optional[tuple]) -> Tuple[int, bytes, Dict[str, str]]:
+    blocks = list_code_blocks(platform, language, limit, after)
+    headers = {}
+    if blocks and len(blocks) == limit:
+        headers['X-Next-Cursor'] = format_cursor(blocks[-1])
+    return store_response(context, blocks, headers)
 
-@app.route('/code-blocks/<hash>/similar', methods=['GET'])
-def get_similar_blocks(hash):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute("""
-            SELECT cb.*, sb.similarity_score
+@app.route('/code-blocks/search', methods=['GET'])
+def search_code_blocks():
+    if not FULL_TEXT_SEARCH:
+        return jsonify({'error': 'Full-text search is disabled'}), 404
+
+    query = request.args.get('q', '')
+    if len(query) < search.MIN_QUERY_LENGTH:
+        return jsonify({'error': f'Query must be at least {search.MIN_QUERY_LENGTH} characters'}), 400
+
+    try:
+        after = search.parse_cursor(request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    platform = request.args.get('platform')
+    language = request.args.get('language')
+    limit = page_limit(request.args.get('limit', 20, type=int))
+    try:
+        if SHARDS:
+            results, next_cursor = search_shards(query, platform, language, limit, after)
+        else:
+            with get_db() as conn:
+                conn.execute("BEGIN")  # Wersja danych i wyniki z tego samego odczytu
+                results, next_cursor = search.search(
+                    conn, query, platform=platform, language=language, limit=limit, after=after,
+                    version=search.snapshot(*httpcache.read(conn))
+                )
+    except search.StaleCursor:
+        return jsonify({'error': 'Data changed since the cursor was issued, start from the first page'}), 409
+
+    response = jsonify(results)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def search_shards(query: str, platform: Optional[str], language: Optional[str], limit: int,
+                  after: Optional[tuple]) -> Tuple[List[Dict], Optional[str]]:
+    """Wyszukiwanie we wszystkich shardach (w jednym, gdy podano język i platformę).
+
+    Każdy shard daje swoją stronę od tego samego kursora, wynik to `limit`
+    pierwszych ze scalenia według (rank, rowid). bm25 liczy każdy shard ze
+    swojego indeksu. Wersję danych czytamy z katalogu przed shardami, więc
+    zapis w trakcie odczytu najwyżej unieważni kursor następnej strony.
+    """
+    with get_db(DB_PATH) as conn:
+        version = search.snapshot(*httpcache.read(conn))
+    search.check_cursor(after, version)
+
+    if language and platform:
+        indexes = [shards.shard_index(language, platform, SHARDS)]
+    else:
+        indexes = range(SHARDS)
+    pages = []
+    for index in indexes:
+        with get_db(shards.shard_path(DB_PATH, index)) as conn:
+            pages.append(search.matches(conn, query, platform, language, limit, after, index, SHARDS))
+    return search.page(pages, limit, version)
+
+def block_paths(hashes: List[str]) -> Dict[str, List[str]]:
+    """Hashe pogrupowane według pliku, w którym leżą; nieznane przy shardach albo archiwum pomija.
+
+    Bloki nieznalezione w bazie roboczej szukamy w archiwum - gdy blok jest
+    w obu (zapisany ponownie po archiwizacji), wygrywa baza robocza.
+    """
+    archived = archive_path()
+    paths: Dict[str, List[str]] = {}
+    if SHARDS:
+        with get_db(DB_PATH) as conn:
+            located = shards.locate(conn, hashes)
+        for block_hash, index in located.items():
+            paths.setdefault(shards.shard_path(DB_PATH, index), []).append(block_hash)
+    elif archived is None:
+        return {DB_PATH: hashes}
+    else:
+        with get_db(DB_PATH) as conn:
+            located = existing_hashes(conn, hashes)
+        if located:
+            paths[DB_PATH] = [block_hash for block_hash in hashes if block_hash in located]
+
+    missing = [block_hash for block_hash in hashes if block_hash not in located]
+    if archived is not None and missing:
+        with get_db(archived) as conn:
+            cold = existing_hashes(conn, missing)
+        if cold:
+            paths[archived] = [block_hash for block_hash in missing if block_hash in cold]
+    return paths
+
+def block_metadata(hashes: List[str]) -> Dict[str, tuple]:
+    """(język, platforma, url, timestamp, tytuł, ścieżka) bloków z dowolnego pliku"""
+    found = {}
+    for path, group in block_paths(hashes).items():
+        with get_db(path) as conn:
+            for i in range(0, len(group), 500):
+                chunk = group[i:i + 500]
+                found.update((row[0], row[1:]) for row in conn.execute(f"""
+                    SELECT hash, language, platform, url, timestamp, title, file_path
+                    FROM code_blocks WHERE hash IN ({', '.join('?' * len(chunk))})
+                """, chunk))
+    return found
+
+def load_blocks_code(hashes: List[str]) -> Dict[str, str]:
+    """Jak load_code(), ale z każdego pliku, w którym leżą bloki"""
+    codes = {}
+    for path, group in block_paths(hashes).items():
+        with get_db(path) as conn:
+            codes.update(load_code(conn, group))
+    return codes
+
+def similar_blocks_of(block_hash: str) -> List[Dict]:
+    paths = list(block_paths([block_hash]))
+    if not paths:
+        return []
+    with get_db(paths[0]) as conn:
+        rows = conn.execute("""
+            SELECT sb.similar_hash, cb.language, cb.platform, cb.url, cb.timestamp,
+                   cb.title, cb.file_path, sb.similarity_score
             FROM similar_blocks sb
-            JOIN code_blocks cb ON sb.similar_hash = cb.hash
+            LEFT JOIN code_blocks cb ON sb.similar_hash = cb.hash
             WHERE sb.block_hash = ?
             ORDER BY sb.similarity_score DESC
-        """, (hash,))
+        """, (block_hash,)).fetchall()
+
+    # Podobny blok w drugiej warstwie - w archiwum albo, dla bloku z archiwum, w bazie roboczej
+    missing = [row[0] for row in rows if row[1] is None]
+    if missing:
+        elsewhere = block_metadata(missing)
+        rows = [row if row[1] is not None else (row[0], *elsewhere[row[0]], row[7])
+                for row in rows if row[1] is not None or row[0] in elsewhere]
+
+    return [{
+        'hash': row[0],
+        'language': row[1],
+        'platform': row[2],
+        'url': row[3],
+        'timestamp': row[4],
+        'title': row[5],
+        'file_path': row[6],
+        'similarity': row[7]
+    } for row in rows]
 
-        similar = [{
-            'hash': row[0],
-            'language': row[2],
-            'platform': row[3],
-            'url': row[4],
-            'timestamp': row[5],
-            'title': row[6],
-            'file_path': row[7],
-            'similarity': row[9]
-        } for row in cursor.fetchall()]
+@app.route('/code-blocks/<hash>/similar', methods=['GET'])
+def get_similar_blocks(hash):
+    context, cached = lookup_response('similar', (hash,), request.headers.get('If-None-Match'))
+    if cached is None:
+        cached = store_response(context, similar_blocks_of(hash))
+    return cached_response(*cached)
+
+def parse_similar_query(data) -> Dict:
+    """Argumenty query_similar() z treści żądania; ValueError z opisem błędu"""
+    if not isinstance(data, dict):
+        raise ValueError('Invalid JSON')
+    code = data.get('code')
+    if not isinstance(code, str) or not code.strip():
+        raise ValueError('Missing code')
+    for field in ('language', 'platform'):
+        if data.get(field) is not None and not isinstance(data[field], str):
+            raise ValueError(f'Invalid {field}')
+    k = data.get('k', SIMILAR_QUERY_K)
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= SIMILAR_QUERY_MAX_K:
+        raise ValueError(f'k must be an integer between 1 and {SIMILAR_QUERY_MAX_K}')
+    min_score = data.get('min_score', SIMILAR_QUERY_MIN_SCORE)
+    if isinstance(min_score, bool) or not isinstance(min_score, (int, float)) or not 0 <= min_score <= 1:
+        raise ValueError('min_score must be a number between 0 and 1')
+    include_archive = data.get('include_archive', False)
+    if not isinstance(include_archive, bool):
+        raise ValueError('include_archive must be a boolean')
+    return {'code': code.strip(), 'language': data.get('language'), 'platform': data.get('platform'),
+            'k': k, 'min_score': float(min_score), 'include_archive': include_archive}
+
+def query_similar(code: str, language: Optional[str] = None, platform: Optional[str] = None,
+                  k: int = SIMILAR_QUERY_K, min_score: float = SIMILAR_QUERY_MIN_SCORE,
+                  include_archive: bool = False) -> List[Dict]:
+    """Najbardziej podobne zapisane bloki do fragmentu kodu, bez zapisu czegokolwiek.
+
+    Kandydatów daje indeks LSH (w każdej pasującej parze język/platforma),
+    a dokładny wynik liczymy najwyżej dla SIMILAR_QUERY_CANDIDATES z nich -
+    tych z największą liczbą wspólnych pasm. Archiwum przeszukujemy tylko
+    z `include_archive`.
+    """
+    with metrics_registry.stage('similar_query'):
+        signature = lsh.minhash_signature(code)
+        paths = database_paths(language, platform)
+        if include_archive and archive_path() is not None:
+            paths.append(archive_path())
+        candidates = []
+        for path in paths:
+            with get_db(path) as conn:
+                for group_language, group_platform in lsh.groups(conn, language, platform):
+                    candidates.extend(
+                        (count, block_hash, path, group_language) for block_hash, count in
+                        lsh.query_candidate_counts(conn, group_language, group_platform, signature,
+                                                   SIMILAR_QUERY_CANDIDATES)
+                    )
+        # Blok zapisany ponownie po archiwizacji jest w obu plikach - zostaje kandydat z bazy roboczej
+        unique = {}
+        for item in sorted(candidates, key=lambda item: (-item[0], item[1])):
+            unique.setdefault(item[1], item)
+        candidates = list(unique.values())[:SIMILAR_QUERY_CANDIDATES]
+        metrics_registry.inc('lsh_candidates_total', len(candidates))
+
+        # Wynik w obrębie języka - odcisk tokenów zależy od języka
+        engine = ScoringEngine(min_score, junk_limit=scoring_engine.junk_limit)
+        engine.stats = scoring_engine.stats
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        for _, block_hash, path, group_language in candidates:
+            groups.setdefault((path, group_language), []).append(block_hash)
+        scores = []
+        for (path, group_language), hashes in groups.items():
+            with get_db(path) as conn:
+                scores.extend((block_hash, similarity, path) for block_hash, similarity in
+                              _score_query(conn, engine, code, group_language, hashes))
+
+        top = sorted(scores, key=lambda item: (-item[1], item[0]))[:k]
+        rows = {}
+        for path in {path for _, _, path in top}:
+            hashes = [block_hash for block_hash, _, block_path in top if block_path == path]
+            with get_db(path) as conn:
+                rows.update((row[0], row) for row in conn.execute(f"""
+                    SELECT hash, language, platform, url, timestamp, title, file_path
+                    FROM code_blocks WHERE hash IN ({', '.join('?' * len(hashes))})
+                """, hashes))
+
+    return [{
+        'hash': block_hash,
+        'language': rows[block_hash][1],
+        'platform': rows[block_hash][2],
+        'url': rows[block_hash][3],
+        'timestamp': rows[block_hash][4],
+        'title': rows[block_hash][5],
+        'file_path': rows[block_hash][6],
+        'similarity': similarity
+    } for block_hash, similarity, _ in top if block_hash in rows]
+
+def _score_query(conn, engine: ScoringEngine, code: str, language: str,
+                 hashes: List[str]) -> List[Tuple[str, float]]:
+    if TOKEN_SIMILARITY:
+        sequence = fingerprint.from_bytes(fingerprint.fingerprint(code, language, CANONICAL_IDENTIFIERS))
+        lengths = fingerprint.lengths(conn, fingerprint.scheme(CANONICAL_IDENTIFIERS), hashes)
+        return engine.score(
+            sequence,
+            [(block_hash, lengths.get(block_hash, len(sequence))) for block_hash in hashes],
+            lambda keys: load_fingerprints(conn, keys, language)
+        )
+    lengths = dict(conn.execute(f"""
+        SELECT hash, COALESCE(code_length, length(code)) FROM code_blocks
+        WHERE hash IN ({', '.join('?' * len(hashes))})
+    """, hashes).fetchall())
+    return engine.score(code, list(lengths.items()), lambda keys: load_code(conn, keys))
+
+@app.route('/code-blocks/similar-query', methods=['POST'])
+def similar_query():
+    try:
+        query = parse_similar_query(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(query_similar(**query))
+
+def parse_cluster_cursor(value: Optional[str]) -> Optional[tuple]:
+    """Kursor `size,id` ostatniego zwróconego klastra"""
+    if not value:
+        return None
+    size, sep, cluster_id = value.partition(',')
+    try:
+        if not sep:
+            raise ValueError
+        return int(size), int(cluster_id)
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
+
+def list_clusters(limit: int, after: Optional[tuple], **kwargs) -> List[Dict]:
+    """Strona klastrów; przy shardach scalona ze stron wszystkich shardów według (rozmiar, id)"""
+    pages = []
+    for index, path in enumerate(database_paths()):
+        with get_db(path) as conn:
+            pages.append(clusters.list_clusters(conn, limit=limit, after=after, shard=index,
+                                                count=SHARDS or 1, **kwargs))
+    if len(pages) == 1:
+        return pages[0]
+    return list(shards.merge(pages, limit, key=lambda cluster: (cluster['size'], cluster['id'])))
+
+@app.route('/clusters', methods=['GET'])
+def get_clusters():
+    try:
+        after = parse_cluster_cursor(request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = request.args.get('limit', 50, type=int)
+
+    page = list_clusters(
+        min_size=request.args.get('min_size', 2, type=int),
+        limit=limit,
+        members=request.args.get('members', 5, type=int),
+        after=after
+    )
+
+    response = jsonify(page)
+    if page and len(page) == limit:
+        response.headers['X-Next-Cursor'] = f"{page[-1]['size']},{page[-1]['id']}"
+    return response
+
+@app.route('/clusters/<int:cluster_id>', methods=['GET'])
+def get_cluster(cluster_id):
+    # Przy shardach identyfikator koduje też numer shardu (clusters.global_id)
+    local_id, index = divmod(cluster_id, SHARDS or 1)
+    with get_db(database_paths()[index]) as conn:
+        cluster = clusters.get_cluster(conn, local_id, request.args.get('limit', 100, type=int))
+
+    if not cluster:
+        return jsonify({'error': 'Cluster not found'}), 404
+
+    cluster['id'] = cluster_id
+    return jsonify(cluster)
+
+def blocks_diff(block_hash: str, other_hash: str, context: int = DIFF_CONTEXT,
+                max_bytes: int = DIFF_MAX_BYTES) -> Optional[Dict]:
+    """Diff dwóch bloków; None, jeśli któregoś nie ma"""
+    context = max(0, min(context, DIFF_MAX_CONTEXT))
+    max_bytes = max(1, min(max_bytes, DIFF_MAX_BYTES_LIMIT))
 
-    return jsonify(similar)
+    # Bloki są niezmienne - wynik dla pary hashy można trzymać bez unieważniania
+    key = (block_hash, other_hash, context, max_bytes)
+    cached = diff_cache.get(key)
+    if cached is None:
+        codes = load_blocks_code([block_hash, other_hash])
+
+        if block_hash not in codes or other_hash not in codes:
+            return None
+
+        with metrics_registry.stage('diff'):
+            cached = diffing.unified_diff(
+                codes[block_hash], codes[other_hash],
+                fromfile=f'block_{block_hash[:8]}',
+                tofile=f'block_{other_hash[:8]}',
+                context=context,
+                max_bytes=max_bytes
+            )
+        diff_cache.put(key, cached)
+
+    diff, truncated = cached
+    return {
+        'diff': diff,
+        'truncated': truncated
+    }
 
 @app.route('/code-blocks/<hash>/diff/<other_hash>', methods=['GET'])
 def get_blocks_diff(hash, other_hash):
-    with sqlite3.connect(DB_PATH) as conn:
-        block1 = conn.execute(
-            "SELECT code FROM code_blocks WHERE hash = ?",
-            (hash,)
-        ).fetchone()
-
-        block2 = conn.execute(
-            "SELECT code FROM code_blocks WHERE hash = ?",
-            (other_hash,)
-        ).fetchone()
-
-        if not block1 or not block2:
+    args = (hash, other_hash, request.args.get('context', DIFF_CONTEXT, type=int),
+            request.args.get('max_bytes', DIFF_MAX_BYTES, type=int))
+    context, cached = lookup_response('diff', args, request.headers.get('If-None-Match'), immutable=True)
+    if cached is None:
+        result = blocks_diff(*args)
+        if result is None:
             return jsonify({'error': 'One or both blocks not found'}), 404
+        cached = store_response(context, result)
+    return cached_response(*cached)
 
-        diff = list(difflib.unified_diff(
-            block1[0].splitlines(keepends=True),
-            block2[0].splitlines(keepends=True),
-            fromfile=f'block_{hash[:8]}',
-            tofile=f'block_{other_hash[:8]}'
-        ))
+def collect_counters():
+    """Liczniki prowadzone przez moduły - odczytywane dopiero przy /metrics"""
+    for name, value in scoring_engine.stats.items():
+        yield f'scoring_{name}_total', {}, value
+    cache = dedupe.get_cache(DB_PATH) if DEDUPE_CACHE else None
+    if cache is not None:
+        for name, value in cache.stats.items():
+            yield f'dedupe_{name}_total', {}, value
+    yield 'diff_cache_hits_total', {}, diff_cache.hits
+    yield 'diff_cache_misses_total', {}, diff_cache.misses
+    yield 'response_cache_hits_total', {}, response_cache.hits
+    yield 'response_cache_misses_total', {}, response_cache.misses
+
+metrics_registry.add_collector(collect_counters)
+metrics_registry.describe('http_request_duration_seconds', 'histogram', 'Request latency by route')
+metrics_registry.describe('stage_duration_seconds', 'histogram',
+                          'Latency of ingest, diff and database stages')
+metrics_registry.describe('bytes_written_total', 'counter', 'Stored code bytes (after compression)')
+metrics_registry.describe('blocks_saved_total', 'counter', 'New code blocks saved')
+metrics_registry.describe('lsh_candidates_total', 'counter', 'Candidates returned by the LSH index')
+metrics_registry.describe('lsh_candidates_truncated_total', 'counter',
+                          'Saved blocks whose LSH candidates hit LSH_MAX_CANDIDATES')
+metrics_registry.describe('payload_replays_total', 'counter',
+                          'Repeated payloads answered from memory')
+metrics_registry.describe('http_not_modified_total', 'counter',
+                          'Conditional GETs answered with 304 by route')
+
+@app.before_request
+def start_request_timer():
+    if metrics_registry.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics_registry.observe(
+            'http_request_duration_seconds', time.perf_counter() - started,
+            route=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=str(response.status_code)
+        )
+    return response
 
-    return jsonify({
-        'diff': ''.join(diff)
-    })
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics_registry.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
 
-def watch_for_changes():
-    """Funkcja monitorująca zmiany w plikach"""
-    last_check = time.time()
+    others = metrics.read_snapshots(METRICS_DIR, exclude_pid=os.getpid()) if METRICS_DIR else []
+    return Response(metrics_registry.render(others), mimetype=metrics.CONTENT_TYPE)
 
+@app.before_request
+def start_profiling():
+    if not PROFILING or request.path.startswith('/debug/'):
+        return
+    requested = request.headers.get('X-Profile') or request.args.get('profile')
+    if requested and request.remote_addr in LOCAL_ADDRESSES:
+        kind = profiling.SAMPLING if requested == profiling.SAMPLING else profiling.CPROFILE
+    elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        kind = profiling.SAMPLING
+    else:
+        return
+    try:
+        g.profile = profiling.Profile(kind)
+    except profiling.ProfilerBusy:
+        # Drugiego profilu cProfile nie uruchomimy - żądanie idzie bez profilu
+        g.profile_skipped = True
+
+@app.after_request
+def finish_profiling(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        info = {
+            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'request_bytes': request.content_length or 0
+        }
+        # Strumienie (NDJSON, SSE) generują treść dopiero po after_request -
+        # profil kończymy, gdy serwer zamknie odpowiedź
+        response.call_on_close(lambda: profile.finish(PROFILE_DIR, **info))
+        response.headers['X-Profile-Id'] = profile.id
+    elif g.pop('profile_skipped', False):
+        response.headers['X-Profile-Skipped'] = 'busy'
+    return response
+
+@app.teardown_request
+def cancel_profiling(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.cancel()
+
+def profiling_allowed() -> bool:
+    return PROFILING and request.remote_addr in LOCAL_ADDRESSES
+
+@app.route('/debug/profiles', methods=['GET'])
+def get_profiles():
+    if not profiling_allowed():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(profiling.list_profiles(PROFILE_DIR, request.args.get('limit', 50, type=int)))
+
+@app.route('/debug/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    path = profiling.find_profile(PROFILE_DIR, profile_id) if profiling_allowed() else None
+    if path is None:
+        return jsonify({'error': 'Not found'}), 404
+    return send_file(path.resolve(), as_attachment=True, download_name=path.name)
+
+def migrate_to_pack(keep_files: bool = False, batch_size: int = 500) -> int:
+    """Przenosi kod zapisany w kolumnie code i plikach do segmentów"""
+    store = get_blob_store()
+    migrated = 0
     while True:
-        time.sleep(1)  # Sprawdzaj co sekundę
-        current_time = time.time()
+        with get_db() as conn:
+            rows = conn.execute("""
+                SELECT hash, code, file_path FROM code_blocks
+                WHERE blob_segment IS NULL
+                LIMIT ?
+            """, (batch_size,)).fetchall()
+            if not rows:
+                break
 
-        with sqlite3.connect(DB_PATH) as conn:
-            # Pobierz bloki dodane od ostatniego sprawdzenia
-            cursor = conn.execute("""
-                SELECT * FROM code_blocks
-                WHERE created_at > datetime(?, 'unixepoch')
-                ORDER BY created_at DESC
-            """, (last_check,))
+            updates = []
+            for block_hash, code, _ in rows:
+                # Skompresowane bloki trafiają do segmentu bez zmian, razem z kodekiem
+                data = code if isinstance(code, bytes) else code.encode('utf-8')
+                segment, offset, length = store.put(block_hash, data)
+                updates.append((segment, offset, length, str(store.segment_path(segment)), block_hash))
+            conn.executemany("""
+                UPDATE code_blocks
+                SET code = '', blob_segment = ?, blob_offset = ?, blob_length = ?, file_path = ?
+                WHERE hash = ?
+            """, updates)
+        data_changed()  # file_path widać na liście bloków
 
-            new_blocks = cursor.fetchall()
+        # Pliki usuwamy dopiero po zatwierdzeniu transakcji
+        if not keep_files:
+            for _, _, file_path in rows:
+                path = Path(file_path)
+                if path.is_file() and path.suffix != '.pack':
+                    path.unlink()
+        migrated += len(rows)
 
-            if new_blocks:
-                print(f"Znaleziono {len(new_blocks)} nowych bloków kodu!")
-                # Tutaj możesz dodać kod do powiadamiania przez WebSocket
-                # lub inny mechanizm powiadamiania w czasie rzeczywistym
+    return migrated
 
-        last_check = current_time
+def export_files(target: Path, batch_size: int = 500) -> int:
+    """Zapisuje wszystkie bloki w układzie plik-na-blok: <platforma>/<język>/<plik>"""
+    exported = 0
+    last_rowid = 0
+    while True:
+        with get_db() as conn:
+            rows = conn.execute("""
+                SELECT rowid, hash, language, platform, url, timestamp, title
+                FROM code_blocks
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            """, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            codes = load_code(conn, [row[1] for row in rows])
 
-if __name__ == '__main__':
+        for row in rows:
+            block = CodeBlock(
+                code=codes[row[1]], language=row[2], platform=row[3], url=row[4],
+                timestamp=row[5], title=row[6], hash=row[1]
+            )
+            file_path = block_file_path(block, target)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(block.code)
+        exported += len(rows)
+        last_rowid = rows[-1][0]
+
+    return exported
+
+def train_compression_dictionary(sample_size: int = 2000,
+                                 size: int = compression.DICTIONARY_SIZE) -> tuple:
+    """Trenuje słownik na losowej próbce bloków; zwraca (id, rozmiar)"""
+    with get_db() as conn:
+        hashes = [row[0] for row in conn.execute(
+            "SELECT hash FROM code_blocks ORDER BY RANDOM() LIMIT ?", (sample_size,)
+        )]
+        dictionary = compression.train_dictionary(load_code(conn, hashes).values(), size)
+        dict_id = compression.store_dictionary(conn, dictionary, len(hashes))
+    return dict_id, len(dictionary)
+
+def recompress_blocks(batch_size: int = 500) -> int:
+    """Zapisuje ponownie bloki, które nie używają najnowszego słownika"""
+    recompressed = 0
+    last_rowid = 0
+    while True:
+        with get_db() as conn:
+            dict_id = compression.latest_dictionary_id(conn)
+            rows = conn.execute("""
+                SELECT rowid, hash, file_path, blob_segment FROM code_blocks
+                WHERE rowid > ? AND (dict_id IS NULL OR dict_id != ?)
+                ORDER BY rowid
+                LIMIT ?
+            """, (last_rowid, dict_id, batch_size)).fetchall()
+            if not rows:
+                break
+            codes = load_code(conn, [row[1] for row in rows])
+
+            updates = []
+            removed = []
+            for _, block_hash, file_path, blob_segment in rows:
+                data, codec, new_dict_id = encode_code(conn, codes[block_hash])
+                if blob_segment is not None:
+                    segment, offset, length = get_blob_store().put(block_hash, data)
+                    updates.append(('', segment, offset, length, codec, new_dict_id,
+                                    str(get_blob_store().segment_path(segment)), block_hash))
+                    continue
+
+                base_path = file_path[:-len(COMPRESSED_FILE_SUFFIX)] \
+                    if file_path.endswith(COMPRESSED_FILE_SUFFIX) else file_path
+                new_path = base_path + COMPRESSED_FILE_SUFFIX if codec else base_path
+                Path(new_path).parent.mkdir(parents=True, exist_ok=True)
+                with open(new_path, 'wb') as f:
+                    f.write(data)
+                if new_path != file_path:
+                    removed.append(Path(file_path))
+                updates.append((data if codec else codes[block_hash], None, None, None,
+                                codec, new_dict_id, new_path, block_hash))
+
+            conn.executemany("""
+                UPDATE code_blocks
+                SET code = ?, blob_segment = ?, blob_offset = ?, blob_length = ?,
+                    codec = ?, dict_id = ?, file_path = ?
+                WHERE hash = ?
+            """, updates)
+        data_changed()
+
+        for path in removed:
+            if path.is_file():
+                path.unlink()
+        recompressed += len(rows)
+        last_rowid = rows[-1][0]
+
+    return recompressed
+
+def backfill_search_index(rebuild: bool = False, batch_size: int = 500) -> int:
+    """Dodaje do indeksu FTS bloki, których w nim brakuje"""
+    with get_db() as conn:
+        if rebuild:
+            conn.execute("DELETE FROM code_search")
+
+    indexed = 0
+    last_rowid = 0
+    while True:
+        with get_db() as conn:
+            rows = conn.execute("""
+                SELECT rowid, hash FROM code_blocks
+                WHERE rowid > ? AND rowid NOT IN (SELECT rowid FROM code_search)
+                ORDER BY rowid
+                LIMIT ?
+            """, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            codes = load_code(conn, [row[1] for row in rows])
+            search.index_blocks(conn, [(rowid, codes[block_hash]) for rowid, block_hash in rows])
+        indexed += len(rows)
+        last_rowid = rows[-1][0]
+
+    return indexed
+
+# Tabele z wierszami jednego shardu: (tabela, warunek na wierszach bazy źródłowej)
+SPLIT_TABLES = (
+    ('code_blocks', "shard_index(language, platform) = :index ORDER BY rowid"),
+    ('similar_blocks', "block_hash IN (SELECT hash FROM main.code_blocks)"),
+    ('block_signatures', "hash IN (SELECT hash FROM main.code_blocks)"),
+    ('block_tokens', "hash IN (SELECT hash FROM main.code_blocks)"),
+    ('lsh_buckets', "shard_index(language, platform) = :index"),
+    ('lsh_groups', "shard_index(language, platform) = :index"),
+    ('compression_dicts', "1"),  # Wszystkie - bloki wskazują słownik po id
+)
+
+def split_into_shards(count: int) -> List[int]:
+    """Dzieli bazę z jednym plikiem na `count` shardów; zwraca liczbę bloków w każdym.
+
+    Shardy powstają obok DB_PATH, a sam DB_PATH zostaje bazą katalogu:
+    dostaje mapę bloków, traci przeniesione wiersze i jest kompaktowany.
+    Przerwany podział można powtórzyć - niedokończone shardy są tworzone od nowa.
+    """
+    with get_db(DB_PATH) as conn:
+        if shards.count(conn):
+            raise RuntimeError("Database is already split into shards")
+    db.close_all()
+
+    def shard_of(language, platform):
+        return shards.shard_index(language, platform, count)
+
+    sizes = []
+    for index in range(count):
+        path = shards.shard_path(DB_PATH, index)
+        for leftover in (path, path + '-wal', path + '-shm'):
+            Path(leftover).unlink(missing_ok=True)
+        conn = sqlite3.connect(path)
+        try:
+            conn.create_function('shard_index', 2, shard_of, deterministic=True)
+            with conn:
+                init_block_schema(conn)
+            conn.execute("ATTACH DATABASE ? AS source", (DB_PATH,))
+            with conn:
+                for table, condition in SPLIT_TABLES:
+                    columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA source.table_info({table})"))
+                    conn.execute(f"""
+                        INSERT OR IGNORE INTO main.{table} ({columns})
+                        SELECT {columns} FROM source.{table} WHERE {condition}
+                    """, {'index': index})
+                clusters.rebuild(conn)
+            sizes.append(conn.execute("SELECT COUNT(*) FROM code_blocks").fetchone()[0])
+        finally:
+            conn.close()
+        if FULL_TEXT_SEARCH:
+            # Wyzwalacz zaindeksował tylko kod trzymany jako tekst
+            with using_database(path):
+                backfill_search_index()
+        print(f"Shard {index}: {sizes[-1]} bloków")
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.create_function('shard_index', 2, shard_of, deterministic=True)
+        with conn:
+            conn.execute("""
+                INSERT OR IGNORE INTO block_shards (hash, shard, created_at)
+                SELECT hash, shard_index(language, platform), created_at FROM code_blocks
+            """)
+            shards.register(conn, DB_PATH, count)
+            search.drop_schema(conn)  # Bez wyzwalacza usuwającego wiersz po wierszu
+            for table in ('similar_blocks', 'block_signatures', 'block_tokens', 'lsh_buckets',
+                          'lsh_groups', 'clusters', 'code_blocks'):
+                conn.execute(f"DELETE FROM {table}")
+            httpcache.bump(conn)
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    # Przeniesione zostały wszystkie bloki - pamięć zbudujemy od nowa z mapy katalogu
+    dedupe.drop_cache(DB_PATH)
+    return sizes
+
+# Kolumny bloku przenoszone do archiwum bez zmian; kod, kodek i słownik ustawia archiwizacja
+ARCHIVE_COLUMNS = ('hash', 'language', 'platform', 'url', 'timestamp', 'title', 'created_at',
+                   'code_length', 'cluster_id', 'centrality')
+
+def archive_blocks(before: Optional[str] = None, max_bytes: Optional[int] = None,
+                   batch_size: int = 500) -> int:
+    """Przenosi do archiwum bloki zapisane przed `before` i najstarsze ponad `max_bytes` kodu.
+
+    Budżet dotyczy każdego pliku bazy roboczej osobno (przy shardach - shardu).
+    Paczka trafia do archiwum w osobnej transakcji, zanim zniknie z bazy
+    roboczej, więc przerwane przenoszenie można powtórzyć. Zwraca liczbę
+    przeniesionych bloków.
+    """
+    path = archive.archive_path(DB_PATH)
+    with get_db(path) as conn:
+        init_block_schema(conn)
+        search.drop_schema(conn)  # Archiwum nie jest przeszukiwane pełnotekstowo
+
+    cold = {}
+    for hot_path in database_paths():
+        with get_db(hot_path) as conn:
+            cold[hot_path] = archive.cold_hashes(conn, before, max_bytes)
+    with get_db(path) as conn:
+        if compression.latest_dictionary_id(conn) is None and any(cold.values()):
+            _train_archive_dictionary(conn, cold)
+
+    moved = 0
+    for hot_path, hashes in cold.items():
+        for i in range(0, len(hashes), batch_size):
+            moved += _archive_batch(hot_path, path, hashes[i:i + batch_size])
+        if hashes:
+            with get_db(hot_path) as conn:
+                clusters.rebuild(conn)
+
+    if moved:
+        db.close_all()
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    return moved
+
+def _train_archive_dictionary(conn, cold: Dict[str, List[str]]) -> None:
+    """Trenuje słownik archiwum na próbce ze wszystkich przenoszonych bloków, a nie tylko z pierwszej paczki"""
+    sample = archive.dictionary_sample([(hot_path, block_hash) for hot_path, hashes in cold.items()
+                                        for block_hash in hashes], archive.DICTIONARY_SAMPLES)
+    codes = []
+    for hot_path in cold:
+        with get_db(hot_path) as hot:
+            codes.extend(load_code(hot, [block_hash for source, block_hash in sample
+                                         if source == hot_path]).values())
+    compression.store_dictionary(conn, compression.train_dictionary(codes), len(codes))
+
+def _archive_batch(hot_path: str, path: str, hashes: List[str]) -> int:
+    placeholders = ', '.join('?' * len(hashes))
+    with get_db(hot_path) as conn:
+        rows = conn.execute(f"""
+            SELECT {', '.join(ARCHIVE_COLUMNS)}, file_path FROM code_blocks
+            WHERE hash IN ({placeholders})
+        """, hashes).fetchall()
+        codes = load_code(conn, hashes)
+        similar = conn.execute(f"""
+            SELECT block_hash, similar_hash, similarity_score, created_at FROM similar_blocks
+            WHERE block_hash IN ({placeholders})
+        """, hashes).fetchall()
+        signatures = dict(conn.execute(
+            f"SELECT hash, signature FROM block_signatures WHERE hash IN ({placeholders})", hashes
+        ))
+        tokens = conn.execute(
+            f"SELECT hash, scheme, tokens FROM block_tokens WHERE hash IN ({placeholders})", hashes
+        ).fetchall()
+
+    with get_db(path) as conn:
+        dict_id = compression.latest_dictionary_id(conn)
+        dictionary = get_dictionary(conn, dict_id)
+        conn.executemany(f"""
+            INSERT OR REPLACE INTO code_blocks
+            ({', '.join(ARCHIVE_COLUMNS)}, file_path, code, codec, dict_id)
+            VALUES ({', '.join('?' * (len(ARCHIVE_COLUMNS) + 4))})
+        """, [(
+            *row[:-1], '',
+            compression.compress(codes[row[0]].encode('utf-8'), dictionary, archive.COMPRESSION_LEVEL),
+            compression.CODEC, dict_id
+        ) for row in rows])
+        conn.executemany("""
+            INSERT OR REPLACE INTO similar_blocks (block_hash, similar_hash, similarity_score, created_at)
+            VALUES (?, ?, ?, ?)
+        """, similar)
+        lsh.index_blocks(conn, [(row[0], row[1], row[2], signatures[row[0]])
+                                for row in rows if row[0] in signatures])
+        conn.executemany("INSERT OR REPLACE INTO block_tokens (hash, scheme, tokens) VALUES (?, ?, ?)", tokens)
+
+    # Najpierw mapa katalogu - blok spoza mapy jest od razu szukany w archiwum
+    if SHARDS:
+        with get_db(DB_PATH) as conn:
+            conn.execute(f"DELETE FROM block_shards WHERE hash IN ({placeholders})", hashes)
+    with get_db(hot_path) as conn:
+        for table, column in (('similar_blocks', 'block_hash'), ('lsh_buckets', 'block_hash'),
+                              ('block_signatures', 'hash'), ('block_tokens', 'hash'), ('code_blocks', 'hash')):
+            conn.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", hashes)
+    data_changed()
+    # Ponownie przesłany blok ma wrócić do bazy roboczej, a nie zostać odrzucony jako znany
+    cache = dedupe.get_cache(DB_PATH)
+    if cache is not None:
+        cache.discard(hashes)
+
+    # Pliki usuwamy dopiero po zatwierdzeniu; segmenty sprząta remove_orphaned_segments()
+    for row in rows:
+        file_path = Path(row[-1])
+        if file_path.is_file() and file_path.suffix != '.pack':
+            file_path.unlink()
+    return len(rows)
+
+def remove_orphaned_segments() -> int:
+    """Usuwa segmenty bez bloków bazy roboczej; zwraca ich liczbę.
+
+    Pomija ostatni segment, do którego dopisują serwery, i segmenty zmienione
+    w ciągu ARCHIVE_SEGMENT_AGE - zapis bloku mógł jeszcze nie trafić do bazy.
+    """
+    store = get_blob_store()
+    segments = store.segments()[:-1]
+    if not segments:
+        return 0
+
+    used = set()
+    for path in database_paths():
+        with get_db(path) as conn:
+            used.update(row[0] for row in conn.execute(
+                "SELECT DISTINCT blob_segment FROM code_blocks WHERE blob_segment IS NOT NULL"
+            ))
+
+    removed = 0
+    for segment in segments:
+        if segment in used or time.time() - store.segment_path(segment).stat().st_mtime < ARCHIVE_SEGMENT_AGE:
+            continue
+        store.remove(segment)
+        removed += 1
+    return removed
+
+REINDEX_BATCH_SIZE = 200
+
+def _init_reindex_worker(db_path: str, storage_dir: Path) -> None:
+    global DB_PATH, STORAGE_DIR
+    DB_PATH = db_path
+    STORAGE_DIR = storage_dir
+
+def reindex_batch(rows: List[tuple], threshold: float) -> List[tuple]:
+    """Krawędzie podobieństwa bloków (rowid, hash, język, platforma) do starszych bloków.
+
+    Kierunek jak przy zapisie: od nowszego bloku do starszego, więc każda
+    para trafia do similar_blocks tylko raz.
+    """
+    engine = ScoringEngine(threshold, junk_limit=scoring_engine.junk_limit)
+    hashes = [row[1] for row in rows]
+    edges = []
+    with get_db() as conn:
+        codes = load_code(conn, hashes)
+        signatures = dict(conn.execute(f"""
+            SELECT hash, signature FROM block_signatures
+            WHERE hash IN ({', '.join('?' * len(hashes))})
+        """, hashes).fetchall())
+
+        tokens = fingerprint.load(conn, fingerprint.scheme(CANONICAL_IDENTIFIERS), hashes) if TOKEN_SIMILARITY else {}
+
+        for rowid, block_hash, language, platform in rows:
+            code = codes[block_hash]
+            signature = signatures.get(block_hash) or lsh.minhash_signature(code)
+            block = CodeBlock(code=code, language=language, platform=platform,
+                              url='', timestamp='', title='', hash=block_hash)
+            for item in find_similar_blocks(block, conn, signature, engine, older_than=rowid,
+                                            tokens=tokens.get(block_hash)):
+                edges.append((block_hash, item['hash'], item['similarity']))
+    return edges
+
+def reindex_similarity(platform: Optional[str] = None, language: Optional[str] = None,
+                       since: Optional[str] = None, until: Optional[str] = None,
+                       threshold: Optional[float] = None, workers: Optional[int] = None,
+                       batch_size: int = REINDEX_BATCH_SIZE, restart: bool = False,
+                       progress=None) -> Dict:
+    """Przelicza krawędzie similar_blocks dla wybranych bloków.
+
+    Paczki bloków liczą procesy z puli, a wyniki są zapisywane po kolei
+    razem z punktem kontrolnym, więc przerwany przebieg z tymi samymi
+    parametrami wznawia się od ostatniej zapisanej paczki. Na koniec
+    klastry są wyliczane od nowa.
+    """
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    params = {'platform': platform, 'language': language, 'since': since,
+              'until': until, 'threshold': threshold}
+
+    conditions = ["rowid > ?"]
+    filters: list = []
+    for condition, value in (("platform = ?", platform), ("language = ?", language),
+                             ("created_at >= ?", since), ("created_at < ?", until)):
+        if value is not None:
+            conditions.append(condition)
+            filters.append(value)
+
+    with get_db() as conn:
+        run = reindex.start(conn, params, restart)
+
+    def next_batch(last_rowid):
+        with get_db() as conn:
+            return conn.execute(f"""
+                SELECT rowid, hash, language, platform FROM code_blocks
+                WHERE {' AND '.join(conditions)}
+                ORDER BY rowid
+                LIMIT ?
+            """, [last_rowid, *filters, batch_size]).fetchall()
+
+    def save(rows, edges):
+        hashes = [row[1] for row in rows]
+        with get_db() as conn:
+            conn.execute(f"""
+                DELETE FROM similar_blocks
+                WHERE block_hash IN ({', '.join('?' * len(hashes))})
+            """, hashes)
+            created_at = datetime.utcnow().isoformat()
+            conn.executemany("""
+                INSERT OR REPLACE INTO similar_blocks
+                (block_hash, similar_hash, similarity_score, created_at)
+                VALUES (?, ?, ?, ?)
+            """, [(*edge, created_at) for edge in edges])
+            reindex.checkpoint(conn, run['id'], rows[-1][0], len(rows), len(edges))
+        data_changed()
+
+    started = time.monotonic()
+    processed = edges_count = 0
+    last_rowid = run['last_rowid']
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_reindex_worker,
+            initargs=(current_database(), STORAGE_DIR)
+        )
+
+    try:
+        # Najwyżej dwie paczki na proces w locie - wyniki zapisujemy w kolejności rowid
+        in_flight = deque()
+        while True:
+            while pool and len(in_flight) < workers * 2:
+                rows = next_batch(last_rowid)
+                if not rows:
+                    break
+                in_flight.append((rows, pool.submit(reindex_batch, rows, threshold)))
+                last_rowid = rows[-1][0]
+
+            if pool:
+                if not in_flight:
+                    break
+                rows, future = in_flight.popleft()
+                edges = future.result()
+            else:
+                rows = next_batch(last_rowid)
+                if not rows:
+                    break
+                last_rowid = rows[-1][0]
+                edges = reindex_batch(rows, threshold)
+
+            save(rows, edges)
+            processed += len(rows)
+            edges_count += len(edges)
+            if progress:
+                progress(processed, time.monotonic() - started)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+    with get_db() as conn:
+        reindex.finish(conn, run['id'])
+        clusters.rebuild(conn)
+
+    elapsed = time.monotonic() - started
+    return {
+        'run_id': run['id'],
+        'resumed_from': run['last_rowid'],
+        'processed': processed,
+        'edges': edges_count,
+        'elapsed': elapsed,
+        'blocks_per_second': processed / elapsed if elapsed else 0.0
+    }
+
+def run_dev_server():
+    if ASYNC_INGEST:
+        start_ingest_workers()
+
+    # Uruchomienie serwera Flask
+    app.run(port=5000, debug=True)
+
+def before_fork() -> None:
+    # Proces potomny nie może dziedziczyć połączeń SQLite ani puli procesów
+    db.close_all()
+    scoring_engine.shutdown()
+    if STORAGE_BACKEND == 'pack':
+        get_blob_store().close()
+
+def start_worker_services(index: int) -> None:
+    """Usługi procesu serwera; kolejka zapisu działa tylko w procesie 0"""
+    global event_relay, metrics_writer
+    event_relay = events.Relay(event_bus, DB_PATH)
+    event_relay.start()
+    if metrics_registry.enabled and METRICS_DIR:
+        metrics_writer = metrics.SnapshotWriter(metrics_registry, METRICS_DIR)
+        metrics_writer.start()
+    if ASYNC_INGEST and index == 0:
+        start_ingest_workers()
+
+def stop_worker_services(index: int) -> None:
+    # Strumienie SSE kończą się od razu - klienci wznowią je w innym procesie
+    event_bus.close()
+    if event_relay is not None:
+        event_relay.stop(timeout=1)
+    stop_ingest_workers()
+    if metrics_writer is not None:
+        metrics_writer.stop()
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+def cli(ctx):
+    """Code block server. Without a command starts the development server."""
     # Inicjalizacja
     STORAGE_DIR.mkdir(exist_ok=True)
     init_db()
 
-    # Uruchomienie wątku monitorującego
-    monitor_thread = threading.Thread(target=watch_for_changes, daemon=True)
-    monitor_thread.start()
+    if ctx.invoked_subcommand is None:
+        run_dev_server()
 
-    # Uruchomienie serwera Flask
-    app.run(port=5000, debug=True)
+@cli.command('serve')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=5000, show_default=True)
+@click.option('--workers', type=int, default=int(os.environ.get('SERVE_WORKERS', server.WORKERS)),
+              show_default=True, help='Worker processes (SERVE_WORKERS)')
+@click.option('--threads', type=int, default=int(os.environ.get('SERVE_THREADS', server.THREADS)),
+              show_default=True, help='Request threads per worker (SERVE_THREADS)')
+@click.option('--timeout', type=float, default=server.TIMEOUT, show_default=True,
+              help='Seconds a request handler may run before its worker is replaced; '
+                   'also the client socket and worker heartbeat timeout')
+@click.option('--graceful-timeout', type=float, default=server.GRACEFUL_TIMEOUT, show_default=True,
+              help='Seconds to finish in-flight requests after SIGTERM')
+def serve(host, port, workers, threads, timeout, graceful_timeout):
+    """Production server: pre-forked worker processes sharing the database."""
+    global METRICS_DIR
+    server.RequestHandler.timeout = timeout
+    if metrics_registry.enabled:
+        # Każdy proces zapisuje tu swoje metryki - /metrics sumuje wszystkie
+        METRICS_DIR = tempfile.mkdtemp(prefix='metrics-')
+    try:
+        server.PreforkServer(
+            app, host, port, workers, threads, timeout, graceful_timeout,
+            before_fork=before_fork,
+            on_worker_start=start_worker_services,
+            on_worker_exit=stop_worker_services
+        ).run()
+    finally:
+        if METRICS_DIR:
+            shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+@cli.command('migrate-storage')
+@click.option('--keep-files', is_flag=True, help='Do not delete the per-block files after migration')
+def migrate_storage(keep_files):
+    """Move stored code into packfile segments (STORAGE_BACKEND=pack)."""
+    count = sum(for_each_database(migrate_to_pack, keep_files=keep_files))
+    click.echo(f"Przeniesiono {count} bloków kodu do segmentów")
+
+@cli.command('export-files')
+@click.option('--target', type=click.Path(file_okay=False, path_type=Path), default=None,
+              help='Target directory (default: STORAGE_DIR)')
+def export_files_command(target):
+    """Export every block as its own file: <platform>/<language>/<file>."""
+    count = sum(for_each_database(export_files, target or STORAGE_DIR))
+    click.echo(f"Wyeksportowano {count} bloków kodu")
+
+@cli.command('train-dictionary')
+@click.option('--samples', default=2000, show_default=True, help='Number of stored blocks to sample')
+@click.option('--size', default=compression.DICTIONARY_SIZE, show_default=True, help='Dictionary size in bytes')
+@click.option('--recompress', is_flag=True, help='Rewrite stored blocks with the new dictionary')
+def train_dictionary_command(samples, size, recompress):
+    """Train a compression dictionary from the stored corpus (COMPRESSION=1)."""
+    if recompress and not COMPRESSION:
+        raise click.UsageError("--recompress requires COMPRESSION=1")
+    # Przy podziale na shardy każdy shard ma własny słownik, wytrenowany na swoich blokach
+    for path in database_paths():
+        with using_database(path):
+            dict_id, dict_size = train_compression_dictionary(samples, size)
+            click.echo(f"Zapisano słownik {dict_id} ({dict_size} B)")
+            if recompress:
+                click.echo(f"Skompresowano ponownie {recompress_blocks()} bloków kodu")
+
+@cli.command('search-backfill')
+@click.option('--rebuild', is_flag=True, help='Drop the index contents first (e.g. after VACUUM)')
+def search_backfill(rebuild):
+    """Add blocks missing from the full-text search index."""
+    if not FULL_TEXT_SEARCH:
+        raise click.UsageError("Full-text search is disabled (FULL_TEXT_SEARCH=0)")
+    click.echo(f"Zindeksowano {sum(for_each_database(backfill_search_index, rebuild))} bloków kodu")
+
+@cli.command('reindex')
+@click.option('--platform', default=None, help='Only blocks from this platform')
+@click.option('--language', default=None, help='Only blocks in this language')
+@click.option('--since', default=None, help='Only blocks stored at or after this ISO date')
+@click.option('--until', default=None, help='Only blocks stored before this ISO date')
+@click.option('--threshold', type=float, default=None, help='Similarity threshold (default: SIMILARITY_THRESHOLD)')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: number of CPUs)')
+@click.option('--batch-size', default=REINDEX_BATCH_SIZE, show_default=True, help='Blocks per batch and checkpoint')
+@click.option('--restart', is_flag=True, help='Ignore an unfinished run with the same options')
+def reindex_command(platform, language, since, until, threshold, workers, batch_size, restart):
+    """Rebuild the similarity graph; an interrupted run resumes where it stopped."""
+    def progress(processed, elapsed):
+        click.echo(f"Przetworzono {processed} bloków ({processed / elapsed if elapsed else 0:.1f} bloków/s)")
+
+    for path in database_paths(language, platform):
+        if SHARDS:
+            click.echo(f"Shard {path}")
+        with using_database(path):
+            result = reindex_similarity(platform, language, since, until, threshold, workers,
+                                        batch_size, restart, progress)
+        if result['resumed_from']:
+            click.echo(f"Wznowiono przebieg {result['run_id']} od rowid {result['resumed_from']}")
+        click.echo(f"Gotowe: {result['processed']} bloków, {result['edges']} krawędzi, "
+                   f"{result['elapsed']:.1f} s ({result['blocks_per_second']:.1f} bloków/s)")
+
+@cli.command('archive')
+@click.option('--older-than', 'days', type=click.IntRange(min=1), default=ARCHIVE_AFTER_DAYS or None,
+              help='Archive blocks saved more than DAYS days ago (ARCHIVE_AFTER_DAYS)')
+@click.option('--max-hot-mb', type=click.IntRange(min=1), default=ARCHIVE_MAX_HOT_MB or None,
+              help='Keep at most this much code per hot database file, archive the oldest rest (ARCHIVE_MAX_HOT_MB)')
+@click.option('--batch-size', type=click.IntRange(min=1), default=500, show_default=True, help='Blocks per transaction')
+def archive_command(days, max_hot_mb, batch_size):
+    """Move old blocks into the compacted read-only archive database."""
+    if days is None and max_hot_mb is None:
+        raise click.UsageError("Give --older-than and/or --max-hot-mb")
+    before = (datetime.utcnow() - timedelta(days=days)).isoformat() if days else None
+    moved = archive_blocks(before, max_hot_mb * 1024 * 1024 if max_hot_mb else None, batch_size)
+    segments = remove_orphaned_segments()
+    click.echo(f"Przeniesiono do archiwum {moved} bloków kodu, usunięto {segments} pustych segmentów")
+
+@cli.command('split-shards')
+@click.option('--shards', 'count', type=click.IntRange(min=1), required=True, help='Number of shard files')
+def split_shards_command(count):
+    """Split a single-file database into SHARDS files plus a catalog (run with SHARDS unset)."""
+    if SHARDS:
+        raise click.UsageError("The database is already sharded (SHARDS is set)")
+    sizes = split_into_shards(count)
+    click.echo(f"Podzielono {sum(sizes)} bloków kodu na {count} shardów; uruchamiaj serwer z SHARDS={count}")
+
+if __name__ == '__main__':
+    cli()
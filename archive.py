@@ -0,0 +1,45 @@
+from pathlib import Path
+from typing import List, Optional
+
+# Archiwum - zimna warstwa bloków.
+#
+# Polecenie `archive` przenosi stare bloki (albo najstarsze ponad budżet
+# rozmiaru) z bazy roboczej do osobnego pliku SQLite obok DB_PATH. Kod
+# leży tam w kolumnie code, skompresowany słownikiem wytrenowanym na
+# archiwum, bez plików, segmentów i indeksu pełnotekstowego. Serwer tylko
+# z niego czyta: /similar i /diff szukają tu bloków nieznalezionych
+# w bazie roboczej, a podobieństwo nowych bloków liczymy bez archiwum.
+
+ARCHIVE_PATTERN = '{stem}.archive{suffix}'
+COMPRESSION_LEVEL = 9  # Archiwum zapisujemy raz - opłaca się najmocniejsza kompresja
+DICTIONARY_SAMPLES = 2000  # Bloki, na których trenujemy słownik archiwum
+
+
+def archive_path(catalog_path: str) -> str:
+    """Plik archiwum obok bazy, np. code_blocks.archive.db"""
+    path = Path(catalog_path)
+    return str(path.with_name(ARCHIVE_PATTERN.format(stem=path.stem, suffix=path.suffix)))
+
+
+def cold_hashes(conn, before: Optional[str] = None, max_bytes: Optional[int] = None) -> List[str]:
+    """Bloki do archiwum: zapisane przed `before` i starsze od tych, które mieszczą się w `max_bytes` kodu.
+
+    Budżet wypełniają bloki od najnowszych; kolejność wyniku - od najstarszych.
+    """
+    return [row[0] for row in conn.execute("""
+        SELECT hash FROM (
+            SELECT hash, created_at, SUM(COALESCE(code_length, length(code)))
+                OVER (ORDER BY created_at DESC, hash DESC) AS newer_bytes
+            FROM code_blocks
+        )
+        WHERE (:before IS NOT NULL AND created_at < :before)
+           OR (:max_bytes IS NOT NULL AND newer_bytes > :max_bytes)
+        ORDER BY created_at, hash
+    """, {'before': before, 'max_bytes': max_bytes})]
+
+
+def dictionary_sample(items: list, count: int) -> list:
+    """Najwyżej `count` elementów rozłożonych równo po całej liście"""
+    if len(items) <= count:
+        return list(items)
+    return [items[i * len(items) // count] for i in range(count)]
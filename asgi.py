@@ -0,0 +1,304 @@
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+import app
+from scoring import ScoringEngine
+
+DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', 32))  # Wątki z dostępem do bazy i plików
+CPU_WORKERS = app.SCORING_POOL_SIZE                      # Procesy liczące podobieństwo (0 = bez puli)
+PARALLEL_MIN_CHARS = 20_000      # Od tylu znaków pracy liczymy w puli, a nie w wątku bazy
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, scope: Dict, receive: Callable):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope.get('headers', [])}
+        self.args = {name: values[0] for name, values in
+                     parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.route = 'unmatched'
+        self._receive = receive
+
+    def arg_int(self, name: str, default: Optional[int] = None) -> Optional[int]:
+        # Jak request.args.get(name, default, type=int) we Flasku
+        try:
+            return int(self.args[name])
+        except (KeyError, ValueError):
+            return default
+
+    async def body(self) -> bytes:
+        chunks = []
+        size = 0
+        while True:
+            message = await self._receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, 'Client disconnected')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                raise HTTPError(413, 'Request body too large')
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+
+class Response:
+    def __init__(self, status: int = 200, body: Union[bytes, AsyncIterator[bytes]] = b'',
+                 headers: Optional[Dict[str, str]] = None, content_type: str = 'application/json'):
+        self.status = status
+        self.body = body
+        self.headers = dict(headers or {})
+        self.headers.setdefault('Content-Type', content_type)
+
+    async def send(self, send: Callable) -> None:
+        headers = [(name.lower().encode('latin-1'), str(value).encode('latin-1'))
+                   for name, value in self.headers.items()]
+        if isinstance(self.body, bytes):
+            headers.append((b'content-length', str(len(self.body)).encode('latin-1')))
+            await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        async for chunk in self.body:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def json_response(data, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(status, app.app.json.dumps(data).encode('utf-8'), headers)
+
+
+class AsgiApp:
+    """API bloków kodu jako aplikacja ASGI, np. `uvicorn asgi:application`.
+
+    Trasy i odpowiedzi są takie same jak we Flasku, a obsługę wspólną
+    z nim bierze z modułu app. Pętla zdarzeń tylko przyjmuje i wysyła
+    dane: baza i pliki idą do puli `db_threads` wątków, a liczenie
+    podobieństwa i sygnatur dużych paczek - do puli procesów. Otwarte
+    połączenie klienta nie zajmuje więc wątku.
+    """
+
+    def __init__(self, db_threads: int = DB_THREADS, cpu_workers: int = CPU_WORKERS):
+        self.db_threads = db_threads
+        self.cpu_workers = cpu_workers
+        self.db_executor: Optional[ThreadPoolExecutor] = None
+        self.cpu_pool: Optional[ProcessPoolExecutor] = None
+        self.engine: Optional[ScoringEngine] = None
+        self._start_lock = asyncio.Lock()
+        self.routes: List[Tuple[str, 're.Pattern', Callable]] = [
+            ('POST', re.compile(r'/code-blocks'), self.receive_code_blocks),
+            ('GET', re.compile(r'/code-blocks'), self.get_code_blocks),
+            ('GET', re.compile(r'/code-blocks/(?P<hash>[^/]+)/similar'), self.get_similar_blocks),
+            ('POST', re.compile(r'/code-blocks/similar-query'), self.similar_query),
+            ('GET', re.compile(r'/code-blocks/(?P<hash>[^/]+)/diff/(?P<other_hash>[^/]+)'),
+             self.get_blocks_diff),
+            ('GET', re.compile(r'/metrics'), self.get_metrics),
+        ]
+
+    # Cykl życia
+
+    async def startup(self) -> None:
+        async with self._start_lock:
+            if self.db_executor is not None:
+                return
+            self.db_executor = ThreadPoolExecutor(max_workers=self.db_threads, thread_name_prefix='db')
+            if self.cpu_workers > 0:
+                # spawn - proces ma już działające wątki
+                self.cpu_pool = ProcessPoolExecutor(
+                    max_workers=self.cpu_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            self.engine = ScoringEngine(app.SIMILARITY_THRESHOLD, self.cpu_workers,
+                                        PARALLEL_MIN_CHARS, pool=self.cpu_pool,
+                                        junk_limit=app.scoring_engine.junk_limit)
+            self.engine.stats = app.scoring_engine.stats  # Te same liczniki w /metrics
+            await self.run(app.STORAGE_DIR.mkdir, exist_ok=True)
+            await self.run(app.init_db)
+            if app.ASYNC_INGEST:
+                app.start_ingest_workers()
+
+    def shutdown(self) -> None:
+        app.stop_ingest_workers()
+        if self.db_executor is not None:
+            self.db_executor.shutdown(wait=True)
+            self.db_executor = None
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown(wait=True, cancel_futures=True)
+            self.cpu_pool = None
+        app.db.close_all()
+
+    async def lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Wywołuje blokującą funkcję w puli wątków bazy"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.db_executor, functools.partial(func, *args, **kwargs)
+        )
+
+    # Obsługa żądań
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        await self.startup()
+        started = time.perf_counter()
+        request = Request(scope, receive)
+        try:
+            response = await self.dispatch(request)
+        except HTTPError as e:
+            response = json_response({'error': e.message}, e.status)
+        except Exception:
+            traceback.print_exc()
+            response = json_response({'error': 'Internal server error'}, 500)
+
+        # Jak flask_cors z domyślnymi ustawieniami
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        await response.send(send)
+        app.metrics_registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                                     route=request.route, method=request.method,
+                                     status=str(response.status))
+
+    async def dispatch(self, request: Request) -> Response:
+        allowed = []
+        for method, pattern, handler in self.routes:
+            match = pattern.fullmatch(request.path)
+            if not match:
+                continue
+            if method == request.method:
+                request.route = pattern.pattern
+                return await handler(request, **match.groupdict())
+            allowed.append(method)
+
+        if not allowed:
+            raise HTTPError(404, 'Not found')
+        if request.method == 'OPTIONS':
+            return Response(200, headers={
+                'Allow': ', '.join(allowed + ['OPTIONS']),
+                'Access-Control-Allow-Methods': ', '.join(allowed + ['OPTIONS']),
+                'Access-Control-Allow-Headers': request.headers.get('access-control-request-headers', '*')
+            })
+        return json_response({'error': 'Method not allowed'}, 405,
+                             {'Allow': ', '.join(allowed + ['OPTIONS'])})
+
+    async def receive_code_blocks(self, request: Request) -> Response:
+        body = await request.body()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, 'Invalid JSON')
+
+        # Sygnatury małych paczek taniej policzyć na miejscu niż przesyłać do procesów
+        pool = self.cpu_pool if len(body) >= PARALLEL_MIN_CHARS else None
+        status, content, headers = await self.run(
+            app.receive_payload, data, request.headers.get('idempotency-key'), self.engine, pool
+        )
+        return Response(status, content, headers)
+
+    async def get_code_blocks(self, request: Request) -> Response:
+        platform = request.args.get('platform')
+        language = request.args.get('language')
+        try:
+            after = app.parse_cursor(request.args.get('after'))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+        if request.args.get('format') == 'ndjson':
+            pages = app.iter_code_block_pages(platform, language, after, request.arg_int('limit'))
+            return Response(200, self.ndjson(pages), content_type='application/x-ndjson')
+
+        limit = app.page_limit(request.arg_int('limit', 100))
+        context, cached = await self.lookup('code_blocks', (platform, language, limit, after), request)
+        if cached is None:
+            cached = await self.run(app.code_blocks_response, context, platform, language, limit, after)
+        return Response(*cached)
+
+    async def lookup(self, route: str, args: tuple, request: Request, immutable: bool = False):
+        """app.lookup_response(): 304 i odpowiedzi z pamięci bez przechodzenia do puli wątków.
+
+        Gdy wersja danych w pamięci jest przeterminowana, lookup czyta ją
+        z bazy - wtedy w puli, żeby pętla nie czekała na SQLite.
+        """
+        if immutable or app.data_version_fresh():
+            return app.lookup_response(route, args, request.headers.get('if-none-match'), immutable)
+        return await self.run(app.lookup_response, route, args, request.headers.get('if-none-match'), immutable)
+
+    async def ndjson(self, pages) -> AsyncIterator[bytes]:
+        # Jedna strona na przejście do puli wątków
+        while True:
+            blocks = await self.run(next, pages, None)
+            if blocks is None:
+                return
+            yield ''.join(json.dumps(block) + '\n' for block in blocks).encode('utf-8')
+
+    async def get_similar_blocks(self, request: Request, hash: str) -> Response:
+        context, cached = await self.lookup('similar', (hash,), request)
+        if cached is None:
+            cached = await self.run(app.build_response, context, app.similar_blocks_of, hash)
+        return Response(*cached)
+
+    async def similar_query(self, request: Request) -> Response:
+        body = await request.body()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        try:
+            query = app.parse_similar_query(data)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        return json_response(await self.run(app.query_similar, **query))
+
+    async def get_blocks_diff(self, request: Request, hash: str, other_hash: str) -> Response:
+        args = (hash, other_hash, request.arg_int('context', app.DIFF_CONTEXT),
+                request.arg_int('max_bytes', app.DIFF_MAX_BYTES))
+        context, cached = await self.lookup('diff', args, request, immutable=True)
+        if cached is None:
+            cached = await self.run(app.build_response, context, app.blocks_diff, *args)
+            if cached is None:
+                raise HTTPError(404, 'One or both blocks not found')
+        return Response(*cached)
+
+    async def get_metrics(self, request: Request) -> Response:
+        if not app.metrics_registry.enabled:
+            raise HTTPError(404, 'Metrics are disabled')
+        return Response(200, app.metrics_registry.render().encode('utf-8'),
+                        content_type=app.metrics.CONTENT_TYPE)
+
+
+application = AsgiApp()
@@ -0,0 +1,91 @@
+import random
+import sys
+import time
+from pathlib import Path
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+import compression  # noqa: E402
+
+SNIPPET_TEMPLATES = [
+    "import os\nimport sys\nimport json\nfrom typing import Dict, List, Optional\n\n"
+    "def {name}(data: Dict) -> List:\n    result = []\n    for key, value in data.items():\n"
+    "        if value is not None:\n            result.append((key, value * {n}))\n    return result\n",
+    "from flask import Flask, request, jsonify\n\napp = Flask(__name__)\n\n"
+    "@app.route('/{name}', methods=['GET'])\ndef {name}():\n    limit = int(request.args.get('limit', {n}))\n"
+    "    return jsonify({{'items': list(range(limit))}})\n",
+    "const {name} = async (url) => {{\n  const response = await fetch(url, {{\n    method: 'GET',\n"
+    "    headers: {{ 'Content-Type': 'application/json' }}\n  }});\n  if (!response.ok) {{\n"
+    "    throw new Error(`HTTP error! status: ${{response.status}}`);\n  }}\n  return response.json().then(d => d.slice(0, {n}));\n}};\n",
+]
+
+
+def synthetic_corpus(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        rng.choice(SNIPPET_TEMPLATES).format(name=f"handler_{rng.randrange(10 ** 6)}", n=rng.randrange(100))
+        for _ in range(count)
+    ]
+
+
+def stored_corpus(db_path: str, count: int) -> list:
+    app.DB_PATH = db_path
+    with app.get_db() as conn:
+        hashes = [row[0] for row in conn.execute(
+            "SELECT hash FROM code_blocks ORDER BY RANDOM() LIMIT ?", (count,)
+        )]
+        return list(app.load_code(conn, hashes).values())
+
+
+def run(texts: list, level: int, dict_size: int) -> list:
+    # Słownik trenujemy na połowie próbek, a mierzymy na drugiej połowie
+    half = len(texts) // 2
+    train, test = texts[:half], [text.encode('utf-8') for text in texts[half:]]
+    dictionary = compression.train_dictionary(train, dict_size)
+    raw = sum(len(data) for data in test)
+
+    results = []
+    for name, zdict in (('zlib', None), ('zlib+dict', dictionary)):
+        start = time.perf_counter()
+        packed = [compression.compress(data, zdict, level) for data in test]
+        compress_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for data in packed:
+            compression.decompress(data, zdict)
+        decompress_time = time.perf_counter() - start
+
+        size = sum(len(data) for data in packed)
+        results.append({
+            'codec': name,
+            'raw_bytes': raw,
+            'stored_bytes': size,
+            'ratio': raw / size if size else 0.0,
+            'compress_mb_s': raw / compress_time / 1e6 if compress_time else 0.0,
+            'decompress_mb_s': raw / decompress_time / 1e6 if decompress_time else 0.0,
+        })
+    return results
+
+
+@click.command()
+@click.option('--db', 'db_path', default=None, help='Database to sample (default: synthetic corpus)')
+@click.option('--samples', default=4000, show_default=True, help='Number of blocks')
+@click.option('--level', default=app.COMPRESSION_LEVEL, show_default=True, help='zlib level')
+@click.option('--dict-size', default=compression.DICTIONARY_SIZE, show_default=True)
+def main(db_path, samples, level, dict_size):
+    """Compression ratio and throughput with and without a trained dictionary."""
+    texts = stored_corpus(db_path, samples) if db_path else synthetic_corpus(samples)
+    if len(texts) < 2:
+        raise click.UsageError("Need at least two blocks")
+
+    click.echo(f"{'codec':<10} {'raw B':>12} {'stored B':>12} {'ratio':>7} {'comp MB/s':>10} {'decomp MB/s':>12}")
+    for r in run(texts, level, dict_size):
+        click.echo(f"{r['codec']:<10} {r['raw_bytes']:>12} {r['stored_bytes']:>12} {r['ratio']:>7.2f} "
+                   f"{r['compress_mb_s']:>10.1f} {r['decompress_mb_s']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
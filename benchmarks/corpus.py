@@ -0,0 +1,255 @@
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+import click
+
+# Generator korpusu bloków kodu do benchmarków.
+#
+# Bloki to funkcje złożone z losowych instrukcji w stylu danego języka,
+# więc mają realny rozkład długości linii, tokenów i wcięć. Część bloków
+# to kopie (ten sam hash - ścieżka deduplikacji), a część to bliskie
+# duplikaty wcześniejszych bloków po kilku drobnych zmianach (zmiana
+# nazwy, stałej, dopisana lub usunięta linia) - tak jak ten sam fragment
+# wklejony na innej stronie. Ten sam seed daje zawsze ten sam korpus.
+
+NAMES = ('user', 'item', 'value', 'result', 'config', 'request', 'response', 'data', 'count',
+         'index', 'buffer', 'node', 'path', 'token', 'cache', 'total', 'entry', 'record',
+         'session', 'payload', 'query', 'offset', 'limit', 'handler', 'event', 'message')
+VERBS = ('get', 'load', 'parse', 'build', 'update', 'fetch', 'compute', 'render', 'validate',
+         'merge', 'send', 'read', 'write', 'resolve', 'filter', 'format', 'collect', 'apply')
+CALLS = ('process', 'transform', 'lookup', 'normalize', 'encode', 'decode', 'check', 'wrap')
+
+# Instrukcje: (linie, czy otwierają blok). {a}, {b}, {c} - nazwy, {n} - liczba, {f} - wywołanie
+STATEMENTS = {
+    'python': {
+        'header': 'def {name}({a}, {b}={n}):',
+        'indent': '    ',
+        'footer': None,
+        'lines': [
+            ('{c} = {f}({a}, {n})', False),
+            ('{c} = [{a} * {n} for {a} in {b} if {a}]', False),
+            ('if {a} is None or {b} > {n}:', True),
+            ('for {c} in {a}:', True),
+            ('{a}.append({f}({c}))', False),
+            ('{b} += len({a}) * {n}', False),
+            ('while {a} < {n}:', True),
+            ('{c} = {{"{a}": {b}, "{f}": {n}}}', False),
+            ('logger.debug("{f} %s", {a})', False),
+            ('return {f}({a}, {b})', False),
+            ('with open({a}) as {c}:', True),
+            ('raise ValueError(f"invalid {a}: {{{b}}}")', False),
+        ],
+    },
+    'javascript': {
+        'header': 'function {name}({a}, {b} = {n}) {{',
+        'indent': '  ',
+        'footer': '}}',
+        'lines': [
+            ('const {c} = {f}({a}, {n});', False),
+            ('let {c} = {a}.map(({b}) => {b} * {n});', False),
+            ('if ({a} === undefined || {b} > {n}) {{', True),
+            ('for (const {c} of {a}) {{', True),
+            ('{a}.push({f}({c}));', False),
+            ('{b} += {a}.length * {n};', False),
+            ('while ({a} < {n}) {{', True),
+            ('const {c} = {{ {a}: {b}, {f}: {n} }};', False),
+            ('console.log(`{f} ${{{a}}}`);', False),
+            ('return {f}({a}, {b});', False),
+            ('await {f}({a}).then(({c}) => {c}.json());', False),
+            ('throw new Error(`invalid {a}: ${{{b}}}`);', False),
+        ],
+    },
+    'go': {
+        'header': 'func {name}({a} []int, {b} int) (int, error) {{',
+        'indent': '\t',
+        'footer': '}}',
+        'lines': [
+            ('{c} := {f}({a}, {n})', False),
+            ('{c}, err := {f}({b})', False),
+            ('if err != nil || {b} > {n} {{', True),
+            ('for _, {c} := range {a} {{', True),
+            ('{a} = append({a}, {f}({c}))', False),
+            ('{b} += len({a}) * {n}', False),
+            ('for {b} < {n} {{', True),
+            ('{c} := map[string]int{{"{a}": {b}, "{f}": {n}}}', False),
+            ('log.Printf("{f} %v", {a})', False),
+            ('return {f}({a}, {b}), nil', False),
+            ('defer {f}({a})', False),
+            ('return 0, fmt.Errorf("invalid {a}: %d", {b})', False),
+        ],
+    },
+    'java': {
+        'header': 'public static int {name}(List<Integer> {a}, int {b}) {{',
+        'indent': '    ',
+        'footer': '}}',
+        'lines': [
+            ('int {c} = {f}({a}, {n});', False),
+            ('List<Integer> {c} = new ArrayList<>({a});', False),
+            ('if ({a} == null || {b} > {n}) {{', True),
+            ('for (int {c} : {a}) {{', True),
+            ('{a}.add({f}({c}));', False),
+            ('{b} += {a}.size() * {n};', False),
+            ('while ({b} < {n}) {{', True),
+            ('Map<String, Integer> {c} = Map.of("{a}", {b}, "{f}", {n});', False),
+            ('LOGGER.fine("{f} " + {a});', False),
+            ('return {f}({a}, {b});', False),
+            ('{c} = {a}.stream().mapToInt(Integer::intValue).sum();', False),
+            ('throw new IllegalArgumentException("invalid {a}: " + {b});', False),
+        ],
+    },
+}
+
+LANGUAGES = {'python': 0.4, 'javascript': 0.3, 'go': 0.15, 'java': 0.15}
+PLATFORMS = {'github': 0.4, 'stackoverflow': 0.3, 'gitlab': 0.15, 'discord': 0.15}
+
+
+def _pick(rng: random.Random, weights: Dict[str, float]) -> str:
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def generate_code(rng: random.Random, language: str, lines: int) -> str:
+    """Funkcja w danym języku o mniej więcej `lines` liniach"""
+    style = STATEMENTS[language]
+    name = f"{rng.choice(VERBS)}_{rng.choice(NAMES)}" if language == 'python' else \
+        rng.choice(VERBS) + rng.choice(NAMES).capitalize()
+    a, b = rng.sample(NAMES, 2)
+    out = [style['header'].format(name=name, a=a, b=b, n=rng.randrange(1, 100))]
+    depth = 1
+    open_blocks = 0
+    while len(out) < lines - 1:
+        template, opens = rng.choice(style['lines'])
+        if opens and (depth >= 4 or len(out) >= lines - 2):
+            continue  # Otwarty blok musi mieć choć jedną linię
+        line = template.format(a=rng.choice(NAMES), b=rng.choice(NAMES), c=rng.choice(NAMES),
+                               f=rng.choice(CALLS), n=rng.randrange(1, 1000))
+        out.append(style['indent'] * depth + line)
+        if opens:
+            depth += 1
+            open_blocks += 1
+        elif open_blocks and rng.random() < 0.3:
+            depth -= 1
+            open_blocks -= 1
+            if style['footer']:
+                out.append(style['indent'] * depth + style['footer'].format())
+    while style['footer'] and depth > 0:
+        depth -= 1
+        out.append(style['indent'] * depth + style['footer'].format())
+    return '\n'.join(out) + '\n'
+
+
+def mutate(rng: random.Random, code: str, edits: int = 2) -> str:
+    """Bliski duplikat - kilka drobnych zmian w kopii bloku"""
+    lines = code.split('\n')
+    for _ in range(edits):
+        kind = rng.randrange(4)
+        i = rng.randrange(1, max(2, len(lines) - 1))
+        if kind == 0:  # Zmiana nazwy w całym bloku
+            old, new = rng.sample(NAMES, 2)
+            lines = [line.replace(old, new) for line in lines]
+        elif kind == 1:  # Inna stała
+            lines[i] = ''.join(str(rng.randrange(10)) if ch.isdigit() else ch for ch in lines[i])
+        elif kind == 2 and len(lines) > 3:  # Usunięta linia
+            del lines[i]
+        else:  # Dopisany komentarz
+            indent = lines[i][:len(lines[i]) - len(lines[i].lstrip())]
+            marker = '#' if lines[0].startswith('def ') else '//'
+            lines.insert(i, f"{indent}{marker} TODO: {rng.choice(VERBS)} {rng.choice(NAMES)}")
+    return '\n'.join(lines)
+
+
+def iter_blocks(count: int, seed: int = 0, duplicate_rate: float = 0.05,
+                near_duplicate_rate: float = 0.2, min_lines: int = 5, max_lines: int = 60,
+                languages: Optional[Dict[str, float]] = None,
+                platforms: Optional[Dict[str, float]] = None,
+                history: int = 1000) -> Iterator[Dict]:
+    """`count` bloków w formacie POST /code-blocks.
+
+    `duplicate_rate` bloków to dokładne kopie, a `near_duplicate_rate` -
+    bliskie duplikaty jednego z ostatnich `history` bloków (pamięć nie
+    rośnie z `count`). Długość w liniach ma rozkład log-normalny obcięty
+    do [min_lines, max_lines] - dużo krótkich, mało długich.
+    """
+    rng = random.Random(seed)
+    languages = languages or LANGUAGES
+    platforms = platforms or PLATFORMS
+    recent: List[Dict] = []
+    started = datetime(2024, 1, 1)
+    for i in range(count):
+        roll = rng.random()
+        if recent and roll < duplicate_rate:
+            source = rng.choice(recent)
+            code, language = source['code'], source['language']
+        elif recent and roll < duplicate_rate + near_duplicate_rate:
+            source = rng.choice(recent)
+            code, language = mutate(rng, source['code'], rng.randint(1, 3)), source['language']
+        else:
+            language = _pick(rng, languages)
+            lines = int(min(max_lines, max(min_lines, rng.lognormvariate(2.7, 0.6))))
+            code = generate_code(rng, language, lines)
+
+        platform = _pick(rng, platforms)
+        block = {
+            'code': code,
+            'language': language,
+            'platform': platform,
+            'url': f"https://{platform}.example.com/page/{rng.randrange(count * 10 + 1)}",
+            'timestamp': (started + timedelta(seconds=i * 37)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'title': f"Benchmark block {i}"
+        }
+        if len(recent) < history:
+            recent.append(block)
+        else:
+            recent[rng.randrange(history)] = block
+        yield block
+
+
+def iter_pages(blocks: Iterator[Dict], page_size: int) -> Iterator[List[Dict]]:
+    """Bloki pogrupowane jak strony wysyłane przez rozszerzenie"""
+    page = []
+    for block in blocks:
+        page.append(block)
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def parse_mix(value: Optional[str]) -> Optional[Dict[str, float]]:
+    """'python=2,go=1' -> {'python': 2.0, 'go': 1.0}"""
+    if not value:
+        return None
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+@click.command()
+@click.option('--count', default=1000, show_default=True, help='Number of blocks')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--duplicate-rate', default=0.05, show_default=True, help='Share of exact copies')
+@click.option('--near-duplicate-rate', default=0.2, show_default=True, help='Share of edited copies')
+@click.option('--min-lines', default=5, show_default=True)
+@click.option('--max-lines', default=60, show_default=True)
+@click.option('--languages', default=None, help='Language mix, e.g. python=2,go=1')
+@click.option('--platforms', default=None, help='Platform mix, e.g. github=3,discord=1')
+@click.option('--page-size', default=50, show_default=True, help='Blocks per payload')
+def main(count, seed, duplicate_rate, near_duplicate_rate, min_lines, max_lines,
+         languages, platforms, page_size):
+    """Write a synthetic corpus as POST /code-blocks payloads, one JSON per line."""
+    languages, platforms = parse_mix(languages), parse_mix(platforms)
+    if languages and set(languages) - set(STATEMENTS):
+        raise click.UsageError(f"Supported languages: {', '.join(STATEMENTS)}")
+    blocks = iter_blocks(count, seed, duplicate_rate, near_duplicate_rate, min_lines, max_lines,
+                         languages, platforms)
+    for page in iter_pages(blocks, page_size):
+        sys.stdout.write(json.dumps({'blocks': page, 'metadata': {}}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from multiprocessing import Pool
+from pathlib import Path
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.compression import synthetic_corpus  # noqa: E402
+
+APP = str(Path(__file__).resolve().parent.parent / 'app.py')
+DEV_PORT = 5000  # Serwer deweloperski nie ma opcji portu
+
+
+def start_server(command: list, cwd: str) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    # Log do pliku, nie do potoku - nieczytany potok zatrzymałby serwer po zapełnieniu.
+    # Własna grupa procesów - reloader i procesy potomne kończymy razem z serwerem
+    with open(Path(cwd) / 'server.log', 'w') as log:
+        return subprocess.Popen([sys.executable, APP] + command, cwd=cwd, env=env,
+                                stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def read_port(cwd: str, timeout: float = 30) -> int:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        match = re.search(r'Serwer na http://[^:]+:(\d+) ', (Path(cwd) / 'server.log').read_text())
+        if match:
+            return int(match.group(1))
+        time.sleep(0.1)
+    raise click.ClickException("Could not read the server port")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def wait_until_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/code-blocks?limit=1', timeout=1):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    raise click.ClickException(f"Server at {base_url} did not start")
+
+
+def post_payload(codes: list) -> bytes:
+    return json.dumps({'blocks': [{
+        'code': code, 'language': 'python', 'platform': 'benchmark',
+        'url': 'https://example.com/benchmark', 'timestamp': '2024-01-01T00:00:00Z'
+    } for code in codes]}).encode('utf-8')
+
+
+def client(job) -> list:
+    """Wysyła żądania jednego klienta; zwraca czasy odpowiedzi w sekundach"""
+    base_url, requests, post_every, codes = job
+    latencies = []
+    for i in range(requests):
+        if post_every and i % post_every == 0 and codes:
+            request = urllib.request.Request(
+                f'{base_url}/code-blocks', data=post_payload([codes.pop()]),
+                headers={'Content-Type': 'application/json'}
+            )
+        else:
+            request = urllib.request.Request(f'{base_url}/code-blocks?limit=20')
+        start = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(base_url: str, clients: int, requests: int, post_every: int, corpus: list) -> dict:
+    per_client = len(corpus) // clients
+    jobs = [(base_url, requests, post_every, corpus[i * per_client:(i + 1) * per_client])
+            for i in range(clients)]
+    # Klienci w osobnych procesach, żeby GIL klienta nie ograniczał pomiaru
+    with Pool(clients) as pool:
+        start = time.perf_counter()
+        latencies = sorted(t for result in pool.map(client, jobs) for t in result)
+        elapsed = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'req_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def measure(name: str, command: list, port: int, seed_blocks: int, **load) -> dict:
+    work_dir = tempfile.mkdtemp()
+    process = start_server(command, work_dir)
+    try:
+        if port == 0:
+            port = read_port(work_dir)
+        base_url = f'http://127.0.0.1:{port}'
+        wait_until_ready(base_url)
+
+        # Ta sama baza startowa dla każdego serwera
+        corpus = synthetic_corpus(seed_blocks + load['clients'] * load['requests'], seed=1)
+        for i in range(0, seed_blocks, 100):
+            urllib.request.urlopen(urllib.request.Request(
+                f'{base_url}/code-blocks', data=post_payload(corpus[i:i + 100]),
+                headers={'Content-Type': 'application/json'}
+            ), timeout=120).read()
+
+        result = run(base_url, corpus=corpus[seed_blocks:], **load)
+        result['server'] = name
+        return result
+    finally:
+        stop_server(process)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@click.command()
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='serve --workers')
+@click.option('--threads', default=8, show_default=True, help='serve --threads')
+@click.option('--clients', default=8, show_default=True, help='Concurrent client processes')
+@click.option('--requests', default=200, show_default=True, help='Requests per client')
+@click.option('--post-every', default=10, show_default=True,
+              help='Every N-th request stores a new block (0: only reads)')
+@click.option('--seed-blocks', default=500, show_default=True, help='Blocks stored before measuring')
+@click.option('--skip-dev', is_flag=True, help='Do not measure the development server')
+def main(workers, threads, clients, requests, post_every, seed_blocks, skip_dev):
+    """Throughput of `python app.py serve` compared to the development server."""
+    load = dict(clients=clients, requests=requests, post_every=post_every)
+    results = []
+    if not skip_dev:
+        results.append(measure('dev (app.run)', [], DEV_PORT, seed_blocks, **load))
+    results.append(measure(f'serve {workers}x{threads}',
+                           ['serve', '--port', '0', '--workers', str(workers), '--threads', str(threads)],
+                           0, seed_blocks, **load))
+
+    click.echo(f"{'server':<16} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        click.echo(f"{r['server']:<16} {r['requests']:>9} {r['req_s']:>9.1f} "
+                   f"{r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+from unittest.mock import patch
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+from benchmarks import corpus  # noqa: E402
+
+# Scenariusze mierzymy na kolejnych rozmiarach korpusu: najpierw zapis
+# całego korpusu stronami (ingest), potem na tej samej bazie odczyty.
+# Regresje skalowania widać dopiero przy porównaniu rozmiarów między sobą
+# i z zapisanym wynikiem bazowym.
+
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+SCENARIOS = ('ingest', 'dedupe', 'similar', 'listing', 'diff')
+TOLERANCE = 0.2    # Dopuszczalne pogorszenie przepustowości i p50 przy porównaniu
+MIN_DELTA_MS = 0.1  # Mniejsze zmiany czasu operacji to szum pomiaru, nie regresja
+LIST_PAGE_SIZE = 100
+
+
+def parse_sizes(value: str) -> List[int]:
+    sizes = []
+    for part in value.split(','):
+        part = part.strip()
+        if part in SIZES:
+            sizes.append(SIZES[part])
+        elif part.isdigit():
+            sizes.append(int(part))
+        else:
+            raise click.BadParameter(f"Unknown size: {part} (use {', '.join(SIZES)} or a number)")
+    return sizes
+
+
+def size_label(size: int) -> str:
+    return next((label for label, value in SIZES.items() if value == size), str(size))
+
+
+def summarize(scenario: str, size: int, latencies: List[float], elapsed: float, items: int) -> Dict:
+    """Wynik scenariusza; `items` - ile jednostek pracy (bloków, stron) zrobiono"""
+    latencies = sorted(latencies)
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000  # noqa: E731
+    return {
+        'scenario': scenario,
+        'blocks': size,
+        'ops': len(latencies),
+        'items': items,
+        'seconds': round(elapsed, 4),
+        'items_s': round(items / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(0.5), 3) if latencies else 0.0,
+        'p99_ms': round(percentile(0.99), 3) if latencies else 0.0,
+    }
+
+
+def timed(func: Callable, args: List[tuple], items: Callable = lambda result, *args: 1) -> tuple:
+    """Wywołuje `func(*a)` dla kolejnych `args`; zwraca (czasy, łączny czas, liczba jednostek pracy)"""
+    latencies = []
+    count = 0
+    started = time.perf_counter()
+    for a in args:
+        start = time.perf_counter()
+        result = func(*a)
+        latencies.append(time.perf_counter() - start)
+        count += items(result, *a)
+    return latencies, time.perf_counter() - started, count
+
+
+def post(page: List[Dict]) -> int:
+    status, _, _ = app.receive_payload({'blocks': page, 'metadata': {}})
+    if status != 200:
+        raise click.ClickException(f"Ingest failed with status {status}")
+    return status
+
+
+def ingest(size: int, page_size: int, seed: int, sample: int, options: Dict) -> tuple:
+    """Zapisuje korpus stronami przez receive_payload (jak POST /code-blocks)"""
+    reservoir: List[Dict] = []
+    rng = random.Random(seed)
+    latencies = []
+    started = time.perf_counter()
+    blocks = corpus.iter_blocks(size, seed, **options)
+    for n, page in enumerate(corpus.iter_pages(blocks, page_size)):
+        start = time.perf_counter()
+        post(page)
+        latencies.append(time.perf_counter() - start)
+        # Próbka bloków do scenariusza deduplikacji (reservoir sampling)
+        for i, block in enumerate(page):
+            seen = n * page_size + i
+            if len(reservoir) < sample:
+                reservoir.append(block)
+            elif rng.randrange(seen + 1) < sample:
+                reservoir[rng.randrange(sample)] = block
+    return summarize('ingest', size, latencies, time.perf_counter() - started, size), reservoir
+
+
+def dedupe(size: int, reservoir: List[Dict], page_size: int, seed: int) -> Dict:
+    """Strony już zapisanych bloków w nowym układzie - odrzuca je warstwa deduplikacji"""
+    rng = random.Random(seed)
+    blocks = reservoir[:]
+    rng.shuffle(blocks)
+    pages = [(page,) for page in corpus.iter_pages(iter(blocks), page_size)]
+    return summarize('dedupe', size, *timed(post, pages, lambda result, page: len(page)))
+
+
+def sample_rows(table: str, columns: str, count: int, seed: int) -> List[tuple]:
+    """Losowe wiersze wybrane po rowid - powtarzalne dla seeda i bez wczytywania tabeli"""
+    with app.get_db() as conn:
+        last = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        rowids = random.Random(seed).sample(range(1, last + 1), min(count, last))
+        return conn.execute(f"""
+            SELECT {columns} FROM {table} WHERE rowid IN ({', '.join('?' * len(rowids))})
+        """, rowids).fetchall()
+
+
+def similar(size: int, ops: int, seed: int) -> Dict:
+    hashes = sample_rows('code_blocks', 'hash', ops, seed)
+    return summarize('similar', size, *timed(app.similar_blocks_of, hashes))
+
+
+def listing(size: int, ops: int, seed: int) -> Dict:
+    """Kolejne strony po kursorze od najnowszych, co druga z filtrem platformy"""
+    rng = random.Random(seed)
+    platforms = [(rng.choice(list(corpus.PLATFORMS)) if i % 2 else None,) for i in range(ops)]
+    after = None
+
+    def page(platform_name):
+        nonlocal after
+        if platform_name:
+            return app.list_code_blocks(platform_name, None, LIST_PAGE_SIZE)
+        blocks = app.list_code_blocks(None, None, LIST_PAGE_SIZE, after)
+        # Po ostatniej stronie od początku
+        after = app.parse_cursor(app.format_cursor(blocks[-1])) if len(blocks) == LIST_PAGE_SIZE else None
+        return blocks
+
+    return summarize('listing', size, *timed(page, platforms, lambda blocks, *args: len(blocks)))
+
+
+def diff(size: int, ops: int, seed: int) -> Dict:
+    """Diffy par podobnych bloków (bez pamięci podręcznej diffów)"""
+    pairs = sample_rows('similar_blocks', 'block_hash, similar_hash', ops, seed)
+    if len(pairs) < ops:
+        hashes = [row[0] for row in sample_rows('code_blocks', 'hash', 2 * (ops - len(pairs)), seed)]
+        pairs += list(zip(hashes[::2], hashes[1::2]))
+    app.diff_cache.clear()
+    return summarize('diff', size, *timed(app.blocks_diff, pairs))
+
+
+def run_size(size: int, scenarios: tuple, page_size: int, ops: int, seed: int,
+             options: Dict, work_dir: Path) -> List[Dict]:
+    """Wszystkie scenariusze na świeżej bazie z `size` blokami"""
+    directory = Path(tempfile.mkdtemp(prefix=f'bench-{size_label(size)}-', dir=work_dir))
+    with ExitStack() as stack:
+        stack.callback(shutil.rmtree, directory, ignore_errors=True)
+        stack.callback(app.db.close_all)
+        stack.enter_context(patch.object(app, 'DB_PATH', str(directory / 'code_blocks.db')))
+        stack.enter_context(patch.object(app, 'STORAGE_DIR', directory / 'code_blocks'))
+        stack.enter_context(patch.object(app, 'ASYNC_INGEST', False))
+        app.STORAGE_DIR.mkdir()
+        app.init_db()
+
+        ingested, reservoir = ingest(size, page_size, seed, ops * page_size, options)
+        results = [ingested] if 'ingest' in scenarios else []
+        if 'dedupe' in scenarios:
+            results.append(dedupe(size, reservoir, page_size, seed))
+        if 'similar' in scenarios:
+            results.append(similar(size, ops, seed))
+        if 'listing' in scenarios:
+            results.append(listing(size, ops, seed))
+        if 'diff' in scenarios:
+            results.append(diff(size, ops, seed))
+        return results
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent.parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'storage_backend': app.STORAGE_BACKEND,
+        'compression': app.COMPRESSION,
+        'scoring_pool_size': app.SCORING_POOL_SIZE,
+    }
+
+
+def mean_ms(result: Dict) -> float:
+    return result['seconds'] / result['ops'] * 1000 if result['ops'] else 0.0
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = TOLERANCE,
+            min_delta_ms: float = MIN_DELTA_MS) -> List[Dict]:
+    """Wiersze porównania; `regression` - przepustowość spadła albo p50 wzrosło o więcej niż `tolerance`"""
+    before = {(r['scenario'], r['blocks']): r for r in baseline['results']}
+    rows = []
+    for result in current['results']:
+        old = before.get((result['scenario'], result['blocks']))
+        if old is None:
+            continue
+        throughput = result['items_s'] / old['items_s'] - 1 if old['items_s'] else 0.0
+        latency = result['p50_ms'] / old['p50_ms'] - 1 if old['p50_ms'] else 0.0
+        rows.append({
+            'scenario': result['scenario'],
+            'blocks': result['blocks'],
+            'items_s': (old['items_s'], result['items_s']),
+            'p50_ms': (old['p50_ms'], result['p50_ms']),
+            'throughput_change': throughput,
+            'p50_change': latency,
+            'regression': (throughput < -tolerance and mean_ms(result) - mean_ms(old) > min_delta_ms)
+                          or (latency > tolerance and result['p50_ms'] - old['p50_ms'] > min_delta_ms)
+        })
+    return rows
+
+
+def print_results(results: List[Dict]) -> None:
+    click.echo(f"{'scenario':<9} {'blocks':>7} {'ops':>6} {'items/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for r in results:
+        click.echo(f"{r['scenario']:<9} {size_label(r['blocks']):>7} {r['ops']:>6} {r['items_s']:>10.1f} "
+                   f"{r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f}")
+
+
+@click.group()
+def cli():
+    """Benchmarks on a synthetic corpus: run them, then compare with a baseline."""
+
+
+@cli.command('run')
+@click.option('--sizes', default='1k,10k', show_default=True, help='Corpus sizes: 1k,10k,100k,1M or numbers')
+@click.option('--scenarios', default=','.join(SCENARIOS), show_default=True)
+@click.option('--page-size', default=50, show_default=True, help='Blocks per ingest payload')
+@click.option('--ops', default=200, show_default=True, help='Operations per read scenario')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--duplicate-rate', default=0.05, show_default=True)
+@click.option('--near-duplicate-rate', default=0.2, show_default=True)
+@click.option('--min-lines', default=5, show_default=True)
+@click.option('--max-lines', default=60, show_default=True)
+@click.option('--languages', default=None, help='Language mix, e.g. python=2,go=1')
+@click.option('--platforms', default=None, help='Platform mix, e.g. github=3,discord=1')
+@click.option('--work-dir', type=click.Path(file_okay=False, path_type=Path), default=None,
+              help='Where to create the temporary databases (default: system temp)')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, path_type=Path),
+              default=Path('benchmarks/results/latest.json'), show_default=True)
+def run_command(sizes, scenarios, page_size, ops, seed, duplicate_rate, near_duplicate_rate,
+                min_lines, max_lines, languages, platforms, work_dir, output):
+    """Run the scenarios for every size and save the results as JSON."""
+    scenarios = tuple(name.strip() for name in scenarios.split(','))
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise click.BadParameter(f"Unknown scenarios: {', '.join(sorted(unknown))}", param_hint='--scenarios')
+    options = {
+        'duplicate_rate': duplicate_rate, 'near_duplicate_rate': near_duplicate_rate,
+        'min_lines': min_lines, 'max_lines': max_lines,
+        'languages': corpus.parse_mix(languages), 'platforms': corpus.parse_mix(platforms)
+    }
+
+    results = []
+    for size in parse_sizes(sizes):
+        click.echo(f"{size_label(size)} blocks...", err=True)
+        results.extend(run_size(size, scenarios, page_size, ops, seed, options, work_dir))
+
+    report = {
+        'environment': environment(),
+        'options': dict(options, page_size=page_size, ops=ops, seed=seed, scenarios=list(scenarios)),
+        'results': results
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print_results(results)
+    click.echo(f"Saved to {output}", err=True)
+
+
+@cli.command('compare')
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument('current', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+                default='benchmarks/results/latest.json')
+@click.option('--tolerance', default=TOLERANCE, show_default=True,
+              help='Allowed drop in items/s or rise in p50 (0.2 = 20%)')
+@click.option('--min-delta-ms', default=MIN_DELTA_MS, show_default=True,
+              help='Ignore changes of the time per operation smaller than this')
+def compare_command(baseline, current, tolerance, min_delta_ms):
+    """Compare results with a baseline; exits with 1 on a regression."""
+    rows = compare(json.loads(baseline.read_text()), json.loads(current.read_text()),
+                   tolerance, min_delta_ms)
+    if not rows:
+        raise click.ClickException("No common scenarios and sizes in the two files")
+
+    click.echo(f"{'scenario':<9} {'blocks':>7} {'items/s':>21} {'change':>8} {'p50 ms':>19} {'change':>8}")
+    for r in rows:
+        click.echo(f"{r['scenario']:<9} {size_label(r['blocks']):>7} "
+                   f"{r['items_s'][0]:>10.1f} {r['items_s'][1]:>10.1f} {r['throughput_change']:>+8.1%} "
+                   f"{r['p50_ms'][0]:>9.3f} {r['p50_ms'][1]:>9.3f} {r['p50_change']:>+8.1%}"
+                   f"{'  REGRESSION' if r['regression'] else ''}")
+    if any(r['regression'] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,138 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - wystarcza blokada w obrębie procesu
+    fcntl = None
+
+SEGMENT_SIZE = 256 * 1024 * 1024  # Po przekroczeniu zaczynamy nowy segment
+SEGMENT_PATTERN = 'segment-{:06d}.pack'
+
+# Nagłówek rekordu: surowy SHA-256 bloku i długość danych
+_HEADER = struct.Struct('>32sI')
+
+
+class BlobStore:
+    """Magazyn bloków w dopisywanych plikach segmentów.
+
+    Każdy rekord to nagłówek (hash, długość) i dane, więc segmenty da się
+    przejrzeć bez bazy. Baza przechowuje (segment, offset, długość) danych,
+    a odczyt idzie przez mmap bez kopiowania do bufora Pythona.
+    """
+
+    def __init__(self, directory: Path, segment_size: int = SEGMENT_SIZE):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self._maps: Dict[int, mmap.mmap] = {}
+
+    def segment_path(self, segment: int) -> Path:
+        return self.directory / SEGMENT_PATTERN.format(segment)
+
+    def _last_segment(self) -> int:
+        segments = [int(p.stem.split('-')[1]) for p in self.directory.glob('segment-*.pack')]
+        return max(segments, default=1)
+
+    def put(self, block_hash: str, data: bytes) -> Tuple[int, int, int]:
+        """Dopisuje dane i zwraca (segment, offset, długość)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            raw_hash = bytes.fromhex(block_hash)
+        except ValueError:
+            raw_hash = b''
+        if len(raw_hash) != 32:
+            raw_hash = hashlib.sha256(data).digest()
+        record = _HEADER.pack(raw_hash, len(data)) + data
+
+        with self._lock, open(self.directory / '.lock', 'a') as lock_file:
+            # Blokada pliku - segmenty współdzielą procesy serwera
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                segment = self._last_segment()
+                path = self.segment_path(segment)
+                size = path.stat().st_size if path.exists() else 0
+                if size and size + len(record) > self.segment_size:
+                    segment += 1
+                    path = self.segment_path(segment)
+                    size = 0
+
+                with open(path, 'ab') as f:
+                    f.write(record)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        return segment, size + _HEADER.size, len(data)
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            # Aktywny segment rośnie - mapujemy go ponownie w całości
+            with open(self.segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with self._lock:
+                self._maps[segment] = mapped
+        return mapped
+
+    def get(self, segment: int, offset: int, length: int) -> memoryview:
+        return memoryview(self._map(segment, offset + length))[offset:offset + length]
+
+    def scan(self) -> Iterator[Tuple[str, int, int, int]]:
+        """Przechodzi wszystkie rekordy: (hash, segment, offset, długość)"""
+        for path in sorted(self.directory.glob('segment-*.pack')):
+            segment = int(path.stem.split('-')[1])
+            with open(path, 'rb') as f:
+                offset = 0
+                while True:
+                    header = f.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        break
+                    raw_hash, length = _HEADER.unpack(header)
+                    offset += _HEADER.size
+                    yield raw_hash.hex(), segment, offset, length
+                    f.seek(length, os.SEEK_CUR)
+                    offset += length
+
+    def segments(self) -> List[int]:
+        """Numery istniejących segmentów, rosnąco"""
+        return sorted(int(p.stem.split('-')[1]) for p in self.directory.glob('segment-*.pack'))
+
+    def remove(self, segment: int) -> None:
+        """Usuwa segment, do którego nie odwołuje się już żaden blok"""
+        with self._lock:
+            mapped = self._maps.pop(segment, None)
+        if mapped is not None:
+            try:
+                mapped.close()
+            except BufferError:
+                pass
+        self.segment_path(segment).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            maps, self._maps = self._maps, {}
+        for mapped in maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # Ktoś nadal trzyma widok - mapa zniknie razem z nim
+
+
+_stores: Dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(directory: Path, segment_size: Optional[int] = None) -> BlobStore:
+    key = str(directory)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(key, BlobStore(directory, segment_size or SEGMENT_SIZE))
+    return store
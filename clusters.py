@@ -0,0 +1,241 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+MEMBER_COLUMNS = ('hash', 'language', 'platform', 'url', 'title', 'created_at', 'centrality')
+
+_CHUNK = 500  # Limit parametrów w jednym zapytaniu IN (...)
+
+
+class UnionFind:
+    """Zbiory rozłączne ze scalaniem według rozmiaru i skracaniem ścieżek"""
+
+    def __init__(self):
+        self.parent: Dict[Hashable, Hashable] = {}
+        self.size: Dict[Hashable, int] = {}
+
+    def add(self, item: Hashable, size: int = 1) -> None:
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = size
+
+    def find(self, item: Hashable) -> Hashable:
+        self.add(item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: Hashable, b: Hashable) -> Hashable:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+    def groups(self) -> Dict[Hashable, List[Hashable]]:
+        result = defaultdict(list)
+        for item in self.parent:
+            result[self.find(item)].append(item)
+        return result
+
+
+def init_schema(conn) -> None:
+    # Przynależność do klastra i centralność trzyma code_blocks (kolumny
+    # cluster_id i centrality), tu jest tylko rozmiar każdego klastra
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS clusters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        size INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clusters_size ON clusters (size, id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_code_blocks_cluster "
+        "ON code_blocks (cluster_id, centrality DESC, hash)"
+    )
+
+
+def _cluster_ids(conn, hashes: List[str]) -> Dict[str, Optional[int]]:
+    result = {}
+    for i in range(0, len(hashes), _CHUNK):
+        chunk = hashes[i:i + _CHUNK]
+        result.update(conn.execute(f"""
+            SELECT hash, cluster_id FROM code_blocks
+            WHERE hash IN ({', '.join('?' * len(chunk))})
+        """, chunk).fetchall())
+    return result
+
+
+def _create_cluster(conn, size: int) -> int:
+    return conn.execute(
+        "INSERT INTO clusters (size, updated_at) VALUES (?, ?)",
+        (size, datetime.utcnow().isoformat())
+    ).lastrowid
+
+
+def add_blocks(conn, hashes: Iterable[str], edges: Iterable[Tuple[str, str, float]]) -> None:
+    """Dołącza nowe bloki i ich krawędzie podobieństwa do klastrów.
+
+    Klastry połączone nową krawędzią są scalane: zostaje identyfikator
+    większego, a bloki mniejszych dostają go jednym UPDATE po indeksie.
+    Centralność bloku to suma podobieństw jego krawędzi.
+    """
+    hashes = list(hashes)
+    edges = list(edges)
+    new = set(hashes)
+
+    neighbours = list({h for edge in edges for h in edge[:2] if h not in new})
+    known = {h: cid for h, cid in _cluster_ids(conn, neighbours).items() if cid is not None}
+    sizes = {}
+    if known:
+        ids = sorted(set(known.values()))
+        for i in range(0, len(ids), _CHUNK):
+            chunk = ids[i:i + _CHUNK]
+            sizes.update(conn.execute(f"""
+                SELECT id, size FROM clusters WHERE id IN ({', '.join('?' * len(chunk))})
+            """, chunk).fetchall())
+
+    def node(block_hash):
+        return ('cluster', known[block_hash]) if block_hash in known else ('block', block_hash)
+
+    forest = UnionFind()
+    for block_hash in hashes:
+        forest.add(('block', block_hash))
+    for a, b, _ in edges:
+        forest.union(node(a), node(b))
+
+    now = datetime.utcnow().isoformat()
+    for members in forest.groups().values():
+        existing = sorted((item[1] for item in members if item[0] == 'cluster'),
+                          key=lambda cid: (-sizes.get(cid, 0), cid))
+        blocks = [item[1] for item in members if item[0] == 'block']
+        size = sum(sizes.get(cid, 0) for cid in existing) + len(blocks)
+
+        if existing:
+            cluster_id = existing[0]
+            for merged in existing[1:]:
+                conn.execute("UPDATE code_blocks SET cluster_id = ? WHERE cluster_id = ?",
+                             (cluster_id, merged))
+                conn.execute("DELETE FROM clusters WHERE id = ?", (merged,))
+            conn.execute("UPDATE clusters SET size = ?, updated_at = ? WHERE id = ?",
+                         (size, now, cluster_id))
+        else:
+            cluster_id = _create_cluster(conn, size)
+
+        conn.executemany("UPDATE code_blocks SET cluster_id = ? WHERE hash = ?",
+                         [(cluster_id, block_hash) for block_hash in blocks])
+
+    conn.executemany(
+        "UPDATE code_blocks SET centrality = centrality + ? WHERE hash = ?",
+        [(score, block_hash) for a, b, score in edges for block_hash in (a, b)]
+    )
+
+
+def rebuild(conn) -> int:
+    """Wylicza klastry od nowa z tabeli similar_blocks; zwraca ich liczbę"""
+    forest = UnionFind()
+    for (block_hash,) in conn.execute("SELECT hash FROM code_blocks"):
+        forest.add(block_hash)
+
+    centrality: Dict[str, float] = defaultdict(float)
+    for a, b, score in conn.execute(
+        "SELECT block_hash, similar_hash, similarity_score FROM similar_blocks"
+    ):
+        if a in forest.parent and b in forest.parent:
+            forest.union(a, b)
+            centrality[a] += score
+            centrality[b] += score
+
+    conn.execute("DELETE FROM clusters")
+    updates = []
+    groups = forest.groups()
+    for members in groups.values():
+        cluster_id = _create_cluster(conn, len(members))
+        updates.extend((cluster_id, centrality.get(h, 0.0), h) for h in members)
+    conn.executemany(
+        "UPDATE code_blocks SET cluster_id = ?, centrality = ? WHERE hash = ?", updates
+    )
+    return len(groups)
+
+
+def assign_missing(conn) -> int:
+    """Wylicza klastry, jeśli są bloki zapisane przed ich wprowadzeniem"""
+    if conn.execute("SELECT 1 FROM code_blocks WHERE cluster_id IS NULL LIMIT 1").fetchone():
+        return rebuild(conn)
+    return 0
+
+
+def global_id(cluster_id: int, shard: int, count: int) -> int:
+    """Identyfikator klastra unikalny między shardami (każdy shard numeruje klastry od 1)"""
+    return cluster_id * count + shard
+
+
+def get_cluster(conn, cluster_id: int, limit: int = 100) -> Optional[Dict]:
+    row = conn.execute("SELECT id, size FROM clusters WHERE id = ?", (cluster_id,)).fetchone()
+    if row is None:
+        return None
+
+    members = conn.execute(f"""
+        SELECT {', '.join(MEMBER_COLUMNS)} FROM code_blocks
+        WHERE cluster_id = ?
+        ORDER BY centrality DESC, hash
+        LIMIT ?
+    """, (cluster_id, limit)).fetchall()
+    return {
+        'id': row[0],
+        'size': row[1],
+        'members': [dict(zip(MEMBER_COLUMNS, member)) for member in members]
+    }
+
+
+def list_clusters(conn, min_size: int = 2, limit: int = 50, members: int = 5,
+                  after: Optional[Tuple[int, int]] = None, shard: int = 0, count: int = 1
+                  ) -> List[Dict]:
+    """Strona klastrów od największych, każdy z `members` najbardziej centralnymi blokami.
+
+    `after` to (rozmiar, id) ostatniego klastra poprzedniej strony. Przy `count`
+    shardach zwracany identyfikator to id * count + shard (patrz global_id).
+    """
+    conditions = ["size >= ?"]
+    params: list = [min_size]
+    if after:
+        # Największe lokalne id, którego identyfikator globalny jest mniejszy od kursora
+        conditions.append("(size, id) < (?, ?)")
+        params.extend([after[0], -((shard - after[1]) // count)])
+    params.extend([limit, members])
+
+    rows = conn.execute(f"""
+        WITH page AS (
+            SELECT id, size FROM clusters
+            WHERE {' AND '.join(conditions)}
+            ORDER BY size DESC, id DESC
+            LIMIT ?
+        ), ranked AS (
+            SELECT page.id AS cluster_id, page.size AS cluster_size,
+                   {', '.join('cb.' + column for column in MEMBER_COLUMNS)},
+                   ROW_NUMBER() OVER (
+                       PARTITION BY page.id ORDER BY cb.centrality DESC, cb.hash
+                   ) AS position
+            FROM page
+            JOIN code_blocks cb ON cb.cluster_id = page.id
+        )
+        SELECT * FROM ranked
+        WHERE position <= ?
+        ORDER BY cluster_size DESC, cluster_id DESC, position
+    """, params).fetchall()
+
+    result: List[Dict] = []
+    for row in rows:
+        cluster_id = global_id(row[0], shard, count)
+        if not result or result[-1]['id'] != cluster_id:
+            result.append({'id': cluster_id, 'size': row[1], 'members': []})
+        result[-1]['members'].append(dict(zip(MEMBER_COLUMNS, row[2:-1])))
+    return result
@@ -0,0 +1,98 @@
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+CODEC = 'zlib'
+DICTIONARY_SIZE = 32 * 1024  # Okno zlib - dłuższy słownik nie jest używany
+MIN_LINE_LENGTH = 4
+
+
+def train_dictionary(samples: Iterable[str], size: int = DICTIONARY_SIZE) -> bytes:
+    """Buduje słownik z linii powtarzających się w wielu próbkach.
+
+    Linie są oceniane jako (liczba dokumentów - 1) * długość, czyli ile
+    bajtów mogą zaoszczędzić. Najcenniejsze trafiają na koniec słownika,
+    najbliżej kompresowanych danych, bo zlib koduje bliższe odwołania taniej.
+    """
+    counts: Counter = Counter()
+    for text in samples:
+        counts.update(
+            line for line in set(text.splitlines())
+            if len(line.strip()) >= MIN_LINE_LENGTH
+        )
+
+    ranked = sorted(
+        (line for line, count in counts.items() if count > 1),
+        key=lambda line: ((counts[line] - 1) * len(line), line),
+        reverse=True
+    )
+
+    pieces = []
+    total = 0
+    for line in ranked:
+        piece = (line + '\n').encode('utf-8')
+        if total + len(piece) > size:
+            continue
+        pieces.append(piece)
+        total += len(piece)
+
+    return b''.join(reversed(pieces))
+
+
+def compress(data: bytes, dictionary: Optional[bytes] = None, level: int = 6) -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(level, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+    if dictionary:
+        decompressor = zlib.decompressobj(zdict=dictionary)
+    else:
+        decompressor = zlib.decompressobj()
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def init_schema(conn) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS compression_dicts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dictionary BLOB NOT NULL,
+        sample_count INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
+
+
+def store_dictionary(conn, dictionary: bytes, sample_count: int) -> int:
+    cursor = conn.execute("""
+        INSERT INTO compression_dicts (dictionary, sample_count, created_at)
+        VALUES (?, ?, ?)
+    """, (dictionary, sample_count, datetime.utcnow().isoformat()))
+    return cursor.lastrowid
+
+
+def latest_dictionary_id(conn) -> Optional[int]:
+    return conn.execute("SELECT MAX(id) FROM compression_dicts").fetchone()[0]
+
+
+def load_dictionary(conn, dict_id: int) -> bytes:
+    row = conn.execute(
+        "SELECT dictionary FROM compression_dicts WHERE id = ?", (dict_id,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"Compression dictionary {dict_id} not found")
+    return row[0]
+
+
+def measure(samples: Iterable[bytes], dictionary: Optional[bytes], level: int = 6
+            ) -> Tuple[int, int]:
+    """Zwraca (bajty przed, bajty po) kompresji próbek"""
+    before = after = 0
+    for data in samples:
+        before += len(data)
+        after += len(compress(data, dictionary, level))
+    return before, after
@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Ustawienia każdego nowego połączenia
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",          # Czytelnicy nie blokują piszącego
+    "PRAGMA synchronous = NORMAL",        # W trybie WAL nadal bezpieczne po awarii procesu
+    "PRAGMA mmap_size = 268435456",       # 256 MB pliku bazy mapowane w pamięć
+    "PRAGMA cache_size = -65536",         # 64 MB cache stron na połączenie
+    "PRAGMA temp_store = MEMORY",
+)
+BUSY_TIMEOUT = 30.0       # Sekundy oczekiwania na blokadę zapisu
+CACHED_STATEMENTS = 256   # Rozmiar cache przygotowanych zapytań na połączenie
+MAX_IDLE = 16             # Ile wolnych połączeń trzymamy w puli
+
+# observer(etap, sekundy) dostaje czasy 'db_connect', 'db_transaction' i 'db_commit';
+# bez niego pula nie mierzy czasu
+observer: Optional[Callable[[str, float], None]] = None
+
+
+class Connection(sqlite3.Connection):
+    """Połączenie z puli; pamięta ścieżkę bazy (np. do kluczy pamięci podręcznych)"""
+    path = ''
+
+
+class ConnectionPool:
+    """Pula długo żyjących połączeń do jednej bazy SQLite.
+
+    Wątek dostaje połączenie na czas bloku `with pool.connection()`.
+    Zagnieżdżone bloki w tym samym wątku dostają to samo połączenie
+    i wspólną transakcję, zatwierdzaną przy wyjściu z najbardziej
+    zewnętrznego bloku. Po zwolnieniu połączenie wraca do puli razem
+    z cache przygotowanych zapytań, więc kolejne żądania go nie tracą.
+    """
+
+    def __init__(self, path: str, max_idle: int = MAX_IDLE):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+            factory=Connection
+        )
+        conn.path = self.path
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        observe = observer
+        started = time.perf_counter() if observe else 0.0
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+            if observe:
+                observe('db_connect', time.perf_counter() - started)
+
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+                committing = time.perf_counter() if observe else 0.0
+            if observe:
+                finished = time.perf_counter()
+                observe('db_commit', finished - committing)
+                observe('db_transaction', finished - started)
+        finally:
+            self._local.conn = None
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str) -> ConnectionPool:
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def close_all() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,156 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+BLOOM_CAPACITY = 1_000_000  # Minimalna liczba hashy, na którą liczymy filtr
+BLOOM_ERROR_RATE = 0.01
+LRU_SIZE = 100_000          # Ostatnio widziane hashe trzymane dokładnie
+
+
+class BloomFilter:
+    """Filtr Blooma nad hashami SHA-256 bloków.
+
+    Hash jest już równomiernie rozłożony, więc pozycje bitów bierzemy
+    z jego dwóch fragmentów (podwójne haszowanie) bez liczenia nowych skrótów.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        self.capacity = max(capacity, 1)
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, block_hash: str) -> List[int]:
+        try:
+            h1 = int(block_hash[:16], 16)
+            h2 = int(block_hash[16:32], 16) | 1
+        except ValueError:
+            digest = hashlib.sha256(block_hash.encode('utf-8')).digest()
+            h1 = int.from_bytes(digest[:8], 'big')
+            h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, block_hash: str) -> None:
+        for position in self._positions(block_hash):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, block_hash: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(block_hash))
+
+    @property
+    def saturated(self) -> bool:
+        # Po przekroczeniu pojemności rośnie tylko odsetek fałszywych trafień
+        return self.count > self.capacity
+
+
+class DedupeCache:
+    """Szybka ścieżka odrzucania powtórzonych bloków przed zapytaniem do bazy.
+
+    - hash w LRU ostatnio widzianych -> na pewno zapisany, bez bazy,
+    - hasha nie ma w filtrze Blooma -> na pewno nowy, bez bazy,
+    - w pozostałych przypadkach rozstrzyga zapytanie do bazy.
+
+    Bloki zapisane przez inne procesy nie trafiają do filtru, ale to tylko
+    przepuszcza je dalej - zapis i tak sprawdza hashe w transakcji.
+    """
+
+    COUNTERS = ('lru_hits', 'bloom_negatives', 'db_lookups', 'db_hits', 'false_positives')
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, lru_size: int = LRU_SIZE,
+                 error_rate: float = BLOOM_ERROR_RATE):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.lru_size = lru_size
+        self.stats: Dict[str, int] = dict.fromkeys(self.COUNTERS, 0)
+        self._recent: 'OrderedDict[str, None]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, block_hash: str) -> None:
+        self._recent[block_hash] = None
+        self._recent.move_to_end(block_hash)
+        while len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+
+    def add(self, hashes: Iterable[str]) -> None:
+        with self._lock:
+            for block_hash in hashes:
+                if block_hash not in self._recent:
+                    self.bloom.add(block_hash)
+                self._remember(block_hash)
+
+    def discard(self, hashes: Iterable[str]) -> None:
+        """Zapomina bloki usunięte z bazy roboczej.
+
+        Filtr Blooma zostaje bez zmian - jego trafienia i tak sprawdza baza.
+        """
+        with self._lock:
+            for block_hash in hashes:
+                self._recent.pop(block_hash, None)
+
+    def known(self, hashes: Iterable[str], lookup: Callable[[List[str]], Set[str]]) -> Set[str]:
+        """Hashe już zapisane; `lookup` pyta bazę tylko o niepewne"""
+        known = set()
+        uncertain = []
+        with self._lock:
+            for block_hash in hashes:
+                if block_hash in self._recent:
+                    self._recent.move_to_end(block_hash)
+                    self.stats['lru_hits'] += 1
+                    known.add(block_hash)
+                elif block_hash not in self.bloom:
+                    self.stats['bloom_negatives'] += 1
+                else:
+                    uncertain.append(block_hash)
+
+        if uncertain:
+            found = lookup(uncertain)
+            with self._lock:
+                self.stats['db_lookups'] += len(uncertain)
+                self.stats['db_hits'] += len(found)
+                self.stats['false_positives'] += len(uncertain) - len(found)
+                for block_hash in found:
+                    self._remember(block_hash)
+            known |= found
+        return known
+
+
+def warm(conn, capacity: int = BLOOM_CAPACITY, lru_size: int = LRU_SIZE,
+         error_rate: float = BLOOM_ERROR_RATE, table: str = 'code_blocks') -> DedupeCache:
+    """Buduje pamięć podręczną ze wszystkich hashy w bazie.
+
+    `table` to tabela z kolumnami hash i created_at - przy podziale
+    na shardy mapa bloków w katalogu (block_shards).
+    """
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    cache = DedupeCache(max(capacity, 2 * total), lru_size, error_rate)
+    for (block_hash,) in conn.execute(f"SELECT hash FROM {table}"):
+        cache.bloom.add(block_hash)
+
+    recent = conn.execute(
+        f"SELECT hash FROM {table} ORDER BY created_at DESC, hash DESC LIMIT ?", (lru_size,)
+    ).fetchall()
+    for (block_hash,) in reversed(recent):
+        cache._remember(block_hash)
+    return cache
+
+
+_caches: Dict[str, DedupeCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path: str) -> Optional[DedupeCache]:
+    return _caches.get(path)
+
+
+def set_cache(path: str, cache: DedupeCache) -> None:
+    with _caches_lock:
+        _caches[path] = cache
+
+
+def drop_cache(path: str) -> None:
+    with _caches_lock:
+        _caches.pop(path, None)
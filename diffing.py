@@ -0,0 +1,228 @@
+import difflib
+import threading
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+FALLBACK_MAX_CELLS = 250_000  # Do takiego iloczynu długości luki używamy SequenceMatcher
+NO_NEWLINE = '\\ No newline at end of file\n'
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+def intern_lines(*texts: str) -> List[List[int]]:
+    """Zamienia linie na numery - porównujemy liczby, a nie napisy"""
+    ids: Dict[str, int] = {}
+    return [[ids.setdefault(line, len(ids)) for line in text.splitlines(keepends=True)]
+            for text in texts]
+
+
+def _unique_anchors(a: Sequence[int], alo: int, ahi: int,
+                    b: Sequence[int], blo: int, bhi: int) -> List[Tuple[int, int]]:
+    """Najdłuższy rosnący ciąg par linii występujących dokładnie raz po obu stronach"""
+    counts_a = Counter(a[alo:ahi])
+    counts_b = Counter(b[blo:bhi])
+    positions_b = {
+        line: j for j, line in enumerate(b[blo:bhi], blo)
+        if counts_b[line] == 1 and counts_a[line] == 1
+    }
+    pairs = [(i, positions_b[line]) for i, line in enumerate(a[alo:ahi], alo) if line in positions_b]
+    if not pairs:
+        return []
+
+    # Sortowanie cierpliwościowe po pozycji w b
+    tails: List[int] = []
+    tail_index: List[int] = []
+    previous: List[int] = []
+    for k, (_, j) in enumerate(pairs):
+        pile = bisect_left(tails, j)
+        if pile == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pile] = j
+            tail_index[pile] = k
+        previous.append(tail_index[pile - 1] if pile else -1)
+
+    anchors = []
+    k = tail_index[-1]
+    while k >= 0:
+        anchors.append(pairs[k])
+        k = previous[k]
+    anchors.reverse()
+    return anchors
+
+
+def patience_matches(a: Sequence[int], b: Sequence[int]) -> List[Tuple[int, int]]:
+    """Pary równych linii (i, j) wyznaczone algorytmem patience diff.
+
+    Luki bez unikalnych linii porównuje SequenceMatcher, o ile są małe;
+    większe zostają zamianą w całości, więc czas nie rośnie kwadratowo.
+    """
+    matches = []
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        alo, ahi, blo, bhi = ranges.pop()
+
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            for i, j in anchors:
+                matches.append((i, j))
+                ranges.append((alo, i, blo, j))
+                alo, blo = i + 1, j + 1
+            ranges.append((alo, ahi, blo, bhi))
+        elif (ahi - alo) * (bhi - blo) <= FALLBACK_MAX_CELLS:
+            matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks():
+                matches.extend((alo + i + k, blo + j + k) for k in range(size))
+
+    matches.sort()
+    return matches
+
+
+def opcodes(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Opcode]:
+    """Operacje w formacie SequenceMatcher.get_opcodes()"""
+    codes: List[Opcode] = []
+    i = j = 0
+    for mi, mj in patience_matches(a, b) + [(len(a), len(b))]:
+        if i < mi and j < mj:
+            codes.append(('replace', i, mi, j, mj))
+        elif i < mi:
+            codes.append(('delete', i, mi, j, j))
+        elif j < mj:
+            codes.append(('insert', i, i, j, mj))
+
+        if mi < len(a):
+            if codes and codes[-1][0] == 'equal':
+                tag, i1, _, j1, _ = codes[-1]
+                codes[-1] = (tag, i1, mi + 1, j1, mj + 1)
+            else:
+                codes.append(('equal', mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return codes
+
+
+def grouped_opcodes(codes: List[Opcode], n: int = 3) -> Iterator[List[Opcode]]:
+    """Grupy zmian z `n` liniami kontekstu (jak SequenceMatcher.get_grouped_opcodes)"""
+    codes = list(codes) or [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    return f"{start + 1 if length else start},{length}"
+
+
+def _diff_lines(old: str, new: str, fromfile: str, tofile: str, context: int) -> Iterator[str]:
+    a_lines = old.splitlines(keepends=True)
+    b_lines = new.splitlines(keepends=True)
+    a, b = intern_lines(old, new)
+
+    started = False
+    for group in grouped_opcodes(opcodes(a, b), context):
+        if not started:
+            started = True
+            yield f"--- {fromfile}\n"
+            yield f"+++ {tofile}\n"
+
+        first, last = group[0], group[-1]
+        yield f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@\n"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                lines = [(' ', line) for line in a_lines[i1:i2]]
+            else:
+                lines = [('-', line) for line in a_lines[i1:i2]]
+                lines += [('+', line) for line in b_lines[j1:j2]]
+            for prefix, line in lines:
+                yield prefix + line
+                if not line.endswith('\n'):
+                    yield '\n' + NO_NEWLINE
+
+
+def unified_diff(old: str, new: str, fromfile: str = 'a', tofile: str = 'b',
+                 context: int = 3, max_bytes: Optional[int] = None) -> Tuple[str, bool]:
+    """Diff w formacie unified; zwraca (tekst, czy obcięty do `max_bytes`)"""
+    pieces = []
+    size = 0
+    for piece in _diff_lines(old, new, fromfile, tofile, context):
+        size += len(piece.encode('utf-8'))
+        if max_bytes is not None and size > max_bytes:
+            return ''.join(pieces), True
+        pieces.append(piece)
+    return ''.join(pieces), False
+
+
+class DiffCache:
+    """Pamięć podręczna LRU gotowych diffów ograniczona łącznym rozmiarem.
+
+    Bloki są niezmienne, więc wpis dla danej pary nigdy się nie dezaktualizuje.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[str, bool]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Tuple[str, bool]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: Tuple[str, bool]) -> None:
+        entry_size = len(entry[0])
+        if entry_size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[key] = entry
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,198 @@
+import json
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Typy zdarzeń
+BLOCK_ADDED = 'block'
+SIMILAR_FOUND = 'similar'
+
+RETENTION = 100_000       # Ile ostatnich zdarzeń trzymamy do wznawiania strumieni
+PRUNE_EVERY = 1000        # Co ile zdarzeń usuwamy najstarsze
+SUBSCRIBER_BUFFER = 1000  # Zdarzenia czekające na wolnego klienta
+
+
+def init_schema(conn) -> None:
+    # AUTOINCREMENT - numer zdarzenia nigdy się nie powtarza, także po usunięciu starych
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS change_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
+
+
+def record(conn, events: List[Tuple[str, Dict]]) -> List[Dict]:
+    """Zapisuje zdarzenia w bieżącej transakcji i zwraca je z numerami.
+
+    Opublikować je należy dopiero po zatwierdzeniu transakcji, żeby klient
+    nie dostał zdarzenia o bloku, którego jeszcze nie widać w bazie.
+    """
+    created_at = datetime.utcnow().isoformat()
+    recorded = []
+    for event_type, data in events:
+        cursor = conn.execute(
+            "INSERT INTO change_events (type, payload, created_at) VALUES (?, ?, ?)",
+            (event_type, json.dumps(data), created_at)
+        )
+        recorded.append({'seq': cursor.lastrowid, 'type': event_type, 'data': data})
+
+    if recorded and (recorded[0]['seq'] - 1) // PRUNE_EVERY != recorded[-1]['seq'] // PRUNE_EVERY:
+        conn.execute("DELETE FROM change_events WHERE seq <= ?", (recorded[-1]['seq'] - RETENTION,))
+    return recorded
+
+
+def events_after(conn, seq: int, limit: int = 1000) -> List[Dict]:
+    rows = conn.execute("""
+        SELECT seq, type, payload FROM change_events
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    """, (seq, limit)).fetchall()
+    return [{'seq': row[0], 'type': row[1], 'data': json.loads(row[2])} for row in rows]
+
+
+def last_seq(conn) -> int:
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_events").fetchone()[0]
+
+
+def format_sse(event: Dict) -> str:
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class Subscription:
+    """Kolejka zdarzeń jednego klienta.
+
+    Gdy klient nie nadąża i bufor się zapełni, subskrypcja jest oznaczana
+    jako przepełniona - strumień kończy się, a klient wznawia go od
+    Last-Event-ID, doczytując zaległości z bazy.
+    """
+
+    def __init__(self, bus: 'EventBus', maxsize: int):
+        self._bus = bus
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self.overflowed = False
+        self.closed = False
+
+    @property
+    def active(self) -> bool:
+        return not (self.overflowed or self.closed)
+
+    def put(self, event: Optional[Dict]) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Następne zdarzenie albo None po upływie `timeout` lub zamknięciu szyny"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self._bus.unsubscribe(self)
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class EventBus:
+    """Szyna zdarzeń w obrębie procesu; zasilana przez ścieżkę zapisu"""
+
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self, self.buffer_size)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, events: List[Dict]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            for subscription in subscribers:
+                subscription.put(event)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def close(self) -> None:
+        """Kończy wszystkie strumienie (np. przy zamykaniu procesu serwera)"""
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscription in subscribers:
+            subscription.closed = True
+            subscription.put(None)  # Budzi wątek czekający na zdarzenie
+
+
+class Relay:
+    """Przekazuje na szynę zdarzenia zapisane przez inne procesy serwera.
+
+    Wątek trzyma własne połączenie i co `interval` sekund sprawdza
+    PRAGMA data_version - zmienia się tylko po zatwierdzeniu zapisu przez
+    inne połączenie, więc bez zmian w bazie nie czyta żadnej tabeli.
+    Zdarzenia idą na szynę w kolejności numerów, także te zapisane
+    przez bieżący proces.
+    """
+
+    def __init__(self, bus: EventBus, path: str, interval: float = 0.2):
+        self.bus = bus
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='event-relay', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            last = last_seq(conn)
+            while not self._stop.wait(self.interval):
+                try:
+                    version, last = self._forward(conn, version, last)
+                except sqlite3.Error as e:
+                    print(f"Błąd przekazywania zdarzeń: {e}")
+        finally:
+            conn.close()
+
+    def _forward(self, conn, version: int, last: int) -> Tuple[int, int]:
+        current = conn.execute("PRAGMA data_version").fetchone()[0]
+        if current == version:
+            return version, last
+        if not self.bus.subscriber_count():
+            # Nikt nie słucha - wznawiający klienci doczytają zaległości z bazy
+            return current, last_seq(conn)
+        while True:
+            batch = events_after(conn, last)
+            if not batch:
+                return current, last
+            self.bus.publish(batch)
+            last = batch[-1]['seq']
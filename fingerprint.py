@@ -0,0 +1,194 @@
+import keyword
+import re
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Odcisk bloku do liczenia podobieństwa: ciąg tokenów po normalizacji
+# zależnej od języka (bez komentarzy i białych znaków, opcjonalnie ze
+# wspólną nazwą dla identyfikatorów), każdy token zapisany jako crc32.
+# Ciąg jest kilka razy krótszy od tekstu, a przeformatowanie kodu lub
+# dopisany komentarz go nie zmieniają.
+
+VERSION = 1                  # Zmiana reguł normalizacji = nowa wersja i przeliczenie odcisków
+CANONICAL_IDENTIFIER = 'ID'  # Wspólna nazwa identyfikatorów w trybie `canonical`
+
+ALIASES = {
+    'py': 'python', 'python3': 'python', 'js': 'javascript', 'jsx': 'javascript', 'node': 'javascript',
+    'ts': 'typescript', 'tsx': 'typescript', 'c++': 'cpp', 'cc': 'cpp', 'h': 'c', 'hpp': 'cpp',
+    'cs': 'csharp', 'c#': 'csharp', 'golang': 'go', 'rs': 'rust', 'rb': 'ruby', 'kt': 'kotlin',
+    'sh': 'bash', 'shell': 'bash', 'zsh': 'bash', 'console': 'bash', 'yml': 'yaml',
+    'postgresql': 'sql', 'mysql': 'sql', 'sqlite': 'sql', 'htm': 'html', 'svg': 'xml',
+}
+
+_C_STYLE = (r'//[^\n]*', r'/\*[\s\S]*?(?:\*/|$)')
+_HASH = (r'#[^\n]*',)
+COMMENTS = {
+    'python': _HASH, 'ruby': _HASH, 'bash': _HASH, 'yaml': _HASH, 'r': _HASH, 'perl': _HASH,
+    'powershell': _HASH + (r'<#[\s\S]*?(?:#>|$)',),
+    'javascript': _C_STYLE, 'typescript': _C_STYLE, 'java': _C_STYLE, 'c': _C_STYLE,
+    'cpp': _C_STYLE, 'csharp': _C_STYLE, 'go': _C_STYLE, 'rust': _C_STYLE, 'kotlin': _C_STYLE,
+    'swift': _C_STYLE, 'scala': _C_STYLE, 'dart': _C_STYLE, 'css': _C_STYLE[1:],
+    'scss': _C_STYLE, 'php': _C_STYLE + _HASH,
+    'sql': (r'--[^\n]*', _C_STYLE[1]), 'lua': (r'--\[\[[\s\S]*?(?:\]\]|$)', r'--[^\n]*'),
+    'haskell': (r'\{-[\s\S]*?(?:-\}|$)', r'--[^\n]*'),
+    'html': (r'<!--[\s\S]*?(?:-->|$)',), 'xml': (r'<!--[\s\S]*?(?:-->|$)',),
+}
+
+_C_KEYWORDS = {'if', 'else', 'for', 'while', 'do', 'switch', 'case', 'default', 'break', 'continue',
+               'return', 'goto', 'struct', 'union', 'enum', 'typedef', 'const', 'static', 'extern',
+               'void', 'int', 'char', 'long', 'short', 'float', 'double', 'unsigned', 'signed',
+               'sizeof', 'true', 'false', 'null', 'new', 'delete', 'class', 'public', 'private',
+               'protected', 'this', 'try', 'catch', 'throw', 'finally', 'import', 'package'}
+KEYWORDS = {
+    'python': set(keyword.kwlist) | {'self', 'cls', 'print', 'len', 'range'},
+    'javascript': _C_KEYWORDS | {'function', 'var', 'let', 'async', 'await', 'yield', 'typeof',
+                                 'instanceof', 'undefined', 'of', 'in', 'export', 'from', 'extends'},
+    'java': _C_KEYWORDS | {'boolean', 'byte', 'extends', 'implements', 'interface', 'final',
+                           'abstract', 'throws', 'instanceof', 'super', 'synchronized', 'var'},
+    'go': {'break', 'case', 'chan', 'const', 'continue', 'default', 'defer', 'else', 'fallthrough',
+           'for', 'func', 'go', 'goto', 'if', 'import', 'interface', 'map', 'package', 'range',
+           'return', 'select', 'struct', 'switch', 'type', 'var', 'nil', 'true', 'false', 'err',
+           'int', 'string', 'bool', 'error', 'byte', 'len', 'make', 'append'},
+    'rust': {'as', 'break', 'const', 'continue', 'crate', 'else', 'enum', 'extern', 'false', 'fn',
+             'for', 'if', 'impl', 'in', 'let', 'loop', 'match', 'mod', 'move', 'mut', 'pub', 'ref',
+             'return', 'self', 'Self', 'static', 'struct', 'super', 'trait', 'true', 'type',
+             'unsafe', 'use', 'where', 'while', 'async', 'await', 'dyn', 'Some', 'None', 'Ok', 'Err'},
+    'sql': {word for word in (
+        'select from where and or not insert into values update set delete create table index '
+        'drop alter join left right inner outer on group by order having limit offset as null '
+        'is in like between distinct union all primary key references default exists case when '
+        'then else end asc desc count sum avg min max').split()},
+}
+KEYWORDS['typescript'] = KEYWORDS['javascript'] | {'interface', 'type', 'implements', 'readonly',
+                                                   'enum', 'namespace', 'declare', 'any', 'number',
+                                                   'string', 'boolean', 'keyof', 'as'}
+KEYWORDS['kotlin'] = KEYWORDS['java'] | {'fun', 'val', 'when', 'is', 'object', 'companion', 'data'}
+KEYWORDS['csharp'] = KEYWORDS['java'] | {'using', 'namespace', 'var', 'async', 'await', 'string'}
+for _language in ('c', 'cpp', 'swift', 'scala', 'dart', 'php'):
+    KEYWORDS[_language] = _C_KEYWORDS | {'function', 'fn', 'func', 'def', 'let', 'var', 'val'}
+
+CASE_INSENSITIVE = {'sql'}
+
+_STRINGS = (r'"""[\s\S]*?(?:"""|$)', r"'''[\s\S]*?(?:'''|$)",
+            r'"(?:\\.|[^"\\\n])*"?', r"'(?:\\.|[^'\\\n])*'?", r'`(?:\\.|[^`\\])*`?')
+_TOKENS = (
+    r'(?P<number>\d[\w.]*)',
+    r'(?P<name>[^\W\d]\w*)',
+    r'(?P<operator>===|!==|\*\*=|//=|>>=|<<=|\.\.\.|::|->|=>|\+\+|--|&&|\|\||[-+*/%&|^<>!=:]=|<<|>>|\*\*)',
+    r'(?P<other>\S)',
+)
+_patterns: Dict[str, 're.Pattern'] = {}
+
+
+def language_key(language: str) -> str:
+    language = (language or '').strip().lower()
+    return ALIASES.get(language, language)
+
+
+def _pattern(language: str) -> 're.Pattern':
+    pattern = _patterns.get(language)
+    if pattern is None:
+        # Przy każdej pozycji wygrywa pierwsza pasująca alternatywa,
+        # więc znacznik komentarza wewnątrz napisu zostaje częścią napisu
+        comments = '|'.join(COMMENTS.get(language, ()))
+        strings = '|'.join(_STRINGS if language == 'python' else _STRINGS[2:])
+        pattern = re.compile('|'.join(filter(None, (
+            f'(?P<comment>{comments})' if comments else '',
+            f'(?P<string>{strings})',
+            *_TOKENS
+        ))))
+        _patterns[language] = pattern
+    return pattern
+
+
+def tokenize(code: str, language: str, canonical: bool = False) -> List[str]:
+    """Tokeny kodu bez komentarzy i białych znaków.
+
+    W trybie `canonical` identyfikatory inne niż słowa kluczowe języka
+    zastępuje CANONICAL_IDENTIFIER, więc zmiana nazw nie zmienia wyniku.
+    """
+    language = language_key(language)
+    keywords = KEYWORDS.get(language, _C_KEYWORDS)
+    fold = language in CASE_INSENSITIVE
+    tokens = []
+    for match in _pattern(language).finditer(code):
+        kind = match.lastgroup
+        if kind == 'comment':
+            continue
+        token = match.group()
+        if canonical and kind == 'name' and (token.lower() if fold else token) not in keywords:
+            token = CANONICAL_IDENTIFIER
+        tokens.append(token)
+    return tokens
+
+
+def fingerprint(code: str, language: str, canonical: bool = False) -> bytes:
+    """Ciąg tokenów jako crc32 po 4 bajty - do zapisu w bazie"""
+    tokens = tokenize(code, language, canonical)
+    return array('I', [zlib.crc32(token.encode('utf-8')) for token in tokens]).tobytes()
+
+
+def from_bytes(data: bytes) -> array:
+    tokens = array('I')
+    tokens.frombytes(data)
+    return tokens
+
+
+def scheme(canonical: bool = False) -> str:
+    """Nazwa wariantu odcisku; odciski innych wariantów przeliczamy"""
+    return f"tokens-v{VERSION}{'-canonical' if canonical else ''}"
+
+
+def init_schema(conn) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS block_tokens (
+        hash TEXT PRIMARY KEY,
+        scheme TEXT NOT NULL,
+        tokens BLOB NOT NULL
+    )
+    """)
+
+
+def store(conn, name: str, blocks: Iterable[Tuple[str, bytes]]) -> None:
+    """Zapisuje odciski podane jako (hash, odcisk)"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO block_tokens (hash, scheme, tokens) VALUES (?, ?, ?)",
+        [(block_hash, name, tokens) for block_hash, tokens in blocks]
+    )
+
+
+def lengths(conn, name: str, hashes: List[str]) -> Dict[str, int]:
+    """Liczba tokenów bloków z zapisanym odciskiem - bez wczytywania odcisków"""
+    found = {}
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        found.update(conn.execute(f"""
+            SELECT hash, length(tokens) / 4 FROM block_tokens
+            WHERE scheme = ? AND hash IN ({', '.join('?' * len(chunk))})
+        """, [name, *chunk]))
+    return found
+
+
+def load(conn, name: str, hashes: List[str]) -> Dict[str, bytes]:
+    found = {}
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        found.update(conn.execute(f"""
+            SELECT hash, tokens FROM block_tokens
+            WHERE scheme = ? AND hash IN ({', '.join('?' * len(chunk))})
+        """, [name, *chunk]))
+    return found
+
+
+def missing(conn, name: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+    """(hash, język) bloków bez odcisku w wariancie `name`"""
+    query = """
+        SELECT hash, language FROM code_blocks
+        WHERE hash NOT IN (SELECT hash FROM block_tokens WHERE scheme = ?)
+    """
+    params: list = [name]
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(query, params).fetchall()
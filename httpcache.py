@@ -0,0 +1,151 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+# Warunkowe GET (ETag / If-None-Match) i pamięć podręczna odpowiedzi.
+#
+# Odpowiedzi list i podobnych bloków zależą tylko od argumentów i stanu
+# bazy, więc ETag liczymy z licznika zmian danych zamiast z treści -
+# 304 nie wymaga zapytania do bazy. Licznik jest zapisany w bazie razem
+# z losową epoką (nowa baza = nowa epoka, ETagi się nie powtórzą),
+# a proces trzyma jego kopię w pamięci.
+
+NO_CACHE = 'no-cache'                           # Przeglądarka może trzymać, ale pyta o ważność
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REFRESH_INTERVAL = 1.0  # s - co tyle sprawdzamy licznik w bazie (zapisy innych procesów)
+
+
+def init_schema(conn) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        epoch TEXT NOT NULL,
+        version INTEGER NOT NULL
+    )
+    """)
+    conn.execute(
+        "INSERT OR IGNORE INTO data_version (id, epoch, version) VALUES (1, ?, 0)",
+        (uuid.uuid4().hex[:12],)
+    )
+
+
+def read(conn) -> Tuple[str, int]:
+    return tuple(conn.execute("SELECT epoch, version FROM data_version WHERE id = 1").fetchone())
+
+
+def bump(conn) -> Tuple[str, int]:
+    """Zwiększa licznik w bieżącej transakcji zapisu.
+
+    Kopię w pamięci (advance) aktualizujemy dopiero po zatwierdzeniu -
+    inaczej odpowiedź ze starymi danymi trafiłaby do pamięci pod nowym ETagiem.
+    """
+    return tuple(conn.execute(
+        "UPDATE data_version SET version = version + 1 WHERE id = 1 RETURNING epoch, version"
+    ).fetchone())
+
+
+class DataVersion:
+    """Kopia licznika zmian jednej bazy w pamięci procesu"""
+
+    def __init__(self, refresh_interval: float = REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.epoch: Optional[str] = None
+        self.version = 0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self, reader: Callable[[], Tuple[str, int]]) -> Tuple[str, int]:
+        """(epoka, wersja); co `refresh_interval` sekund doczytuje licznik przez `reader`"""
+        now = time.monotonic()
+        if self.epoch is None or now - self._checked >= self.refresh_interval:
+            self.advance(*reader())
+            self._checked = now
+        return self.epoch, self.version
+
+    def fresh(self) -> bool:
+        """Czy current() odpowie z pamięci, bez czytania licznika z bazy"""
+        return self.epoch is not None and time.monotonic() - self._checked < self.refresh_interval
+
+    def advance(self, epoch: str, version: int) -> None:
+        with self._lock:
+            if epoch != self.epoch or version > self.version:
+                self.epoch, self.version = epoch, version
+
+
+_versions: Dict[str, DataVersion] = {}
+_versions_lock = threading.Lock()
+
+
+def get_version(path: str) -> DataVersion:
+    with _versions_lock:
+        version = _versions.get(path)
+        if version is None:
+            version = _versions[path] = DataVersion()
+        return version
+
+
+def make_etag(*parts) -> str:
+    """Silny ETag - ta sama treść odpowiedzi dla tych samych `parts`"""
+    return '"' + hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Czy nagłówek If-None-Match obejmuje `etag` (porównanie słabe, jak w RFC 9110)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU gotowych odpowiedzi (treść, nagłówki) ograniczona łącznym rozmiarem treści.
+
+    Wpis pamięta wersję danych, z której powstał; po zmianie danych
+    przestaje pasować i jest usuwany przy następnym odczycie.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[Hashable, bytes, Dict[str, str]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != version:
+                del self._entries[key]
+                self.size -= len(entry[1])
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key: Hashable, version: Hashable, body: bytes, headers: Dict[str, str]) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self._entries[key] = (version, body, headers)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
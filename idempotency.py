@@ -0,0 +1,68 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+PAYLOAD_TTL = 300          # Jak długo pamiętamy treść przetworzonej paczki (s)
+KEY_TTL = 24 * 60 * 60     # Jak długo pamiętamy odpowiedź dla Idempotency-Key (s)
+MAX_ENTRIES = 10_000
+
+
+class TTLCache:
+    """Słownik z czasem życia wpisów i limitem ich liczby (najstarsze wypadają)"""
+
+    def __init__(self, ttl: float, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl, value)
+            # Wpisy są w kolejności dodania, więc wygasłe są na początku
+            while self._entries:
+                oldest_key, (expires, _) = next(iter(self._entries.items()))
+                if expires > now and len(self._entries) <= self.max_entries:
+                    break
+                del self._entries[oldest_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def payload_digest(data: Dict) -> str:
+    """Skrót adresu strony i kodu bloków w kolejności z żądania.
+
+    Kod jest haszowany w jednym przebiegu, bez liczenia hashy
+    poszczególnych bloków i bez ich normalizacji.
+    """
+    digest = hashlib.sha256()
+    url = (data.get('metadata') or {}).get('url') or ''
+    digest.update(str(url).encode('utf-8'))
+    for block in data.get('blocks') or []:
+        code = str(block.get('code', '')) if isinstance(block, dict) else str(block)
+        encoded = code.encode('utf-8')
+        # Długość przed treścią - granice bloków są jednoznaczne
+        digest.update(len(encoded).to_bytes(8, 'big'))
+        digest.update(encoded)
+    return digest.hexdigest()
@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+# Statusy zadań
+PENDING = 'pending'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+
+RETENTION = 24 * 3600  # s - tyle zakończone zadania są dostępne pod GET /jobs/<id>
+
+
+def init_schema(conn) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        payload TEXT,
+        hashes TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+
+    # Tabela sprzed czyszczenia treści zakończonych zadań - payload był NOT NULL
+    if any(row[1] == 'payload' and row[3] for row in conn.execute("PRAGMA table_info(ingest_jobs)")):
+        conn.execute("ALTER TABLE ingest_jobs RENAME TO ingest_jobs_old")
+        init_schema(conn)
+        conn.execute("""
+            INSERT INTO ingest_jobs SELECT * FROM ingest_jobs_old
+        """)
+        conn.execute("DROP TABLE ingest_jobs_old")
+        conn.execute("UPDATE ingest_jobs SET payload = NULL WHERE status IN (?, ?)", (DONE, FAILED))
+
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, created_at)"
+    )
+
+
+def pending_count(conn) -> int:
+    return conn.execute(
+        "SELECT COUNT(*) FROM ingest_jobs WHERE status IN (?, ?)",
+        (PENDING, PROCESSING)
+    ).fetchone()[0]
+
+
+def enqueue(conn, blocks: List[Dict], max_pending: int) -> Optional[str]:
+    """Dodaje zadanie do kolejki; zwraca None, gdy kolejka jest pełna"""
+    if pending_count(conn) >= max_pending:
+        return None
+
+    job_id = uuid.uuid4().hex
+    now = datetime.utcnow().isoformat()
+    conn.execute("""
+        INSERT INTO ingest_jobs (id, status, payload, hashes, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (
+        job_id, PENDING, json.dumps(blocks),
+        json.dumps([block['hash'] for block in blocks]), now, now
+    ))
+    return job_id
+
+
+def claim_next(conn, stale_after: float, retention: float = RETENTION) -> Optional[Dict]:
+    """Przejmuje najstarsze oczekujące zadanie (lub porzucone przez martwy proces).
+
+    Przy okazji usuwa zadania zakończone dawniej niż `retention` sekund temu.
+    """
+    conn.execute(
+        "DELETE FROM ingest_jobs WHERE status IN (?, ?) AND updated_at < ?",
+        (DONE, FAILED, (datetime.utcnow() - timedelta(seconds=retention)).isoformat())
+    )
+    stale = (datetime.utcnow() - timedelta(seconds=stale_after)).isoformat()
+    rows = conn.execute("""
+        SELECT id, payload FROM ingest_jobs
+        WHERE status = ? OR (status = ? AND updated_at < ?)
+        ORDER BY created_at
+        LIMIT 10
+    """, (PENDING, PROCESSING, stale)).fetchall()
+
+    for job_id, payload in rows:
+        # Warunkowa aktualizacja - tylko jeden proces przejmie zadanie
+        cursor = conn.execute("""
+            UPDATE ingest_jobs SET status = ?, updated_at = ?
+            WHERE id = ? AND (status = ? OR (status = ? AND updated_at < ?))
+        """, (PROCESSING, datetime.utcnow().isoformat(), job_id, PENDING, PROCESSING, stale))
+        if cursor.rowcount:
+            return {'id': job_id, 'blocks': json.loads(payload)}
+    return None
+
+
+def finish(conn, job_id: str, result: Optional[Dict] = None, error: Optional[str] = None) -> None:
+    """Zapisuje wynik zadania; treść paczki nie jest już potrzebna - bloki są w code_blocks"""
+    conn.execute("""
+        UPDATE ingest_jobs SET status = ?, payload = NULL, result = ?, error = ?, updated_at = ?
+        WHERE id = ?
+    """, (
+        FAILED if error else DONE,
+        json.dumps(result) if result is not None else None,
+        error, datetime.utcnow().isoformat(), job_id
+    ))
+
+
+def get_job(conn, job_id: str) -> Optional[Dict]:
+    row = conn.execute("""
+        SELECT id, status, hashes, result, error, created_at, updated_at
+        FROM ingest_jobs WHERE id = ?
+    """, (job_id,)).fetchone()
+    if not row:
+        return None
+
+    return {
+        'id': row[0],
+        'status': row[1],
+        'hashes': json.loads(row[2]),
+        'result': json.loads(row[3]) if row[3] else None,
+        'error': row[4],
+        'created_at': row[5],
+        'updated_at': row[6]
+    }
+
+
+class IngestWorkers:
+    """Wątki opróżniające kolejkę zadań zapisu.
+
+    `process_one` przejmuje i wykonuje jedno zadanie, zwracając False,
+    gdy kolejka jest pusta. Wątki budzi `notify()` po dodaniu zadania,
+    a co `poll_interval` sekund sprawdzają też zadania dodane przez
+    inne procesy lub porzucone po restarcie.
+    """
+
+    def __init__(self, process_one: Callable[[], bool], count: int, poll_interval: float = 5.0):
+        self.process_one = process_one
+        self.count = count
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.count):
+            thread = threading.Thread(target=self._run, name=f'ingest-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                if self.process_one():
+                    continue
+            except Exception as e:
+                print(f"Błąd wątku kolejki zapisu: {e}")
+                time.sleep(1)
+                continue
+            self._wake.wait(self.poll_interval)
@@ -0,0 +1,195 @@
+import zlib
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+# Parametry indeksu LSH (MinHash + pasma)
+SHINGLE_SIZE = 5        # Długość shingla w znakach
+NUM_PERM = 128          # Liczba pozycji sygnatury
+BANDS = 32              # Liczba pasm
+ROWS = NUM_PERM // BANDS  # Pozycji na pasmo - próg Jaccarda ok. (1/BANDS)^(1/ROWS) = 0.42
+MAX_CANDIDATES = 500    # Górny limit kandydatów zwracanych z indeksu
+
+_EMPTY = 0xFFFFFFFF
+_BIN_BITS = 7  # log2(NUM_PERM)
+
+
+def shingle_hashes(text: str) -> set:
+    data = text.encode('utf-8')
+    if len(data) <= SHINGLE_SIZE:
+        return {zlib.crc32(data)}
+    return set(map(zlib.crc32, (data[i:i + SHINGLE_SIZE]
+                                for i in range(len(data) - SHINGLE_SIZE + 1))))
+
+
+def minhash_signature(text: str) -> bytes:
+    """Sygnatura MinHash liczona metodą one-permutation hashing.
+
+    Każdy shingiel jest haszowany raz; młodsze bity wybierają pozycję
+    sygnatury, a starsze są wartością, z której bierzemy minimum.
+    Puste pozycje są uzupełniane z następnej niepustej (densyfikacja).
+    """
+    hashes = shingle_hashes(text)
+
+    # Przy dużych tekstach minimum w każdej pozycji jest bardzo małe,
+    # więc wstępnie odrzucamy hasze, które na pewno go nie wyznaczą
+    per_bin = len(hashes) >> _BIN_BITS
+    if per_bin > 64:
+        limit = (1 << (32 - _BIN_BITS)) * 16 // per_bin
+        candidates = [h for h in hashes if (h >> _BIN_BITS) < limit]
+        sig = _fill_bins(candidates)
+        if _EMPTY in sig:
+            sig = _fill_bins(hashes)
+    else:
+        sig = _fill_bins(hashes)
+
+    _densify(sig)
+    return sig.tobytes()
+
+
+def _fill_bins(hashes: Iterable[int]) -> array:
+    sig = array('I', [_EMPTY] * NUM_PERM)
+    mask = NUM_PERM - 1
+    for h in hashes:
+        b = h & mask
+        v = h >> _BIN_BITS
+        if v < sig[b]:
+            sig[b] = v
+    return sig
+
+
+def _densify(sig: array) -> None:
+    if _EMPTY not in sig or sig.count(_EMPTY) == NUM_PERM:
+        return
+    original = sig[:]
+    for i in range(NUM_PERM):
+        if original[i] == _EMPTY:
+            # Najbliższa niepusta pozycja w prawo (cyklicznie), z przesunięciem
+            # zależnym od odległości, żeby puste pozycje nie były identyczne
+            step = 1
+            while original[(i + step) % NUM_PERM] == _EMPTY:
+                step += 1
+            sig[i] = (original[(i + step) % NUM_PERM] + step * 0x9E3779B1) & 0x1FFFFFF
+
+
+def band_buckets(signature: bytes) -> List[int]:
+    sig = array('I')
+    sig.frombytes(signature)
+    return [
+        zlib.crc32(sig[band * ROWS:(band + 1) * ROWS].tobytes(), band)
+        for band in range(BANDS)
+    ]
+
+
+def init_schema(conn) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS block_signatures (
+        hash TEXT PRIMARY KEY,
+        signature BLOB NOT NULL
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS lsh_buckets (
+        language TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        block_hash TEXT NOT NULL,
+        PRIMARY KEY (language, platform, band, bucket, block_hash)
+    ) WITHOUT ROWID
+    """)
+
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lsh_buckets_block ON lsh_buckets (block_hash)"
+    )
+
+    # Pary (język, platforma) obecne w indeksie - zapytanie bez jednej z nich
+    # przechodzi po grupach zamiast skanować całą tabelę kubełków
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS lsh_groups (
+        language TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        PRIMARY KEY (language, platform)
+    ) WITHOUT ROWID
+    """)
+    if conn.execute("SELECT 1 FROM lsh_groups LIMIT 1").fetchone() is None:
+        # Indeks sprzed tej tabeli - jednorazowo
+        conn.execute("""
+            INSERT OR IGNORE INTO lsh_groups (language, platform)
+            SELECT DISTINCT language, platform FROM lsh_buckets
+        """)
+
+
+def index_block(conn, block_hash: str, language: str, platform: str,
+                signature: bytes) -> None:
+    index_blocks(conn, [(block_hash, language, platform, signature)])
+
+
+def index_blocks(conn, blocks: List[Tuple[str, str, str, bytes]]) -> None:
+    """Indeksuje bloki podane jako (hash, język, platforma, sygnatura)"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO block_signatures (hash, signature) VALUES (?, ?)",
+        [(block_hash, signature) for block_hash, _, _, signature in blocks]
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh_groups (language, platform) VALUES (?, ?)",
+        {(language, platform) for _, language, platform, _ in blocks}
+    )
+    conn.executemany("""
+        INSERT OR IGNORE INTO lsh_buckets (language, platform, band, bucket, block_hash)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (language, platform, band, bucket, block_hash)
+        for block_hash, language, platform, signature in blocks
+        for band, bucket in enumerate(band_buckets(signature))
+    ])
+
+
+def query_candidates(conn, language: str, platform: str, signature: bytes,
+                     limit: Optional[int] = MAX_CANDIDATES) -> List[str]:
+    """Zwraca hasze bloków dzielących co najmniej jedno pasmo z sygnaturą.
+
+    Kandydaci są posortowani malejąco według liczby wspólnych pasm,
+    więc przy obcięciu do `limit` zostają najbardziej obiecujący.
+    """
+    return [block_hash for block_hash, _ in
+            query_candidate_counts(conn, language, platform, signature, limit)]
+
+
+def groups(conn, language: Optional[str] = None, platform: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Pary (język, platforma) z indeksu, opcjonalnie zawężone do jednej wartości"""
+    query = "SELECT language, platform FROM lsh_groups"
+    conditions = []
+    params = []
+    if language is not None:
+        conditions.append("language = ?")
+        params.append(language)
+    if platform is not None:
+        conditions.append("platform = ?")
+        params.append(platform)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return conn.execute(query, params).fetchall()
+
+
+def query_candidate_counts(conn, language: str, platform: str, signature: bytes,
+                           limit: Optional[int] = MAX_CANDIDATES) -> List[Tuple[str, int]]:
+    """Jak query_candidates(), ale z liczbą wspólnych pasm każdego kandydata"""
+    buckets = band_buckets(signature)
+    terms = " OR ".join(["(band = ? AND bucket = ?)"] * len(buckets))
+    params: list = [language, platform]
+    for band, bucket in enumerate(buckets):
+        params.extend((band, bucket))
+
+    query = f"""
+        SELECT block_hash, COUNT(*)
+        FROM lsh_buckets
+        WHERE language = ? AND platform = ? AND ({terms})
+        GROUP BY block_hash
+        ORDER BY COUNT(*) DESC, block_hash
+    """
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    return conn.execute(query, params).fetchall()
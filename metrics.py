@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+NAMESPACE = 'codeblocks'
+# Górne granice kubełków histogramów czasu (s)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SNAPSHOT_INTERVAL = 1.0  # Co ile sekund proces serwera zapisuje swoje liczniki
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Timer:
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry: 'Registry', name: str, labels: Dict[str, str]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Registry:
+    """Liczniki i histogramy czasu w formacie tekstowym Prometheusa.
+
+    Wyłączony rejestr (`enabled = False`) nic nie mierzy - timer() zwraca
+    pusty kontekst, a inc()/observe() kończą się na sprawdzeniu flagi.
+    Kolektory to funkcje wywoływane dopiero przy odczycie, np. dla
+    liczników, które moduły i tak prowadzą we własnych słownikach.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List] = {}  # [liczniki kubełków, suma, liczba]
+        self._descriptions: Dict[str, Tuple[str, str]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._descriptions[name] = (kind, help_text)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]) -> None:
+        """`collector()` zwraca (nazwa, etykiety, wartość) liczników"""
+        self._collectors.append(collector)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def timer(self, name: str, **labels: str):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def stage(self, stage: str):
+        return self.timer('stage_duration_seconds', stage=stage)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        self.observe('stage_duration_seconds', seconds, stage=stage)
+
+    def snapshot(self) -> Dict:
+        """Stan rejestru jako słownik zapisywalny w JSON"""
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, dict(labels), list(h[0]), h[1], h[2]]
+                          for (name, labels), h in self._histograms.items()]
+        for collector in self._collectors:
+            counters.extend([name, labels, value] for name, labels, value in collector())
+        return {'buckets': list(self.buckets), 'counters': counters, 'histograms': histograms}
+
+    def render(self, others: Iterable[Dict] = ()) -> str:
+        return render(merge([self.snapshot(), *others]), self._descriptions)
+
+
+def merge(snapshots: Iterable[Dict]) -> Dict:
+    """Sumuje stany kilku procesów"""
+    counters: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[Tuple[str, Labels], List] = {}
+    buckets: List[float] = []
+    for snapshot in snapshots:
+        if buckets and snapshot['buckets'] != buckets:
+            continue  # Inne kubełki - nie da się zsumować
+        buckets = snapshot['buckets']
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total, count in snapshot['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+    return {
+        'buckets': buckets,
+        'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, dict(labels), *h] for (name, labels), h in histograms.items()]
+    }
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = sorted(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in items)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(snapshot: Dict, descriptions: Optional[Dict[str, Tuple[str, str]]] = None) -> str:
+    descriptions = descriptions or {}
+    lines: List[str] = []
+
+    def header(name: str, default_kind: str) -> None:
+        kind, help_text = descriptions.get(name, (default_kind, ''))
+        if help_text:
+            lines.append(f'# HELP {NAMESPACE}_{name} {help_text}')
+        lines.append(f'# TYPE {NAMESPACE}_{name} {kind}')
+
+    by_name: Dict[str, List] = {}
+    for name, labels, value in snapshot['counters']:
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        header(name, 'counter')
+        for labels, value in sorted(by_name[name], key=lambda item: sorted(item[0].items())):
+            lines.append(f'{NAMESPACE}_{name}{_format_labels(labels)} {_format_value(value)}')
+
+    by_name = {}
+    for name, labels, counts, total, count in snapshot['histograms']:
+        by_name.setdefault(name, []).append((labels, counts, total, count))
+    for name in sorted(by_name):
+        header(name, 'histogram')
+        for labels, counts, total, count in sorted(by_name[name], key=lambda item: sorted(item[0].items())):
+            cumulative = 0
+            for bound, bucket_count in zip([*snapshot['buckets'], '+Inf'], counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f'{NAMESPACE}_{name}_bucket{_format_labels(labels, ("le", le))} {cumulative}')
+            lines.append(f'{NAMESPACE}_{name}_sum{_format_labels(labels)} {repr(float(total))}')
+            lines.append(f'{NAMESPACE}_{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+# Kilka procesów serwera: każdy zapisuje swój stan do pliku we wspólnym
+# katalogu, a odpowiadający na /metrics dokłada stany pozostałych
+
+def snapshot_path(directory: str, pid: Optional[int] = None) -> str:
+    return os.path.join(directory, f'metrics-{pid or os.getpid()}.json')
+
+
+def write_snapshot(registry: Registry, directory: str) -> None:
+    path = snapshot_path(directory)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def read_snapshots(directory: str, exclude_pid: Optional[int] = None) -> List[Dict]:
+    """Stany innych procesów - także zakończonych, bo liczniki nie mogą maleć"""
+    own = snapshot_path(directory, exclude_pid) if exclude_pid else None
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith('.json') or path == own:
+            continue
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+class SnapshotWriter:
+    """Wątek zapisujący stan rejestru co `interval` sekund"""
+
+    def __init__(self, registry: Registry, directory: str, interval: float = SNAPSHOT_INTERVAL):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        write_snapshot(self.registry, self.directory)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                write_snapshot(self.registry, self.directory)
+            except OSError as e:
+                print(f"Błąd zapisu metryk: {e}")
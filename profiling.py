@@ -0,0 +1,172 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Rodzaje profili
+CPROFILE = 'cprofile'   # Deterministyczny - każde wywołanie, plik .pstats
+SAMPLING = 'sample'     # Próbkujący - stos co SAMPLE_INTERVAL, plik .collapsed
+
+SAMPLE_INTERVAL = 0.005  # s
+KEEP = 200               # Ile ostatnich profili trzymamy w katalogu
+
+EXTENSIONS = {CPROFILE: '.pstats', SAMPLING: '.collapsed'}
+
+# cProfile od Pythona 3.12 działa przez sys.monitoring, wspólne dla całego
+# procesu - naraz może działać tylko jeden taki profil
+_cprofile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{Path(code.co_filename).name}:{code.co_name}"
+
+
+class StackSampler:
+    """Próbkuje stos jednego wątku z osobnego wątku.
+
+    Wynik to liczba próbek dla każdego stosu w formacie "collapsed"
+    (ramki od najbardziej zewnętrznej, rozdzielone ';'), który czytają
+    flamegraph.pl i speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+class Profile:
+    """Profil jednego żądania w bieżącym wątku - od utworzenia do finish()"""
+
+    def __init__(self, kind: str = CPROFILE, interval: Optional[float] = None):
+        if kind not in EXTENSIONS:
+            raise ValueError(f"Unknown profile kind: {kind}")
+        self.kind = kind
+        self.id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self._stopped = False
+        if kind == CPROFILE:
+            if not _cprofile_lock.acquire(blocking=False):
+                raise ProfilerBusy("Another request is being profiled with cProfile")
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except BaseException:
+                _cprofile_lock.release()
+                raise
+        else:
+            self._sampler = StackSampler(threading.get_ident(), interval or SAMPLE_INTERVAL)
+            self._sampler.start()
+
+    def cancel(self) -> None:
+        """Zatrzymuje profil bez zapisu (np. gdy żądanie skończyło się wyjątkiem)"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self.kind == CPROFILE:
+            self._profiler.disable()
+            _cprofile_lock.release()
+        else:
+            self._sampler.stop()
+
+    def finish(self, directory: Path, **info) -> Dict:
+        """Zatrzymuje profil i zapisuje go razem z opisem (`info`: trasa, metoda, status...)"""
+        duration = time.perf_counter() - self.started
+        self.cancel()
+        samples = self._sampler.samples if self.kind == SAMPLING else None
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        profile_id = self.id
+        path = directory / f"{profile_id}{EXTENSIONS[self.kind]}"
+        if self.kind == CPROFILE:
+            self._profiler.dump_stats(str(path))
+        else:
+            path.write_text(''.join(f"{stack} {count}\n" for stack, count in samples.most_common()))
+
+        capture = dict(info, **{
+            'id': profile_id,
+            'kind': self.kind,
+            'duration_ms': round(duration * 1000, 3),
+            'file': str(path),
+            'pid': os.getpid(),
+            'created_at': datetime.utcnow().isoformat()
+        })
+        if self.kind == SAMPLING:
+            capture['samples'] = sum(samples.values())
+        (directory / f"{profile_id}.json").write_text(json.dumps(capture))
+        prune(directory)
+        return capture
+
+
+def _descriptions(directory: Path) -> List[Path]:
+    # Od najnowszych; katalog jest wspólny dla procesów serwera
+    paths = []
+    for path in directory.glob('*.json'):
+        try:
+            paths.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    return [path for _, path in sorted(paths, reverse=True)]
+
+
+def prune(directory: Path, keep: Optional[int] = None) -> None:
+    for path in _descriptions(directory)[KEEP if keep is None else keep:]:
+        for extension in ('.json', *EXTENSIONS.values()):
+            path.with_suffix(extension).unlink(missing_ok=True)
+
+
+def list_profiles(directory: Path, limit: int = 50) -> List[Dict]:
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    captures = []
+    for path in _descriptions(directory)[:limit]:
+        try:
+            captures.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return captures
+
+
+def find_profile(directory: Path, profile_id: str) -> Optional[Path]:
+    """Plik profilu o danym id albo None"""
+    if not profile_id.isalnum():
+        return None
+    for extension in EXTENSIONS.values():
+        path = Path(directory) / f"{profile_id}{extension}"
+        if path.is_file():
+            return path
+    return None
@@ -0,0 +1,80 @@
+import json
+from datetime import datetime
+from typing import Dict, Optional
+
+# Statusy przebiegów
+RUNNING = 'running'
+DONE = 'done'
+ABANDONED = 'abandoned'
+
+
+def init_schema(conn) -> None:
+    # Punkt kontrolny przebiegu: bloki są przetwarzane według rowid,
+    # więc wystarczy zapamiętać ostatni zatwierdzony rowid
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS reindex_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        last_rowid INTEGER NOT NULL DEFAULT 0,
+        processed INTEGER NOT NULL DEFAULT 0,
+        edges INTEGER NOT NULL DEFAULT 0,
+        started_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+
+
+def _row_to_run(row) -> Dict:
+    return {
+        'id': row[0],
+        'params': json.loads(row[1]),
+        'status': row[2],
+        'last_rowid': row[3],
+        'processed': row[4],
+        'edges': row[5],
+        'started_at': row[6],
+        'updated_at': row[7]
+    }
+
+
+def find_unfinished(conn, params: Dict) -> Optional[Dict]:
+    row = conn.execute("""
+        SELECT id, params, status, last_rowid, processed, edges, started_at, updated_at
+        FROM reindex_runs
+        WHERE params = ? AND status = ?
+        ORDER BY id DESC
+        LIMIT 1
+    """, (json.dumps(params, sort_keys=True), RUNNING)).fetchone()
+    return _row_to_run(row) if row else None
+
+
+def start(conn, params: Dict, restart: bool = False) -> Dict:
+    """Wznawia niedokończony przebieg z tymi samymi parametrami albo zaczyna nowy"""
+    if restart:
+        conn.execute("UPDATE reindex_runs SET status = ? WHERE params = ? AND status = ?",
+                     (ABANDONED, json.dumps(params, sort_keys=True), RUNNING))
+    else:
+        run = find_unfinished(conn, params)
+        if run:
+            return run
+
+    now = datetime.utcnow().isoformat()
+    conn.execute("""
+        INSERT INTO reindex_runs (params, status, started_at, updated_at)
+        VALUES (?, ?, ?, ?)
+    """, (json.dumps(params, sort_keys=True), RUNNING, now, now))
+    return find_unfinished(conn, params)
+
+
+def checkpoint(conn, run_id: int, last_rowid: int, processed: int, edges: int) -> None:
+    conn.execute("""
+        UPDATE reindex_runs
+        SET last_rowid = ?, processed = processed + ?, edges = edges + ?, updated_at = ?
+        WHERE id = ?
+    """, (last_rowid, processed, edges, datetime.utcnow().isoformat(), run_id))
+
+
+def finish(conn, run_id: int) -> None:
+    conn.execute("UPDATE reindex_runs SET status = ?, updated_at = ? WHERE id = ?",
+                 (DONE, datetime.utcnow().isoformat(), run_id))
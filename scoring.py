@@ -0,0 +1,122 @@
+import difflib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+
+def length_bound(len1: int, len2: int) -> float:
+    """Górne ograniczenie ratio() wynikające wyłącznie z długości tekstów"""
+    total = len1 + len2
+    if not total:
+        return 1.0
+    return 2.0 * min(len1, len2) / total
+
+
+def _ratio(pair: Tuple[Sequence, Sequence, bool]) -> float:
+    return difflib.SequenceMatcher(None, pair[0], pair[1], autojunk=pair[2]).ratio()
+
+
+class ScoringEngine:
+    """Kaskada filtrów przed kosztownym SequenceMatcher.ratio().
+
+    1. ograniczenie z długości (bez wczytywania tekstu kandydata),
+    2. real_quick_ratio() i quick_ratio(),
+    3. ratio() - w puli procesów, jeśli pozostało dużo pracy.
+
+    Porównywane mogą być teksty albo ciągi tokenów. `junk_limit` to
+    długość, od której SequenceMatcher pomija najczęstsze elementy
+    (autojunk): dla znaków tak jest zawsze, a dla krótszych ciągów
+    tokenów wynik bez tego uproszczenia jest dokładny i wciąż tani.
+    """
+
+    COUNTERS = (
+        'candidates', 'length_rejected', 'real_quick_rejected',
+        'quick_rejected', 'ratio_calls', 'pool_ratio_calls', 'matches'
+    )
+
+    def __init__(self, threshold: float, pool_size: int = 0,
+                 parallel_min_chars: int = 200_000,
+                 pool: Optional[ProcessPoolExecutor] = None, junk_limit: int = 0):
+        self.threshold = threshold
+        self.junk_limit = junk_limit
+        self.pool_size = pool_size
+        self.parallel_min_chars = parallel_min_chars
+        self.stats: Dict[str, int] = dict.fromkeys(self.COUNTERS, 0)
+        self._lock = threading.Lock()
+        # Pulę podaną z zewnątrz zamyka jej właściciel, nie shutdown()
+        self._pool: Optional[ProcessPoolExecutor] = pool
+        self._owns_pool = pool is None
+
+    def _count(self, **values: int) -> None:
+        with self._lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn zamiast fork - proces Flaska ma już działające wątki
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None and self._owns_pool:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def score(self, text: Sequence, candidates: Iterable[Tuple[Hashable, int]],
+              load: Callable[[List[Hashable]], Dict[Hashable, Sequence]]
+              ) -> List[Tuple[Hashable, float]]:
+        """Zwraca (klucz, podobieństwo) kandydatów z wynikiem >= progu.
+
+        `candidates` to pary (klucz, długość), a `load` wczytuje teksty
+        tylko tych kandydatów, którzy przeszli ograniczenie z długości.
+        """
+        candidates = list(candidates)
+        survivors = [
+            key for key, length in candidates
+            if length_bound(len(text), length) >= self.threshold
+        ]
+        self._count(candidates=len(candidates),
+                    length_rejected=len(candidates) - len(survivors))
+        if not survivors:
+            return []
+
+        texts = load(survivors)
+        real_quick_rejected = quick_rejected = 0
+        pending = []
+        for key in survivors:
+            other = texts.get(key)
+            if other is None:
+                continue
+            matcher = difflib.SequenceMatcher(None, text, other, autojunk=len(other) > self.junk_limit)
+            if matcher.real_quick_ratio() < self.threshold:
+                real_quick_rejected += 1
+            elif matcher.quick_ratio() < self.threshold:
+                quick_rejected += 1
+            else:
+                pending.append((key, matcher, other))
+        self._count(real_quick_rejected=real_quick_rejected,
+                    quick_rejected=quick_rejected, ratio_calls=len(pending))
+
+        work = sum(len(text) + len(other) for _, _, other in pending)
+        if self.pool_size > 0 and work >= self.parallel_min_chars:
+            self._count(pool_ratio_calls=len(pending))
+            pool = self._get_pool()
+            scores = list(pool.map(_ratio, [(text, other, len(other) > self.junk_limit)
+                                            for _, _, other in pending]))
+        else:
+            scores = [matcher.ratio() for _, matcher, _ in pending]
+
+        matches = [
+            (key, score)
+            for (key, _, _), score in zip(pending, scores)
+            if score >= self.threshold
+        ]
+        self._count(matches=len(matches))
+        return matches
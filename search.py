@@ -0,0 +1,149 @@
+import heapq
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+MIN_QUERY_LENGTH = 3  # Tokenizer trigram nie znajdzie krótszych fraz
+SNIPPET_TOKENS = 24
+
+RESULT_COLUMNS = ('hash', 'language', 'platform', 'url', 'timestamp', 'title', 'file_path', 'created_at')
+
+
+def init_schema(conn) -> None:
+    # rowid indeksu = rowid w code_blocks. Kod trzymany jako tekst indeksują
+    # wyzwalacze; bloki w segmentach lub skompresowane dodaje aplikacja
+    # (index_blocks), bo wyzwalacz nie ma dostępu do ich tekstu.
+    conn.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS code_search
+    USING fts5(code, tokenize = 'trigram')
+    """)
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS code_search_insert AFTER INSERT ON code_blocks
+    WHEN typeof(new.code) = 'text' AND new.code != ''
+    BEGIN
+        INSERT INTO code_search (rowid, code) VALUES (new.rowid, new.code);
+    END
+    """)
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS code_search_delete AFTER DELETE ON code_blocks
+    BEGIN
+        DELETE FROM code_search WHERE rowid = old.rowid;
+    END
+    """)
+
+
+def drop_schema(conn) -> None:
+    conn.execute("DROP TRIGGER IF EXISTS code_search_insert")
+    conn.execute("DROP TRIGGER IF EXISTS code_search_delete")
+    conn.execute("DROP TABLE IF EXISTS code_search")
+
+
+def index_blocks(conn, rows: List[Tuple[int, str]]) -> None:
+    """Indeksuje bloki podane jako (rowid w code_blocks, kod)"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO code_search (rowid, code) VALUES (?, ?)", rows
+    )
+
+
+def match_expression(query: str) -> str:
+    # Całe zapytanie jako jedna fraza - szukamy podciągu, bez składni FTS5
+    return '"' + query.replace('"', '""') + '"'
+
+
+class StaleCursor(Exception):
+    pass
+
+
+def snapshot(epoch: str, version: int) -> str:
+    """Wersja danych zapisywana w kursorze"""
+    return f"{epoch}.{version}"
+
+
+def check_cursor(after: Optional[Tuple[str, float, int]], version: str) -> None:
+    """Odrzuca kursor z innej wersji danych (StaleCursor)"""
+    if after and after[0] != version:
+        raise StaleCursor(after[0])
+
+
+def search(conn, query: str, platform: Optional[str] = None, language: Optional[str] = None,
+           limit: int = 20, after: Optional[Tuple[str, float, int]] = None, version: str = ''
+           ) -> Tuple[List[Dict], Optional[str]]:
+    """Bloki zawierające `query`, od najlepiej dopasowanych (bm25).
+
+    `after` to (wersja danych, rank, rowid) ostatniego wyniku poprzedniej
+    strony, a `version` - wersja danych, z której czytamy tę stronę. bm25
+    zależy od całego indeksu, więc każdy zapis może zmienić kolejność
+    wyników - kursor z innej wersji odrzucamy (StaleCursor) zamiast
+    pominąć lub powtórzyć część wyników.
+    Zwraca wyniki i kursor następnej strony (None, jeśli to ostatnia).
+    """
+    check_cursor(after, version)
+    return page([matches(conn, query, platform, language, limit, after)], limit, version)
+
+
+def matches(conn, query: str, platform: Optional[str], language: Optional[str], limit: int,
+            after: Optional[Tuple[str, float, int]], shard: int = 0, count: int = 1
+            ) -> List[Tuple[Tuple[float, int], Dict]]:
+    """Strona wyników z jednego pliku jako pary ((rank, rowid), wynik).
+
+    Przy `count` shardach rowid w kluczu i w kursorze to rowid * count + shard,
+    więc jest unikalny między plikami, a kolejność w obrębie shardu się nie zmienia.
+    """
+    conditions = ["code_search MATCH ?"]
+    params: list = [match_expression(query)]
+
+    if platform:
+        conditions.append("cb.platform = ?")
+        params.append(platform)
+    if language:
+        conditions.append("cb.language = ?")
+        params.append(language)
+    if after:
+        # Kolumna rank nie działa w porównaniach - wprost liczymy bm25()
+        conditions.append("(bm25(code_search), code_search.rowid) > (?, ?)")
+        params.extend([after[1], (after[2] - shard) // count])
+
+    params.append(limit)
+    cursor = conn.execute(f"""
+        SELECT {', '.join('cb.' + column for column in RESULT_COLUMNS)},
+               snippet(code_search, 0, '<<', '>>', '...', {SNIPPET_TOKENS}),
+               code_search.rank, code_search.rowid
+        FROM code_search
+        JOIN code_blocks cb ON cb.rowid = code_search.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY code_search.rank, code_search.rowid
+        LIMIT ?
+    """, params)
+
+    results = []
+    for row in cursor.fetchall():
+        result = dict(zip(RESULT_COLUMNS, row))
+        result['snippet'] = row[-3]
+        result['rank'] = row[-2]
+        results.append(((row[-2], row[-1] * count + shard), result))
+    return results
+
+
+def page(pages: List[List[Tuple[Tuple[float, int], Dict]]], limit: int, version: str
+         ) -> Tuple[List[Dict], Optional[str]]:
+    """Scala strony z shardów (wyniki `matches`); zwraca wyniki i kursor następnej strony"""
+    rows = list(islice(heapq.merge(*pages, key=itemgetter(0)), limit))
+    next_cursor = None
+    if rows and len(rows) == limit:
+        rank, rowid = rows[-1][0]
+        next_cursor = f"{version},{rank!r},{rowid}"
+    return [result for _, result in rows], next_cursor
+
+
+def parse_cursor(value: Optional[str]) -> Optional[Tuple[str, float, int]]:
+    if not value:
+        return None
+    parts = value.split(',')
+    try:
+        if len(parts) != 3:
+            raise ValueError
+        return parts[0], float(parts[1]), int(parts[2])
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
@@ -0,0 +1,278 @@
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.sharedctypes import RawArray
+from typing import Callable, Dict, Optional
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+WORKERS = os.cpu_count() or 1
+THREADS = 8
+TIMEOUT = 30            # Limit czasu handlera, operacji na gnieździe klienta i bicia serca procesu (s)
+GRACEFUL_TIMEOUT = 30   # Czas na dokończenie żądań po SIGTERM (s)
+BACKLOG = 2048
+
+
+class RequestHandler(WSGIRequestHandler):
+    # Limit czasu odczytu i zapisu - wolny lub zawieszony klient nie trzyma wątku bez końca
+    timeout = TIMEOUT
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Serwer werkzeug obsługujący połączenia w stałej puli wątków.
+
+    Gdy wszystkie wątki są zajęte, proces przestaje przyjmować połączenia,
+    więc czekają one w kolejce gniazda na inny proces.
+    """
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int, fd: int,
+                 heartbeat: Optional[Callable[[], None]] = None,
+                 handler=RequestHandler):
+        super().__init__(host, port, self._timed(app), handler=handler, fd=fd)
+        self.threads = threads
+        self.heartbeat = heartbeat
+        self._slots = threading.BoundedSemaphore(threads)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        self._running: Dict[int, float] = {}  # wątek -> początek działania aplikacji
+        self._running_lock = threading.Lock()
+
+    def _timed(self, app):
+        def timed_app(environ, start_response):
+            thread = threading.get_ident()
+            with self._running_lock:
+                self._running[thread] = time.monotonic()
+            try:
+                return app(environ, start_response)
+            finally:
+                with self._running_lock:
+                    del self._running[thread]
+        return timed_app
+
+    def oldest_request(self) -> float:
+        """Początek najdłużej działającego handlera (time.monotonic) albo 0, gdy żaden nie działa"""
+        with self._running_lock:
+            return min(self._running.values(), default=0.0)
+
+    def service_actions(self) -> None:
+        if self.heartbeat:
+            self.heartbeat()
+
+    def process_request(self, request, client_address) -> None:
+        while not self._slots.acquire(timeout=0.5):
+            self.service_actions()
+        self._executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self, timeout: float) -> bool:
+        """Czeka na zakończenie trwających żądań; False, jeśli nie zdążyły"""
+        deadline = time.monotonic() + timeout
+        acquired = 0
+        while acquired < self.threads:
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                break
+            acquired += 1
+        for _ in range(acquired):
+            self._slots.release()
+        return acquired == self.threads
+
+
+def bind_socket(host: str, port: int, backlog: int = BACKLOG) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """Proces nadrzędny z `workers` procesami potomnymi na wspólnym gnieździe.
+
+    - nadrzędny otwiera gniazdo, uruchamia procesy (fork) i odnawia te,
+      które zginęły, przestały bić sercem dłużej niż `timeout` albo
+      obsługują żądanie dłużej niż `timeout`,
+    - SIGTERM/SIGINT: procesy dostają SIGTERM, przestają przyjmować
+      połączenia i kończą trwające żądania w `graceful_timeout`,
+    - `on_worker_start(index)` i `on_worker_exit(index)` wywołuje każdy
+      proces potomny; indeks zostaje ten sam po odnowieniu procesu.
+
+    Czas żądania liczymy do zwrócenia odpowiedzi przez aplikację; treść
+    strumieni (NDJSON, SSE) ogranicza już tylko limit operacji na gnieździe.
+    Wątku nie da się przerwać, więc zawieszony handler kończy cały proces -
+    razem z innymi żądaniami, które w nim trwają.
+
+    Przed forkiem proces nadrzędny nie może mieć otwartych połączeń
+    z bazą ani działających wątków - zamyka je `before_fork`.
+    """
+
+    def __init__(self, app, host: str = '127.0.0.1', port: int = 5000,
+                 workers: int = WORKERS, threads: int = THREADS,
+                 timeout: float = TIMEOUT, graceful_timeout: float = GRACEFUL_TIMEOUT,
+                 backlog: int = BACKLOG,
+                 before_fork: Optional[Callable[[], None]] = None,
+                 on_worker_start: Optional[Callable[[int], None]] = None,
+                 on_worker_exit: Optional[Callable[[int], None]] = None):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("Prefork server requires os.fork (POSIX)")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.before_fork = before_fork
+        self.on_worker_start = on_worker_start
+        self.on_worker_exit = on_worker_exit
+        self.socket: Optional[socket.socket] = None
+        self._children: Dict[int, int] = {}  # pid -> indeks
+        self._heartbeats = RawArray('d', self.workers)
+        self._oldest_requests = RawArray('d', self.workers)
+        self._stopping = False
+
+    # Proces nadrzędny
+
+    def run(self) -> None:
+        self.socket = bind_socket(self.host, self.port, self.backlog)
+        self.port = self.socket.getsockname()[1]
+        print(f"Serwer na http://{self.host}:{self.port} "
+              f"({self.workers} procesów x {self.threads} wątków, pid {os.getpid()})")
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        try:
+            for index in range(self.workers):
+                self._spawn(index)
+            while not self._stopping:
+                self._reap()
+                self._check_heartbeats()
+                time.sleep(0.2)
+        finally:
+            self._shutdown_children()
+            self.socket.close()
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _spawn(self, index: int) -> None:
+        if self.before_fork:
+            self.before_fork()
+        self._heartbeats[index] = time.monotonic()
+        self._oldest_requests[index] = 0.0
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self._worker(index)
+                code = 0
+            except BaseException as e:
+                print(f"Proces {index} zakończony błędem: {e!r}", file=sys.stderr)
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self._children[pid] = index
+        # Wypisuje proces nadrzędny - wiersze kilku procesów na wspólnym wyjściu by się przeplatały
+        print(f"Proces {index} uruchomiony (pid {pid})")
+
+    def _reap(self) -> None:
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self._children.pop(pid, None)
+            if index is not None and not self._stopping:
+                print(f"Proces {index} (pid {pid}) zakończył się ({status}) - uruchamiam ponownie")
+                self._spawn(index)
+
+    def _check_heartbeats(self) -> None:
+        now = time.monotonic()
+        for pid, index in list(self._children.items()):
+            if now - self._heartbeats[index] > self.timeout:
+                print(f"Proces {index} (pid {pid}) nie odpowiada od {self.timeout} s - zabijam")
+            elif self._oldest_requests[index] and now - self._oldest_requests[index] > self.timeout:
+                print(f"Żądanie w procesie {index} (pid {pid}) trwa dłużej niż {self.timeout} s - zabijam")
+            else:
+                continue
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _shutdown_children(self) -> None:
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.graceful_timeout + 1
+        while self._children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self._children.pop(pid, None)
+            else:
+                time.sleep(0.05)
+
+        for pid in self._children:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self._children.clear()
+
+    # Proces potomny
+
+    def _worker(self, index: int) -> None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C obsługuje proces nadrzędny
+
+        master = os.getppid()
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            # shutdown() czeka na pętlę serve_forever, więc nie z jej wątku
+            if not stopping.is_set():
+                stopping.set()
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+        def heartbeat():
+            self._heartbeats[index] = time.monotonic()
+            self._oldest_requests[index] = server.oldest_request()
+            if os.getppid() != master:
+                # Proces nadrzędny zginął - nie zostawiamy osieroconych procesów
+                stop(None, None)
+
+        server = PooledWSGIServer(self.host, self.port, self.app, self.threads,
+                                  self.socket.fileno(), heartbeat)
+        signal.signal(signal.SIGTERM, stop)
+        if self.on_worker_start:
+            self.on_worker_start(index)
+        try:
+            server.serve_forever(poll_interval=0.5)
+        finally:
+            # Trwające żądania mogą jeszcze korzystać z usług zamykanych w on_worker_exit
+            server.drain(self.graceful_timeout)
+            if self.on_worker_exit:
+                self.on_worker_exit(index)
@@ -0,0 +1,92 @@
+import heapq
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Podział bazy na shardy.
+#
+# Bloki jednej pary (język, platforma) trafiają zawsze do tego samego
+# pliku SQLite - wybranego przez crc32 pary modulo liczba shardów - więc
+# podobieństwo (liczone tylko w obrębie pary) nie wychodzi poza shard,
+# a zapisy do różnych shardów nie czekają na wspólną blokadę zapisu.
+# Plik główny (DB_PATH) staje się katalogiem: lista shardów, shard
+# każdego bloku i tabele wspólne (zdarzenia, kolejka zapisu, wersja danych).
+
+SHARD_PATTERN = '{stem}.shard-{index:03d}{suffix}'
+
+
+def init_catalog(conn) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS shards (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL
+    )
+    """)
+    # Shard każdego bloku - odczyt po hashu (podobne, diff) i deduplikacja między shardami
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS block_shards (
+        hash TEXT PRIMARY KEY,
+        shard INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    ) WITHOUT ROWID
+    """)
+
+
+def shard_index(language: str, platform: str, count: int) -> int:
+    # crc32, a nie hash() - ten sam wynik w każdym procesie
+    return zlib.crc32(f"{language}\0{platform}".encode('utf-8')) % count
+
+
+def shard_path(catalog_path: str, index: int) -> str:
+    """Plik shardu obok katalogu, np. code_blocks.shard-003.db"""
+    path = Path(catalog_path)
+    return str(path.with_name(SHARD_PATTERN.format(stem=path.stem, index=index, suffix=path.suffix)))
+
+
+def register(conn, catalog_path: str, count: int) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO shards (id, path) VALUES (?, ?)",
+        [(index, Path(shard_path(catalog_path, index)).name) for index in range(count)]
+    )
+
+
+def count(conn) -> int:
+    return conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]
+
+
+def locate(conn, hashes: List[str]) -> Dict[str, int]:
+    """Numer shardu dla znanych hashy"""
+    found = {}
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        found.update(conn.execute(f"""
+            SELECT hash, shard FROM block_shards
+            WHERE hash IN ({', '.join('?' * len(chunk))})
+        """, chunk))
+    return found
+
+
+def add(conn, blocks: Iterable[Tuple[str, int, str]]) -> None:
+    """Zapisuje (hash, shard, created_at); pierwszy zapis hasha wygrywa"""
+    conn.executemany(
+        "INSERT OR IGNORE INTO block_shards (hash, shard, created_at) VALUES (?, ?, ?)",
+        blocks
+    )
+
+
+def newest_first(block: Dict) -> Tuple[str, str]:
+    return block['created_at'], block['hash']
+
+
+def merge(streams: Iterable[Iterable[Dict]], limit: Optional[int] = None,
+          key: Callable[[Dict], tuple] = newest_first) -> Iterator[Dict]:
+    """Scala strumienie posortowane malejąco według `key` w jeden - k-way merge.
+
+    Każdy strumień to kursor jednego shardu (domyślnie bloki od najnowszych);
+    heapq.merge trzyma w pamięci tylko po jednym elemencie z każdego.
+    """
+    merged = heapq.merge(*streams, key=key, reverse=True)
+    for count, block in enumerate(merged):
+        if limit is not None and count >= limit:
+            return
+        yield block
@@ -0,0 +1,42 @@
+import unittest
+import tempfile
+import shutil
+import os
+from pathlib import Path
+from unittest.mock import patch
+import app
+from app import init_db
+def block(code, **fields):
+    """Blok w formacie POST /code-blocks"""
+    return dict({"code": code, "language": "python", "platform": "github",
+                 "url": "https://test.com", "timestamp": "2024-01-01T00:00:00Z"}, **fields)
+class AppTestCase(unittest.TestCase):
+    """Aplikacja na tymczasowej bazie i katalogu plików.
+
+    `settings()` zwraca dodatkowe atrybuty modułu app, podmieniane przed init_db.
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        fd, self.temp_db = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.temp_db)
+        self.patch(app, DB_PATH=self.temp_db, STORAGE_DIR=Path(self.temp_dir), **self.settings())
+        init_db()
+        app.app.config['TESTING'] = True
+        self.client = app.app.test_client()
+    def settings(self):
+        return {}
+    def patch(self, target, **values):
+        """Podmienia atrybuty `target` do końca testu"""
+        for name, value in values.items():
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    def post(self, *blocks, **kwargs):
+        return self.client.post('/code-blocks', json={"blocks": list(blocks)}, **kwargs)
+    def save(self, *blocks):
+        """Zapisuje bloki; zwraca hashe z odpowiedzi"""
+        response = self.post(*blocks)
+        self.assertEqual(response.status_code, 200)
+        return [result['hash'] for result in response.get_json()['results']]
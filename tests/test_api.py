@@ -7,7 +7,6 @@ import tempfile
 from datetime import datetime
 import sqlite3
 from pathlib import Path
-from unittest.mock import patch, MagicMock
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app import app, init_db, STORAGE_DIR, DB_PATH
 class CodeBlocksAPITests(unittest.TestCase):
@@ -185,13 +184,6 @@ class CodeBlocksAPITests(unittest.TestCase):
         self.assertIn('diff', diff_data)
         self.assertIn('-    return 1', diff_data['diff'])
         self.assertIn('+    return 2', diff_data['diff'])
-    @patch('threading.Thread')
-    def test_change_monitoring(self, mock_thread):
-        with patch('app.watch_for_changes') as mock_watch:
-            from app import __main__
-            self.assertTrue(mock_thread.called)
-            self.assertEqual(mock_thread.call_args[1]['target'], mock_watch)
-            self.assertTrue(mock_thread.call_args[1]['daemon'])
     def test_invalid_requests(self):
         response = self.client.post('/code-blocks', json={})
         self.assertEqual(response.status_code, 200)
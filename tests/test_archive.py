@@ -0,0 +1,104 @@
+import unittest
+import sqlite3
+from pathlib import Path
+from unittest.mock import patch
+from click.testing import CliRunner
+import app
+import archive
+import db
+from base import AppTestCase, block
+BASE = ("def handler(request, limit=10):\n    value = request.args.get('x')\n"
+        "    if value is None or limit > 5:\n        return None\n"
+        "    items = [value * 2 for value in request.items if value]\n"
+        "    logger.debug('handled %s', value)\n    return len(items) * limit\n")
+class ArchiveTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.archive = archive.archive_path(self.temp_db)
+        self.addCleanup(self.remove_archive)
+    def settings(self):
+        return {'PAYLOAD_DEDUPE': False}
+    def remove_archive(self):
+        db.close_all()
+        for name in (self.archive, self.archive + '-wal', self.archive + '-shm'):
+            Path(name).unlink(missing_ok=True)
+    def age(self, *hashes):
+        with sqlite3.connect(self.temp_db) as conn:
+            conn.executemany("UPDATE code_blocks SET created_at = '2020-01-01T00:00:00' WHERE hash = ?",
+                             [(block_hash,) for block_hash in hashes])
+    def similar(self, block_hash):
+        return [(item['hash'], item['similarity']) for item in
+                self.client.get(f'/code-blocks/{block_hash}/similar').get_json()]
+    def test_old_blocks_move_to_archive(self):
+        first, second = self.save(block(BASE), block(BASE + "done = 1\n"))
+        recent, = self.save(block(BASE + "done = 2\n"))
+        files = {item['hash']: item['file_path'] for item in self.client.get('/code-blocks').get_json()}
+        similar = {block_hash: self.similar(block_hash) for block_hash in (second, recent)}
+        diff = self.client.get(f'/code-blocks/{first}/diff/{recent}').get_json()
+        self.age(first, second)
+        self.assertEqual(app.archive_blocks(before='2023-01-01'), 2)
+        self.assertEqual([item['hash'] for item in self.client.get('/code-blocks').get_json()], [recent])
+        self.assertFalse(Path(files[first]).exists())
+        self.assertTrue(Path(files[recent]).exists())
+        with sqlite3.connect(self.archive) as conn:
+            rows = conn.execute("SELECT hash, codec, file_path FROM code_blocks ORDER BY hash").fetchall()
+            self.assertEqual(rows, sorted([(first, 'zlib', ''), (second, 'zlib', '')]))
+            self.assertIsNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'code_search'").fetchone())
+        # Archiwum przezroczyste dla /similar i /diff - w obie strony
+        self.assertEqual({block_hash: self.similar(block_hash) for block_hash in (second, recent)}, similar)
+        self.assertEqual(self.client.get(f'/code-blocks/{first}/diff/{recent}').get_json(), diff)
+        self.assertEqual(self.client.get(f'/code-blocks/{first}/diff/missing').status_code, 404)
+        # Nowe bloki i zapytania porównujemy tylko z bazą roboczą, archiwum na życzenie
+        response = self.client.post('/code-blocks', json={"blocks": [block(BASE + "done = 3\n")]})
+        self.assertEqual([item['hash'] for item in response.get_json()['results'][0]['similar_blocks']], [recent])
+        query = {"code": BASE, "k": 2}
+        self.assertNotIn(first, [r['hash'] for r in self.client.post('/code-blocks/similar-query', json=query).get_json()])
+        results = self.client.post('/code-blocks/similar-query', json=dict(query, include_archive=True)).get_json()
+        self.assertEqual((results[0]['hash'], results[0]['similarity']), (first, 1.0))
+    def test_archived_block_can_be_posted_again(self):
+        old, = self.save(block(BASE))
+        self.age(old)
+        self.assertEqual(app.archive_blocks(before='2023-01-01'), 1)
+        response = self.post(block(BASE))
+        self.assertEqual(response.get_json()['saved_blocks'], 1)
+        self.assertEqual([item['hash'] for item in self.client.get('/code-blocks').get_json()], [old])
+    def test_size_budget(self):
+        hashes = [self.save(block(f"print({i})\n" * 10))[0] for i in range(3)]
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(archive.cold_hashes(conn, max_bytes=len("print(2)\n" * 10)), hashes[:2])
+            self.assertEqual(archive.cold_hashes(conn, before='2000-01-01'), [])
+        self.assertEqual(app.archive_blocks(max_bytes=len("print(2)\n" * 10) + 1), 2)
+        self.assertEqual(app.archive_blocks(max_bytes=len("print(2)\n" * 10) + 1), 0)
+        self.assertEqual([item['hash'] for item in self.client.get('/code-blocks').get_json()], hashes[2:])
+        diff = self.client.get(f'/code-blocks/{hashes[0]}/diff/{hashes[1]}').get_json()
+        self.assertIn('+print(1)', diff['diff'])
+    def test_dictionary_sampled_across_batches(self):
+        self.assertEqual(archive.dictionary_sample(list(range(10)), 3), [0, 3, 6])
+        self.age(*[self.save(block(BASE + f"done = {i}\n"))[0] for i in range(3)])
+        with patch.object(archive, 'DICTIONARY_SAMPLES', 2):
+            self.assertEqual(app.archive_blocks(before='2023-01-01', batch_size=1), 3)
+        with sqlite3.connect(self.archive) as conn:
+            self.assertEqual(conn.execute("SELECT sample_count FROM compression_dicts").fetchall(), [(2,)])
+            self.assertEqual({row[0] for row in conn.execute("SELECT dict_id FROM code_blocks")}, {1})
+    def test_orphaned_segments_removed(self):
+        with patch.object(app, 'STORAGE_BACKEND', 'pack'), patch.object(app, 'PACK_SEGMENT_SIZE', 1), \
+                patch.object(app, 'ARCHIVE_SEGMENT_AGE', 0):
+            hashes = [self.save(block(f"print({i})"))[0] for i in range(3)]
+            store = app.get_blob_store()
+            self.assertEqual(store.segments(), [1, 2, 3])
+            self.age(*hashes[1:])
+            app.archive_blocks(before='2023-01-01')
+            self.assertEqual(app.remove_orphaned_segments(), 1)
+            self.assertEqual(store.segments(), [1, 3])
+            diff = self.client.get(f'/code-blocks/{hashes[0]}/diff/{hashes[2]}').get_json()
+            self.assertEqual(diff['diff'].count('print'), 2)
+    def test_cli(self):
+        runner = CliRunner()
+        self.assertEqual(runner.invoke(app.cli, ['archive']).exit_code, 2)
+        old, = self.save(block(BASE))
+        self.age(old)
+        result = runner.invoke(app.cli, ['archive', '--older-than', '30'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('1 bloków', result.output)
+if __name__ == '__main__':
+    unittest.main()
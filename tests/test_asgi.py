@@ -0,0 +1,165 @@
+import unittest
+import asyncio
+import json
+import tempfile
+import shutil
+import os
+import threading
+from pathlib import Path
+from unittest.mock import patch
+import app
+import asgi
+import httpcache
+from app import init_db
+def block(code, **fields):
+    return dict({"code": code, "language": "python", "platform": "test",
+                 "url": "https://test.com", "timestamp": "2024-01-01T00:00:00Z"}, **fields)
+async def call(application, method, path, payload=None, headers=None, chunk_size=None):
+    """Wywołuje aplikację ASGI jak serwer; zwraca (status, nagłówki, części treści)"""
+    query = b''
+    if '?' in path:
+        path, query = path.split('?', 1)
+        query = query.encode()
+    body = json.dumps(payload).encode() if payload is not None else b''
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size else [body]
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+    sent = []
+    async def send(message):
+        sent.append(message)
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]}
+    await application(scope, receive, send)
+    start = sent[0]
+    return (start['status'], {k.decode(): v.decode() for k, v in start['headers']},
+            [message.get('body', b'') for message in sent[1:]])
+class AsgiTestCase(unittest.TestCase):
+    cpu_workers = 0
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        fd, self.temp_db = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.temp_db)
+        for patcher in (patch.object(app, 'DB_PATH', self.temp_db),
+                        patch.object(app, 'STORAGE_DIR', Path(self.temp_dir)),
+                        patch.object(app, 'PAYLOAD_DEDUPE', False)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        init_db()
+        app.app.config['TESTING'] = True
+        self.flask = app.app.test_client()
+        self.application = asgi.AsgiApp(db_threads=2, cpu_workers=self.cpu_workers)
+        self.addCleanup(self.application.shutdown)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+    def request(self, method, path, payload=None, headers=None, chunk_size=None):
+        status, headers, chunks = self.loop.run_until_complete(
+            call(self.application, method, path, payload, headers, chunk_size))
+        return status, headers, b''.join(chunks)
+    def get_json(self, path):
+        status, _, body = self.request('GET', path)
+        self.assertEqual(status, 200)
+        return json.loads(body)
+class AsgiRoutesTests(AsgiTestCase):
+    def test_same_responses_as_flask(self):
+        base = "def handler(request):\n    value = request.args.get('x')\n    return value * 2\n"
+        status, _, body = self.request('POST', '/code-blocks', {"blocks": [
+            block(base), block(base.replace('* 2', '* 3'))
+        ]}, chunk_size=50)
+        self.assertEqual(status, 200)
+        saved = json.loads(body)
+        self.assertEqual(saved['saved_blocks'], 2)
+        first, second = (result['hash'] for result in saved['results'])
+        self.assertEqual(saved['results'][1]['similar_blocks'][0]['hash'], first)
+        for path in ('/code-blocks', '/code-blocks?limit=1', '/code-blocks?platform=none',
+                     f'/code-blocks/{second}/similar',
+                     f'/code-blocks/{first}/diff/{second}?context=0'):
+            self.assertEqual(self.get_json(path), self.flask.get(path).get_json(), path)
+        status, headers, _ = self.request('GET', '/code-blocks?limit=1')
+        self.assertEqual(headers['x-next-cursor'], self.flask.get('/code-blocks?limit=1').headers['X-Next-Cursor'])
+        self.assertEqual(headers['access-control-allow-origin'], '*')
+        query = {"code": base.replace('* 2', '* 4'), "k": 1}
+        status, _, body = self.request('POST', '/code-blocks/similar-query', query)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), self.flask.post('/code-blocks/similar-query', json=query).get_json())
+        self.assertEqual(self.request('POST', '/code-blocks/similar-query', {"k": 1})[0], 400)
+        for path in ('/code-blocks', f'/code-blocks/{second}/similar', f'/code-blocks/{first}/diff/{second}'):
+            _, headers, _ = self.request('GET', path)
+            self.assertEqual(headers['etag'], self.flask.get(path).headers['ETag'], path)
+            status, _, body = self.request('GET', path, headers={'If-None-Match': headers['etag']})
+            self.assertEqual((status, body), (304, b''), path)
+    def test_database_and_encoding_off_the_loop(self):
+        saved = json.loads(self.request('POST', '/code-blocks', {"blocks": [block("x = 1"), block("x = 2")]})[2])
+        first, second = (result['hash'] for result in saved['results'])
+        threads = []
+        def record(func):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return func(*args, **kwargs)
+            return wrapper
+        with patch.object(app, 'data_version', record(app.data_version)), \
+                patch.object(app, 'store_response', record(app.store_response)), \
+                patch.object(httpcache.get_version(self.temp_db), 'refresh_interval', 0):
+            for path in ('/code-blocks', f'/code-blocks/{second}/similar', f'/code-blocks/{first}/diff/{second}'):
+                self.assertEqual(self.request('GET', path)[0], 200, path)
+        self.assertEqual(len(threads), 5)
+        self.assertNotIn(threading.main_thread(), threads)
+    def test_ndjson_is_streamed_page_by_page(self):
+        self.request('POST', '/code-blocks', {"blocks": [block(f"print({i})") for i in range(5)]})
+        with patch.object(app, 'NDJSON_BATCH_SIZE', 2):
+            status, headers, chunks = self.loop.run_until_complete(
+                call(self.application, 'GET', '/code-blocks?format=ndjson'))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'application/x-ndjson')
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertGreaterEqual(len([chunk for chunk in chunks if chunk]), 3)
+        self.assertEqual([json.loads(line) for line in lines],
+                         [json.loads(line) for line in self.flask.get('/code-blocks?format=ndjson').get_data(as_text=True).splitlines()])
+    def test_errors(self):
+        self.assertEqual(self.request('GET', '/code-blocks?after=bad')[0], 400)
+        self.assertEqual(self.request('GET', '/code-blocks/a/diff/b')[0], 404)
+        self.assertEqual(self.request('GET', '/nothing')[0], 404)
+        status, headers, _ = self.request('DELETE', '/code-blocks')
+        self.assertEqual(status, 405)
+        self.assertIn('POST', headers['allow'])
+        status, _, body = self.request('POST', '/code-blocks', {"blocks": [{"code": "x"}]})
+        self.assertEqual(status, 400)
+        self.assertIn('Missing block fields', json.loads(body)['error'])
+    def test_many_concurrent_requests_share_few_threads(self):
+        self.request('POST', '/code-blocks', {"blocks": [block("print('hello')")]})
+        async def many():
+            return await asyncio.gather(*(call(self.application, 'GET', '/code-blocks') for _ in range(500)))
+        results = self.loop.run_until_complete(many())
+        self.assertTrue(all(status == 200 for status, _, _ in results))
+        self.assertEqual(len(self.application.db_executor._threads), 2)
+    def test_lifespan(self):
+        application = asgi.AsgiApp(db_threads=1, cpu_workers=0)
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+        async def receive():
+            return messages.pop(0)
+        async def send(message):
+            sent.append(message['type'])
+        self.loop.run_until_complete(application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIsNone(application.db_executor)
+class AsgiProcessPoolTests(AsgiTestCase):
+    cpu_workers = 1
+    def test_large_payload_is_scored_in_process_pool(self):
+        base = "\n".join(f"result_{i} = compute(values[{i}], scale={i % 7})" for i in range(1500))
+        with patch.object(asgi, 'PARALLEL_MIN_CHARS', 1000):
+            status, _, body = self.request('POST', '/code-blocks', {"blocks": [
+                block(base), block(base.replace('scale=3', 'scale=4'))
+            ]})
+        self.assertEqual(status, 200)
+        results = json.loads(body)['results']
+        self.assertEqual(len(results), 2)
+        self.assertGreater(self.application.engine.stats['pool_ratio_calls'], 0)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import json
+import random
+import tempfile
+import shutil
+from collections import Counter
+from pathlib import Path
+from click.testing import CliRunner
+from benchmarks import corpus, suite
+class CorpusTests(unittest.TestCase):
+    def test_same_seed_same_corpus(self):
+        self.assertEqual(list(corpus.iter_blocks(200, seed=3)), list(corpus.iter_blocks(200, seed=3)))
+        self.assertNotEqual(list(corpus.iter_blocks(200, seed=3)), list(corpus.iter_blocks(200, seed=4)))
+    def test_duplicate_rates_and_mix(self):
+        blocks = list(corpus.iter_blocks(2000, seed=1, duplicate_rate=0.2, near_duplicate_rate=0,
+                                         languages={'python': 1, 'go': 1}, platforms={'github': 1}))
+        copies = len(blocks) - len({block['code'] for block in blocks})
+        self.assertAlmostEqual(copies / len(blocks), 0.2, delta=0.05)
+        self.assertEqual(set(Counter(block['language'] for block in blocks)), {'python', 'go'})
+        self.assertEqual({block['platform'] for block in blocks}, {'github'})
+        none = list(corpus.iter_blocks(500, seed=1, duplicate_rate=0, near_duplicate_rate=0))
+        self.assertEqual(len({block['code'] for block in none}), 500)
+    def test_generated_python_compiles_and_respects_size(self):
+        rng = random.Random(0)
+        for lines in (5, 20, 60):
+            code = corpus.generate_code(rng, 'python', lines)
+            compile(code, 'block', 'exec')
+            self.assertLessEqual(abs(len(code.splitlines()) - lines), 2)
+    def test_near_duplicates_stay_similar(self):
+        rng = random.Random(0)
+        code = corpus.generate_code(rng, 'javascript', 30)
+        edited = corpus.mutate(rng, code, 1)
+        self.assertNotEqual(edited, code)
+        self.assertGreater(len(set(edited.splitlines()) & set(code.splitlines())), 20)
+class SuiteTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+    def test_run_and_compare(self):
+        runner = CliRunner()
+        output = self.temp_dir / 'results.json'
+        result = runner.invoke(suite.cli, ['run', '--sizes', '120', '--ops', '5', '--page-size', '20',
+                                           '--work-dir', str(self.temp_dir), '-o', str(output)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        report = json.loads(output.read_text())
+        self.assertEqual([r['scenario'] for r in report['results']], list(suite.SCENARIOS))
+        ingest = report['results'][0]
+        self.assertEqual((ingest['blocks'], ingest['items'], ingest['ops']), (120, 120, 6))
+        self.assertTrue(all(r['ops'] > 0 and r['items_s'] > 0 for r in report['results']))
+        self.assertEqual([path.name for path in self.temp_dir.iterdir()], ['results.json'])
+        result = runner.invoke(suite.cli, ['compare', str(output), str(output)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertNotIn('REGRESSION', result.output)
+    def test_compare_flags_regressions(self):
+        def report(items_s, p50_ms, seconds):
+            return {'results': [{'scenario': 'similar', 'blocks': 1000, 'ops': 100, 'items_s': items_s,
+                                 'p50_ms': p50_ms, 'seconds': seconds}]}
+        baseline = report(1000.0, 1.0, 0.1)
+        self.assertFalse(suite.compare(baseline, report(900.0, 1.1, 0.11))[0]['regression'])
+        self.assertTrue(suite.compare(baseline, report(500.0, 1.0, 0.2))[0]['regression'])
+        self.assertTrue(suite.compare(baseline, report(1000.0, 2.0, 0.1))[0]['regression'])
+        # Względnie duża, ale bezwzględnie pomijalna zmiana to szum
+        fast = report(100000.0, 0.01, 0.001)
+        self.assertFalse(suite.compare(fast, report(50000.0, 0.02, 0.002))[0]['regression'])
+        self.assertEqual(suite.compare(baseline, report(1000.0, 1.0, 0.1), tolerance=0.1)[0]['throughput_change'], 0)
+    def test_sizes(self):
+        self.assertEqual(suite.parse_sizes('1k,10k,100k,1M,250'), [1000, 10000, 100000, 1000000, 250])
+        self.assertEqual(suite.size_label(100000), '100k')
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import json
+import app
+import clusters
+from base import AppTestCase, block
+BODIES = {
+    'alpha': "\n".join(f"def scale_{n}(x):\n    return x * {n}" for n in range(8)),
+    'beta': "\n".join(f"class Node{n}:\n    children = []\n    parent = None" for n in range(6)),
+}
+def variant(base, i):
+    return BODIES[base] + f"\n# variant {i}\n"
+class ClusterTests(AppTestCase):
+    def save_codes(self, *codes):
+        return self.save(*[block(code) for code in codes])
+    def cluster_of(self, block_hash):
+        with app.get_db() as conn:
+            return conn.execute("SELECT cluster_id FROM code_blocks WHERE hash = ?",
+                                (block_hash,)).fetchone()[0]
+    def test_variants_share_cluster(self):
+        first = self.save_codes(variant('alpha', 0), variant('beta', 0))
+        second = self.save_codes(variant('alpha', 1), variant('alpha', 2))
+        self.assertEqual(len({self.cluster_of(h) for h in [first[0]] + second}), 1)
+        self.assertNotEqual(self.cluster_of(first[0]), self.cluster_of(first[1]))
+        cluster = json.loads(self.client.get(f'/clusters/{self.cluster_of(first[0])}').data)
+        self.assertEqual(cluster['size'], 3)
+        centrality = [m['centrality'] for m in cluster['members']]
+        self.assertEqual(centrality, sorted(centrality, reverse=True))
+        self.assertGreater(centrality[0], 0)
+    def test_list_clusters(self):
+        self.save_codes(variant('alpha', 0), variant('alpha', 1), variant('alpha', 2))
+        self.save_codes(variant('beta', 0), variant('beta', 1), "print('alone')")
+        listed = json.loads(self.client.get('/clusters').data)
+        self.assertEqual([c['size'] for c in listed], [3, 2])
+        self.assertEqual(len(listed[0]['members']), 3)
+        first = self.client.get('/clusters?limit=1&members=1')
+        self.assertEqual(len(json.loads(first.data)[0]['members']), 1)
+        rest = json.loads(self.client.get(f"/clusters?after={first.headers['X-Next-Cursor']}").data)
+        self.assertEqual([c['size'] for c in rest], [2])
+        singles = json.loads(self.client.get('/clusters?min_size=1').data)
+        self.assertEqual(len(singles), 3)
+    def test_invalid_cursor(self):
+        for cursor in ('3', 'x,1', '3,y'):
+            response = self.client.get(f'/clusters?after={cursor}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.data), {'error': 'Invalid cursor'})
+    def test_bridge_merges_clusters(self):
+        left, right, bridge = self.save_codes(variant('alpha', 0), variant('beta', 0), "print('bridge')")
+        self.assertEqual(len({self.cluster_of(h) for h in (left, right, bridge)}), 3)
+        with app.get_db() as conn:
+            clusters.add_blocks(conn, [], [(bridge, left, 0.9), (bridge, right, 0.8)])
+        ids = {self.cluster_of(h) for h in (left, right, bridge)}
+        self.assertEqual(len(ids), 1)
+        cluster = json.loads(self.client.get(f'/clusters/{ids.pop()}').data)
+        self.assertEqual(cluster['size'], 3)
+        self.assertEqual(cluster['members'][0]['hash'], bridge)
+        self.assertAlmostEqual(cluster['members'][0]['centrality'], 1.7)
+        self.assertEqual(len(json.loads(self.client.get('/clusters?min_size=1').data)), 1)
+    def test_rebuild_matches_incremental(self):
+        self.save_codes(variant('alpha', 0), variant('alpha', 1), variant('beta', 0))
+        self.save_codes(variant('alpha', 2), variant('beta', 1))
+        with app.get_db() as conn:
+            before = conn.execute("SELECT hash, cluster_id, centrality FROM code_blocks").fetchall()
+            clusters.rebuild(conn)
+            after = conn.execute("SELECT hash, cluster_id, centrality FROM code_blocks").fetchall()
+        def partition(rows):
+            groups = {}
+            for block_hash, cluster_id, _ in rows:
+                groups.setdefault(cluster_id, set()).add(block_hash)
+            return sorted(map(sorted, groups.values()))
+        self.assertEqual(partition(before), partition(after))
+        self.assertEqual({r[0]: round(r[2], 6) for r in before}, {r[0]: round(r[2], 6) for r in after})
+    def test_cluster_query_uses_index(self):
+        with app.get_db() as conn:
+            plan = ' '.join(row[-1] for row in conn.execute("""
+                EXPLAIN QUERY PLAN SELECT hash FROM code_blocks
+                WHERE cluster_id = 1 ORDER BY centrality DESC, hash LIMIT 10
+            """))
+        self.assertIn('idx_code_blocks_cluster', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    def test_missing_cluster(self):
+        self.assertEqual(self.client.get('/clusters/999').status_code, 404)
+        self.assertEqual(self.client.get('/clusters?after=x').status_code, 400)
+if __name__ == '__main__':
+    unittest.main()
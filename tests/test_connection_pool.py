@@ -0,0 +1,46 @@
+import unittest
+import tempfile
+import threading
+import os
+import db
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.temp_db = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.temp_db)
+        self.pool = db.ConnectionPool(self.temp_db)
+        self.addCleanup(self.pool.close)
+    def test_pragmas(self):
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+    def test_connection_is_reused(self):
+        with self.pool.connection() as first:
+            with self.pool.connection() as nested:
+                self.assertIs(first, nested)
+        with self.pool.connection() as second:
+            self.assertIs(first, second)
+    def test_threads_get_separate_connections(self):
+        seen = []
+        barrier = threading.Barrier(2)
+        def worker():
+            with self.pool.connection() as conn:
+                seen.append(conn)
+                barrier.wait()
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertIsNot(seen[0], seen[1])
+    def test_rollback_on_error(self):
+        with self.pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection() as conn:
+                conn.execute("INSERT INTO t VALUES (1)")
+                raise RuntimeError()
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch
+import app
+import dedupe
+from app import init_db, calculate_hash
+from base import AppTestCase, block
+class BloomFilterTests(unittest.TestCase):
+    def test_no_false_negatives_and_low_error_rate(self):
+        bloom = dedupe.BloomFilter(1000, 0.01)
+        stored = [calculate_hash(f"stored {i}") for i in range(1000)]
+        for block_hash in stored:
+            bloom.add(block_hash)
+        self.assertTrue(all(block_hash in bloom for block_hash in stored))
+        false_positives = sum(calculate_hash(f"other {i}") in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertFalse(bloom.saturated)
+    def test_lru_is_bounded(self):
+        cache = dedupe.DedupeCache(capacity=100, lru_size=2)
+        cache.add(['a' * 64, 'b' * 64, 'c' * 64])
+        lookups = []
+        known = cache.known(['a' * 64, 'c' * 64], lambda hashes: lookups.extend(hashes) or set(hashes))
+        self.assertEqual(known, {'a' * 64, 'c' * 64})
+        self.assertEqual(lookups, ['a' * 64])
+        self.assertEqual(cache.stats['lru_hits'], 1)
+        self.assertEqual(cache.stats['db_hits'], 1)
+class DedupeIngestTests(AppTestCase):
+    def settings(self):
+        return {'PAYLOAD_DEDUPE': False}
+    def ingest(self, *codes):
+        return self.post(*[block(code) for code in codes]).get_json()
+    def test_resend_does_not_touch_database(self):
+        self.ingest("print('a')", "print('b')")
+        with patch.object(app, 'get_db', side_effect=AssertionError('database used')):
+            self.assertEqual(self.ingest("print('a')", "print('b')")['saved_blocks'], 0)
+        stats = app.app.config['DEDUPE_STATS']
+        self.assertEqual(stats['lru_hits'], 2)
+    def test_new_blocks_skip_lookup(self):
+        self.ingest("print('a')")
+        with patch.object(app, 'existing_hashes', wraps=app.existing_hashes) as lookup:
+            self.assertEqual(self.ingest("print('new')")['saved_blocks'], 1)
+        # Jedyne sprawdzenie to to w transakcji zapisu
+        self.assertEqual(lookup.call_count, 1)
+        self.assertEqual(app.app.config['DEDUPE_STATS']['bloom_negatives'], 2)
+    def test_warmed_from_database(self):
+        self.ingest("print('a')", "print('b')")
+        with patch.object(app, 'DEDUPE_LRU_SIZE', 1):
+            init_db()
+        stats = app.app.config['DEDUPE_STATS']
+        self.assertEqual(self.ingest("print('a')", "print('b')")['saved_blocks'], 0)
+        self.assertEqual(stats['lru_hits'] + stats['db_hits'], 2)
+        self.assertEqual(stats['db_hits'], 1)
+    def test_disabled(self):
+        self.ingest("print('a')")
+        with patch.object(app, 'DEDUPE_CACHE', False):
+            self.assertEqual(self.ingest("print('a')")['saved_blocks'], 0)
+            self.assertEqual(self.ingest("print('c')")['saved_blocks'], 1)
+if __name__ == '__main__':
+    unittest.main()
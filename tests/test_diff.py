@@ -0,0 +1,99 @@
+import unittest
+import json
+import tempfile
+import shutil
+import os
+import random
+from pathlib import Path
+from unittest.mock import patch
+import app
+import diffing
+from app import init_db
+class DiffingTests(unittest.TestCase):
+    def test_opcodes_rebuild_target(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            old = [f"{rng.randint(0, 8)}\n" for _ in range(rng.randint(0, 30))]
+            new = list(old)
+            for _ in range(rng.randint(0, 5)):
+                if new and rng.random() < 0.5:
+                    del new[rng.randrange(len(new))]
+                else:
+                    new.insert(rng.randint(0, len(new)), f"{rng.randint(0, 12)}\n")
+            a, b = diffing.intern_lines(''.join(old), ''.join(new))
+            rebuilt = []
+            for tag, i1, i2, j1, j2 in diffing.opcodes(a, b):
+                if tag == 'equal':
+                    self.assertEqual(a[i1:i2], b[j1:j2])
+                    rebuilt.extend(old[i1:i2])
+                else:
+                    rebuilt.extend(new[j1:j2])
+            self.assertEqual(rebuilt, new)
+    def test_unified_format(self):
+        diff, truncated = diffing.unified_diff("def f():\n    return 1\n", "def f():\n    return 2\n", 'x', 'y')
+        self.assertFalse(truncated)
+        self.assertEqual(diff, "--- x\n+++ y\n@@ -1,2 +1,2 @@\n def f():\n-    return 1\n+    return 2\n")
+        self.assertEqual(diffing.unified_diff("same\n", "same\n"), ('', False))
+    def test_context_and_limit(self):
+        old = ''.join(f"line {i}\n" for i in range(100))
+        new = old.replace("line 50\n", "changed\n")
+        diff, _ = diffing.unified_diff(old, new, context=0)
+        self.assertIn("@@ -51 +51 @@", diff)
+        self.assertNotIn("line 49", diff)
+        diff, truncated = diffing.unified_diff(old, ''.join(reversed(old.splitlines(True))), max_bytes=100)
+        self.assertTrue(truncated)
+        self.assertLessEqual(len(diff), 100)
+    def test_cache_is_bounded(self):
+        cache = diffing.DiffCache(max_bytes=10)
+        cache.put('a', ('12345', False))
+        cache.put('b', ('12345', False))
+        cache.get('a')
+        cache.put('c', ('12345', False))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), ('12345', False))
+        self.assertLessEqual(cache.size, 10)
+class DiffEndpointTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        fd, self.temp_db = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.temp_db)
+        for patcher in (patch.object(app, 'DB_PATH', self.temp_db),
+                        patch.object(app, 'STORAGE_DIR', Path(self.temp_dir)),
+                        patch.object(app, 'diff_cache', diffing.DiffCache(1024 * 1024))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        init_db()
+        self.client = app.app.test_client()
+        codes = [''.join(f"value_{i} = {i}\n" for i in range(200))]
+        codes.append(codes[0].replace("value_100 = 100\n", "value_100 = -1\n"))
+        response = self.client.post('/code-blocks', json={"blocks": [{
+            "code": code,
+            "language": "python",
+            "platform": "test",
+            "url": "https://test.com",
+            "timestamp": "2024-01-01T00:00:00Z",
+            "title": "Test"
+        } for code in codes]})
+        self.hashes = [r['hash'] for r in json.loads(response.data)['results']]
+    def test_diff_is_cached(self):
+        url = f'/code-blocks/{self.hashes[0]}/diff/{self.hashes[1]}'
+        first = json.loads(self.client.get(url).data)
+        self.assertIn('-value_100 = 100', first['diff'])
+        self.assertFalse(first['truncated'])
+        with patch.object(app, 'load_code', side_effect=AssertionError('not cached')):
+            self.assertEqual(json.loads(self.client.get(url).data), first)
+        self.assertEqual(app.diff_cache.hits, 1)
+    def test_context_and_max_bytes(self):
+        url = f'/code-blocks/{self.hashes[0]}/diff/{self.hashes[1]}'
+        wide = json.loads(self.client.get(url + '?context=10').data)['diff']
+        self.assertEqual(len(wide.splitlines()), 3 + 21 + 1)
+        short = json.loads(self.client.get(url + '?max_bytes=20').data)
+        self.assertTrue(short['truncated'])
+        self.assertLessEqual(len(short['diff']), 20)
+    def test_missing_block(self):
+        response = self.client.get(f'/code-blocks/{self.hashes[0]}/diff/missing')
+        self.assertEqual(response.status_code, 404)
+if __name__ == '__main__':
+    unittest.main()
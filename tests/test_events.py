@@ -0,0 +1,74 @@
+import unittest
+import json
+import threading
+from unittest.mock import patch
+import app
+import events
+from base import AppTestCase, block
+def parse_sse(chunk):
+    fields = {}
+    for line in chunk.decode().splitlines():
+        name, _, value = line.partition(': ')
+        fields[name] = value
+    return fields
+class ChangeEventsTests(AppTestCase):
+    def settings(self):
+        return {'event_bus': events.EventBus(buffer_size=4)}
+    def publish(self, *codes):
+        return self.post(*[block(code) for code in codes])
+    def open_stream(self, last_event_id=None):
+        headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+        response = self.client.get('/events', headers=headers, buffered=False)
+        self.addCleanup(response.close)
+        chunks = iter(response.response)
+        self.assertTrue(next(chunks).startswith(b'retry: '))
+        return response, chunks
+    def test_replay_from_last_event_id(self):
+        self.publish("def a():\n    return 1\n" * 5, "def a():\n    return 1\n" * 5 + "# x\n")
+        response, chunks = self.open_stream(0)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        received = [parse_sse(next(chunks)) for _ in range(3)]
+        self.assertEqual([e['event'] for e in received], ['block', 'block', 'similar'])
+        self.assertEqual([int(e['id']) for e in received], [1, 2, 3])
+        similar = json.loads(received[2]['data'])
+        self.assertEqual(similar['similar_blocks'][0]['hash'], json.loads(received[0]['data'])['hash'])
+        # Wznowienie od środka pomija już odebrane
+        _, chunks = self.open_stream(2)
+        self.assertEqual(parse_sse(next(chunks))['id'], '3')
+    def test_change_events(self):
+        self.publish("print('event')")
+        response, chunks = self.open_stream(0)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(parse_sse(next(chunks))['event'], 'block')
+    def test_live_events_without_polling(self):
+        with patch.object(app, 'EVENTS_KEEPALIVE', 5):
+            _, chunks = self.open_stream()
+            first = threading.Timer(0.1, self.publish, args=("print('live')",))
+            first.start()
+            with patch.object(events, 'events_after', side_effect=AssertionError('polled')):
+                event = parse_sse(next(chunks))
+            first.join()
+        self.assertEqual(event['event'], 'block')
+        self.assertEqual(json.loads(event['data'])['language'], 'python')
+    def test_keepalive(self):
+        with patch.object(app, 'EVENTS_KEEPALIVE', 0.05):
+            _, chunks = self.open_stream()
+            self.assertEqual(next(chunks), b': keepalive\n\n')
+    def test_slow_subscriber_is_disconnected(self):
+        subscription = app.event_bus.subscribe()
+        self.publish(*[f"print({i})" for i in range(6)])
+        self.assertTrue(subscription.overflowed)
+        subscription.close()
+        self.assertEqual(app.event_bus.subscriber_count(), 0)
+    def test_invalid_last_event_id(self):
+        response = self.client.get('/events', headers={'Last-Event-ID': 'abc'})
+        self.assertEqual(response.status_code, 400)
+    def test_old_events_are_pruned(self):
+        with patch.object(events, 'RETENTION', 3), patch.object(events, 'PRUNE_EVERY', 2):
+            self.publish(*[f"print({i})" for i in range(5)])
+        with app.get_db() as conn:
+            seqs = [event['seq'] for event in events.events_after(conn, 0)]
+            last = events.last_seq(conn)
+        self.assertEqual(seqs, [last - 2, last - 1, last])
+if __name__ == '__main__':
+    unittest.main()
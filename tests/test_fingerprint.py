@@ -0,0 +1,104 @@
+import unittest
+import sqlite3
+import tempfile
+import shutil
+import os
+from array import array
+from pathlib import Path
+from unittest.mock import patch
+import app
+import fingerprint
+from app import CodeBlock, init_db, save_code_block, calculate_hash
+from scoring import ScoringEngine
+class TokenizeTests(unittest.TestCase):
+    def test_comments_and_whitespace_are_dropped(self):
+        self.assertEqual(fingerprint.tokenize("x  =  f(a)  # call\n\n\ty=1", 'python'),
+                         ['x', '=', 'f', '(', 'a', ')', 'y', '=', '1'])
+        self.assertEqual(fingerprint.tokenize("/* a */ let s = '// no' + `x`; // b", 'js'),
+                         ['let', 's', '=', "'// no'", '+', '`x`', ';'])
+        self.assertEqual(fingerprint.tokenize('s = """# kept\n"""', 'python'), ['s', '=', '"""# kept\n"""'])
+        self.assertEqual(fingerprint.tokenize("SELECT 1 -- x\n/* y */", 'sql'), ['SELECT', '1'])
+        # Nieznany język - bez usuwania komentarzy, ale z tokenizacją
+        self.assertEqual(fingerprint.tokenize("a >= b", 'brainfuck'), ['a', '>=', 'b'])
+    def test_canonical_identifiers_keep_keywords(self):
+        self.assertEqual(fingerprint.tokenize("def total(items): return len(items)", 'python', canonical=True),
+                         ['def', 'ID', '(', 'ID', ')', ':', 'return', 'len', '(', 'ID', ')'])
+        self.assertEqual(fingerprint.tokenize("select name from users", 'sql', canonical=True),
+                         ['select', 'ID', 'from', 'ID'])
+    def test_fingerprint_bytes(self):
+        data = fingerprint.fingerprint("a = 1", 'python')
+        self.assertEqual(len(data), 3 * 4)
+        self.assertEqual(len(fingerprint.from_bytes(data)), 3)
+        self.assertEqual(data, fingerprint.fingerprint("a=1   # same", 'py'))
+    def test_long_token_sequences_are_scored_exactly(self):
+        # 20 różnych tokenów na 2000 pozycjach - autojunk uznałby wszystkie za szum
+        tokens = array('I', [i % 20 for i in range(2000)])
+        other = tokens[:]
+        other[1000] = 99
+        exact = ScoringEngine(0.9, junk_limit=5000).score(tokens, [('x', len(other))], lambda keys: {'x': other})
+        self.assertGreater(exact[0][1], 0.99)
+        self.assertEqual(ScoringEngine(0.9).score(tokens, [('x', len(other))], lambda keys: {'x': other}), [])
+class TokenSimilarityTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        fd, self.temp_db = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.temp_db)
+        for patcher in (patch.object(app, 'DB_PATH', self.temp_db),
+                        patch.object(app, 'STORAGE_DIR', Path(self.temp_dir)),
+                        patch.object(app, 'TOKEN_SIMILARITY', True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        init_db()
+    def make_block(self, code, language="python"):
+        return CodeBlock(code=code, language=language, platform="test", url="https://test.com",
+                         timestamp="2024-01-01T00:00:00Z", title="Test", hash=calculate_hash(code))
+    CODE = ("def handler(request):\n    value = request.args.get('x')\n"
+            "    if value is None:\n        return None\n    return value * 2\n")
+    def test_reformatted_block_is_similar(self):
+        original = save_code_block(self.make_block(self.CODE))
+        reformatted = ("# Handler\ndef handler( request ):\n\tvalue = request.args.get( 'x' )  # read\n"
+                       "\tif value is None:\n\t\treturn None\n\n\treturn value * 2")
+        # Na znakach ta zmiana spada poniżej progu
+        self.assertLess(app.compute_similarity(self.CODE, reformatted), app.SIMILARITY_THRESHOLD)
+        result = save_code_block(self.make_block(reformatted))
+        self.assertEqual([(b['hash'], b['similarity']) for b in result['similar_blocks']],
+                         [(original['hash'], 1.0)])
+        with sqlite3.connect(self.temp_db) as conn:
+            stored = dict(conn.execute("SELECT hash, tokens FROM block_tokens").fetchall())
+        self.assertEqual(stored[original['hash']], fingerprint.fingerprint(self.CODE, 'python'))
+    def test_same_batch_and_other_languages(self):
+        blocks = [self.make_block(self.CODE), self.make_block(self.CODE + "\n\n# end\n"),
+                  self.make_block(self.CODE, language="ruby-ish")]
+        blocks[2].hash = calculate_hash(self.CODE + 'ruby')
+        results = app.save_code_blocks(blocks)
+        self.assertEqual([b['hash'] for b in results[1]['similar_blocks']], [blocks[0].hash])
+        self.assertEqual(results[2]['similar_blocks'], [])
+    def test_renamed_identifiers_with_canonical_mode(self):
+        renamed = self.CODE.replace('value', 'result').replace('request', 'req')
+        with patch.object(app, 'CANONICAL_IDENTIFIERS', True):
+            original = save_code_block(self.make_block(self.CODE))
+            result = save_code_block(self.make_block(renamed))
+        self.assertEqual([b['hash'] for b in result['similar_blocks']], [original['hash']])
+    def test_missing_fingerprints_are_backfilled(self):
+        original = save_code_block(self.make_block(self.CODE))
+        with sqlite3.connect(self.temp_db) as conn:
+            conn.execute("DELETE FROM block_tokens")
+        # Bez zapisanego odcisku porównanie liczy go z kodu
+        result = save_code_block(self.make_block(self.CODE + "\n"))
+        self.assertEqual([b['hash'] for b in result['similar_blocks']], [original['hash']])
+        with patch.object(app, 'CANONICAL_IDENTIFIERS', True):
+            init_db()
+            with sqlite3.connect(self.temp_db) as conn:
+                schemes = conn.execute("SELECT DISTINCT scheme FROM block_tokens").fetchall()
+                count = conn.execute("SELECT COUNT(*) FROM block_tokens").fetchone()[0]
+        self.assertEqual(schemes, [(fingerprint.scheme(True),)])
+        self.assertEqual(count, 2)
+    def test_character_similarity_when_disabled(self):
+        save_code_block(self.make_block(self.CODE))
+        with patch.object(app, 'TOKEN_SIMILARITY', False):
+            result = save_code_block(self.make_block("# Handler\n" + self.CODE.replace('    ', '\t')))
+        self.assertEqual(result['similar_blocks'], [])
+if __name__ == '__main__':
+    unittest.main()
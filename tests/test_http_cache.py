@@ -0,0 +1,74 @@
+import unittest
+import sqlite3
+from unittest.mock import patch
+import app
+import httpcache
+from base import AppTestCase, block
+class ConditionalGetTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hashes = self.save_codes("x = 1\ny = 2\n", "x = 1\ny = 3\n")
+    def settings(self):
+        return {'PAYLOAD_DEDUPE': False, 'response_cache': httpcache.ResponseCache(1024 * 1024)}
+    def save_codes(self, *codes):
+        return self.save(*[block(code) for code in codes])
+    def test_not_modified_without_database(self):
+        for url in ('/code-blocks?limit=1', f'/code-blocks/{self.hashes[1]}/similar',
+                    f'/code-blocks/{self.hashes[0]}/diff/{self.hashes[1]}'):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200, url)
+            etag = first.headers['ETag']
+            self.assertFalse(etag.startswith('W/'))
+            with patch.object(app, 'get_db', side_effect=AssertionError('database used')), \
+                    patch.object(httpcache.get_version(self.temp_db), 'refresh_interval', 3600):
+                second = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(second.status_code, 304, url)
+            self.assertEqual(second.data, b'')
+            self.assertEqual(second.headers['ETag'], etag)
+    def test_cache_control(self):
+        self.assertEqual(self.client.get('/code-blocks').headers['Cache-Control'], 'no-cache')
+        diff = self.client.get(f'/code-blocks/{self.hashes[0]}/diff/{self.hashes[1]}')
+        self.assertEqual(diff.headers['Cache-Control'], httpcache.IMMUTABLE)
+        missing = self.client.get(f'/code-blocks/{self.hashes[0]}/diff/missing')
+        self.assertEqual(missing.status_code, 404)
+        self.assertNotIn('ETag', missing.headers)
+    def test_ingest_changes_etag(self):
+        list_etag = self.client.get('/code-blocks').headers['ETag']
+        diff_url = f'/code-blocks/{self.hashes[0]}/diff/{self.hashes[1]}'
+        diff_etag = self.client.get(diff_url).headers['ETag']
+        new_hash, = self.save_codes("z = 3\n")
+        response = self.client.get('/code-blocks', headers={'If-None-Match': list_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], list_etag)
+        self.assertEqual(response.get_json()[0]['hash'], new_hash)
+        # Diff niezmiennych bloków - ETag ten sam po zapisie innych bloków
+        self.assertEqual(self.client.get(diff_url, headers={'If-None-Match': diff_etag}).status_code, 304)
+        # Blok już zapisany - bez zmiany danych i ETagu
+        etag = response.headers['ETag']
+        self.save_codes("z = 3\n")
+        self.assertEqual(self.client.get('/code-blocks', headers={'If-None-Match': etag}).status_code, 304)
+    def test_response_cache(self):
+        first = self.client.get('/code-blocks?limit=1')
+        with patch.object(app, 'list_code_blocks', side_effect=AssertionError('not cached')):
+            second = self.client.get('/code-blocks?limit=1')
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual(second.headers['X-Next-Cursor'], first.headers['X-Next-Cursor'])
+        self.assertEqual(app.response_cache.hits, 1)
+        self.save_codes("z = 3\n")
+        self.assertEqual(len(self.client.get('/code-blocks').get_json()), 3)
+    def test_other_process_writes_are_picked_up(self):
+        etag = self.client.get('/code-blocks').headers['ETag']
+        with sqlite3.connect(self.temp_db) as conn:
+            httpcache.bump(conn)
+        version = httpcache.get_version(self.temp_db)
+        with patch.object(version, 'refresh_interval', 3600):
+            self.assertEqual(self.client.get('/code-blocks', headers={'If-None-Match': etag}).status_code, 304)
+        with patch.object(version, 'refresh_interval', 0):
+            self.assertEqual(self.client.get('/code-blocks', headers={'If-None-Match': etag}).status_code, 200)
+    def test_if_none_match_lists(self):
+        self.assertTrue(httpcache.matches('"a", W/"b"', '"b"'))
+        self.assertTrue(httpcache.matches('*', '"b"'))
+        self.assertFalse(httpcache.matches('"a"', '"b"'))
+        self.assertFalse(httpcache.matches(None, '"b"'))
+if __name__ == '__main__':
+    unittest.main()
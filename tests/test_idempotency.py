@@ -0,0 +1,61 @@
+import unittest
+import json
+import time
+from unittest.mock import patch
+import app
+import idempotency
+from base import AppTestCase, block
+class TTLCacheTests(unittest.TestCase):
+    def test_expiry_and_bound(self):
+        cache = idempotency.TTLCache(ttl=0.05, max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 3)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('b'))
+    def test_digest_depends_on_order_and_url(self):
+        first = {"blocks": [{"code": "a"}, {"code": "b"}], "metadata": {"url": "https://x"}}
+        swapped = {"blocks": [{"code": "b"}, {"code": "a"}], "metadata": {"url": "https://x"}}
+        moved = {"blocks": [{"code": "a"}, {"code": "b"}], "metadata": {"url": "https://y"}}
+        joined = {"blocks": [{"code": "ab"}], "metadata": {"url": "https://x"}}
+        digests = {idempotency.payload_digest(p) for p in (first, swapped, moved, joined)}
+        self.assertEqual(len(digests), 4)
+class PayloadDedupeTests(AppTestCase):
+    def payload(self, *codes, url="https://chat.example/room"):
+        return {"blocks": [block(code, url=url) for code in codes], "metadata": {"url": url}}
+    def test_repeated_page_is_not_processed(self):
+        first = json.loads(self.client.post('/code-blocks', json=self.payload("print('a')", "print('b')")).data)
+        self.assertEqual(first['saved_blocks'], 2)
+        hits = app.app.config['PAYLOAD_DEDUPE_STATS']['digest_hits']
+        with patch.object(app, 'parse_code_blocks', side_effect=AssertionError('parsed again')):
+            repeat = self.client.post('/code-blocks', json=self.payload("print('a')", "print('b')"))
+        self.assertEqual(json.loads(repeat.data), {'status': 'success', 'saved_blocks': 0, 'results': []})
+        self.assertEqual(app.app.config['PAYLOAD_DEDUPE_STATS']['digest_hits'], hits + 1)
+        # Nowy blok na stronie to inna paczka
+        changed = self.client.post('/code-blocks', json=self.payload("print('a')", "print('b')", "print('c')"))
+        self.assertEqual(json.loads(changed.data)['saved_blocks'], 1)
+    def test_idempotency_key_replays_response(self):
+        headers = {'Idempotency-Key': 'send-1'}
+        first = self.client.post('/code-blocks', json=self.payload("print('a')"), headers=headers)
+        replay = self.client.post('/code-blocks', json=self.payload("print('a')"), headers=headers)
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(replay.headers['Idempotent-Replayed'], 'true')
+        conflict = self.client.post('/code-blocks', json=self.payload("print('z')"), headers=headers)
+        self.assertEqual(conflict.status_code, 422)
+    def test_async_repeat_points_to_same_job(self):
+        with patch.object(app, 'ASYNC_INGEST', True), patch.object(app, 'INGEST_WORKERS', 0):
+            first = self.client.post('/code-blocks', json=self.payload("print('q')"))
+            repeat = self.client.post('/code-blocks', json=self.payload("print('q')"))
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(repeat.status_code, 202)
+        self.assertEqual(repeat.headers['Location'], first.headers['Location'])
+        with app.get_db() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM ingest_jobs").fetchone()[0], 1)
+    def test_errors_are_not_cached(self):
+        bad = {"blocks": [{"code": "x = 1"}]}
+        self.assertEqual(self.client.post('/code-blocks', json=bad).status_code, 400)
+        self.assertEqual(self.client.post('/code-blocks', json=bad).status_code, 400)
+if __name__ == '__main__':
+    unittest.main()
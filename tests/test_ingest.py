@@ -0,0 +1,140 @@
+import unittest
+import time
+import json
+import sqlite3
+from pathlib import Path
+from unittest.mock import patch
+import app
+from app import init_db
+from base import AppTestCase
+class BatchIngestTests(AppTestCase):
+    def make_block(self, code, **extra):
+        return {
+            "code": code,
+            "language": "python",
+            "platform": "discord",
+            "url": "https://discord.com/channels/123",
+            "timestamp": "2024-01-01T00:00:00Z",
+            "title": "Test",
+            **extra
+        }
+    def ingest(self, blocks):
+        response = self.post(*blocks)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+    def test_duplicates_inside_payload(self):
+        data = self.ingest([
+            self.make_block("print('a')"),
+            self.make_block("print('a')\n"),
+            self.make_block("   "),
+            self.make_block("print('b')"),
+        ])
+        self.assertEqual(data['saved_blocks'], 2)
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM code_blocks").fetchone()[0], 2)
+    def test_existing_blocks_are_skipped(self):
+        self.ingest([self.make_block("print('a')")])
+        data = self.ingest([self.make_block("print('a')"), self.make_block("print('c')")])
+        self.assertEqual(data['saved_blocks'], 1)
+        self.assertEqual(data['results'][0]['hash'], app.calculate_hash("print('c')"))
+    def test_similarity_within_batch(self):
+        data = self.ingest([
+            self.make_block("def hello():\n    print('Hello')"),
+            self.make_block("def hello():\n    print('Hello!')"),
+            self.make_block("def hello():\n    print('Hello!!')", platform="github"),
+        ])
+        self.assertEqual(data['saved_blocks'], 3)
+        first, second, other_platform = data['results']
+        self.assertEqual(first['similar_blocks'], [])
+        self.assertEqual([b['hash'] for b in second['similar_blocks']], [first['hash']])
+        self.assertEqual(second['similar_blocks'][0]['file_path'], first['file_path'])
+        self.assertEqual(other_platform['similar_blocks'], [])
+        response = self.client.get(f"/code-blocks/{second['hash']}/similar")
+        self.assertEqual([b['hash'] for b in json.loads(response.data)], [first['hash']])
+        for result in data['results']:
+            self.assertTrue(Path(result['file_path']).exists())
+    def test_batch_is_one_transaction(self):
+        with patch.object(app.lsh, 'index_blocks', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                app.save_code_blocks(app.parse_code_blocks({"blocks": [
+                    self.make_block("print('a')"), self.make_block("print('b')")
+                ]}))
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM code_blocks").fetchone()[0], 0)
+    def test_block_saved_concurrently(self):
+        first = self.make_block("def hello():\n    print('Hello')")
+        self.ingest([first])
+        # Pierwszy blok paczki zapisało w międzyczasie inne żądanie - drugi znajduje go w bazie i w paczce
+        results = app.save_code_blocks(app.parse_code_blocks({"blocks": [
+            first, self.make_block("def hello():\n    print('Hello!')")
+        ]}))
+        self.assertEqual([b['hash'] for b in results[0]['similar_blocks']], [app.calculate_hash(first['code'])])
+    def test_invalid_block(self):
+        response = self.client.post('/code-blocks', json={"blocks": [{"code": "x = 1"}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('language', json.loads(response.data)['error'])
+        for blocks, field in ([["x = 1"]], 'object'), ([self.make_block(1)], 'code'):
+            response = self.client.post('/code-blocks', json={"blocks": blocks})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, json.loads(response.data)['error'])
+class AsyncIngestTests(BatchIngestTests):
+    def settings(self):
+        return {'ASYNC_INGEST': True, 'INGEST_WORKERS': 0}
+    def ingest(self, blocks):
+        response = self.post(*blocks)
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.data)['job_id']
+        self.assertEqual(response.headers['Location'], f'/jobs/{job_id}')
+        self.assertEqual(json.loads(self.client.get(f'/jobs/{job_id}').data)['status'], 'pending')
+        self.assertEqual(app.process_ingest_jobs(), 1)
+        job = json.loads(self.client.get(f'/jobs/{job_id}').data)
+        self.assertEqual(job['status'], 'done')
+        return job['result']
+    def test_job_reports_hashes(self):
+        response = self.post(self.make_block("print('a')"))
+        job_id = json.loads(response.data)['job_id']
+        app.process_ingest_jobs()
+        job = json.loads(self.client.get(f'/jobs/{job_id}').data)
+        self.assertEqual(job['hashes'], [app.calculate_hash("print('a')")])
+        self.assertEqual(job['result']['results'][0]['hash'], job['hashes'][0])
+    def test_finished_jobs_are_cleared_and_pruned(self):
+        response = self.post(self.make_block("print('a')"))
+        job_id = json.loads(response.data)['job_id']
+        app.process_ingest_jobs()
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertIsNone(conn.execute("SELECT payload FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()[0])
+            conn.execute("UPDATE ingest_jobs SET updated_at = '2020-01-01T00:00:00'")
+        self.assertEqual(json.loads(self.client.get(f'/jobs/{job_id}').data)['status'], 'done')
+        self.assertEqual(app.process_ingest_jobs(), 0)
+        self.assertEqual(self.client.get(f'/jobs/{job_id}').status_code, 404)
+    def test_old_queue_table_is_migrated(self):
+        with sqlite3.connect(self.temp_db) as conn:
+            conn.execute("DROP TABLE ingest_jobs")
+            conn.execute("""CREATE TABLE ingest_jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL,
+                            payload TEXT NOT NULL, hashes TEXT NOT NULL, result TEXT, error TEXT,
+                            created_at TEXT NOT NULL, updated_at TEXT NOT NULL)""")
+            conn.execute("INSERT INTO ingest_jobs VALUES ('a', 'done', '[]', '[]', '{}', NULL, '2024', '2024')")
+        init_db()
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(conn.execute("SELECT id, payload FROM ingest_jobs").fetchall(), [('a', None)])
+    def test_queue_is_bounded(self):
+        with patch.object(app, 'INGEST_QUEUE_MAX', 1):
+            self.post(self.make_block("print('a')"))
+            response = self.post(self.make_block("print('b')"))
+        self.assertEqual(response.status_code, 503)
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/jobs/missing').status_code, 404)
+    def test_background_workers(self):
+        workers = app.ingest_queue.IngestWorkers(app.process_ingest_job, 1, poll_interval=0.05)
+        workers.start()
+        self.addCleanup(workers.stop)
+        response = self.post(self.make_block("print('a')"))
+        job_id = json.loads(response.data)['job_id']
+        for _ in range(100):
+            job = json.loads(self.client.get(f'/jobs/{job_id}').data)
+            if job['status'] == 'done':
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['status'], 'done')
+if __name__ == '__main__':
+    unittest.main()
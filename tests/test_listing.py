@@ -0,0 +1,48 @@
+import unittest
+import json
+from unittest.mock import patch
+import app
+from base import AppTestCase, block
+class ListingTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        # Dwie paczki - bloki z jednej paczki mają ten sam created_at
+        for batch in range(2):
+            self.save(*[block(f"print({batch}, {i})", language="python" if i % 2 else "javascript",
+                              platform="test", title="Test") for i in range(5)])
+    def test_keyset_pages_cover_everything_once(self):
+        seen = []
+        url = '/code-blocks?limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(b['hash'] for b in json.loads(response.data))
+            cursor = response.headers.get('X-Next-Cursor')
+            url = f'/code-blocks?limit=3&after={cursor}' if cursor else None
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen)), 10)
+        full = [b['hash'] for b in json.loads(self.client.get('/code-blocks').data)]
+        self.assertEqual(seen, full)
+    def test_filtered_pages(self):
+        first = self.client.get('/code-blocks?language=python&limit=2')
+        rest = self.client.get(f"/code-blocks?language=python&after={first.headers['X-Next-Cursor']}")
+        blocks = json.loads(first.data) + json.loads(rest.data)
+        self.assertEqual(len(blocks), 4)
+        self.assertTrue(all(b['language'] == 'python' for b in blocks))
+    def test_ndjson_stream(self):
+        with patch.object(app, 'NDJSON_BATCH_SIZE', 3):
+            response = self.client.get('/code-blocks?format=ndjson')
+            lines = response.data.decode().splitlines()
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), 10)
+        self.assertEqual([json.loads(line)['hash'] for line in lines],
+                         [b['hash'] for b in json.loads(self.client.get('/code-blocks').data)])
+        limited = self.client.get('/code-blocks?format=ndjson&limit=4&platform=test')
+        self.assertEqual(len(limited.data.decode().splitlines()), 4)
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/code-blocks?after=nocomma').status_code, 400)
+    def test_limit_is_clamped(self):
+        for limit in (0, -1):
+            self.assertEqual(len(json.loads(self.client.get(f'/code-blocks?limit={limit}').data)), 1)
+if __name__ == '__main__':
+    unittest.main()
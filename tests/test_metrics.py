@@ -0,0 +1,97 @@
+import unittest
+import tempfile
+import shutil
+import os
+from pathlib import Path
+from unittest.mock import patch
+import app
+import db
+import metrics
+from app import init_db
+class RegistryTests(unittest.TestCase):
+    def test_render_counters_and_histograms(self):
+        registry = metrics.Registry(buckets=(0.1, 1.0))
+        registry.describe('requests_total', 'counter', 'Requests')
+        registry.inc('requests_total', route='/a"b')
+        registry.inc('requests_total', 2, route='/a"b')
+        registry.observe('latency_seconds', 0.05, stage='parse')
+        registry.observe('latency_seconds', 0.5, stage='parse')
+        registry.observe('latency_seconds', 5, stage='parse')
+        registry.add_collector(lambda: [('external_total', {}, 7)])
+        text = registry.render()
+        self.assertIn('# HELP codeblocks_requests_total Requests', text)
+        self.assertIn('codeblocks_requests_total{route="/a\\"b"} 3', text)
+        self.assertIn('codeblocks_latency_seconds_bucket{stage="parse",le="0.1"} 1', text)
+        self.assertIn('codeblocks_latency_seconds_bucket{stage="parse",le="1.0"} 2', text)
+        self.assertIn('codeblocks_latency_seconds_bucket{stage="parse",le="+Inf"} 3', text)
+        self.assertIn('codeblocks_latency_seconds_sum{stage="parse"} 5.55', text)
+        self.assertIn('codeblocks_latency_seconds_count{stage="parse"} 3', text)
+        self.assertIn('codeblocks_external_total 7', text)
+    def test_disabled_registry_records_nothing(self):
+        registry = metrics.Registry(enabled=False)
+        with registry.stage('parse'):
+            registry.inc('requests_total')
+        self.assertEqual(registry.snapshot()['counters'], [])
+        self.assertEqual(registry.snapshot()['histograms'], [])
+    def test_snapshots_of_processes_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        first, second = metrics.Registry(), metrics.Registry()
+        first.inc('blocks_saved_total', 2)
+        second.inc('blocks_saved_total', 3)
+        second.observe('stage_duration_seconds', 0.01, stage='save')
+        with patch('os.getpid', return_value=12345):
+            metrics.write_snapshot(second, directory)
+        text = first.render(metrics.read_snapshots(directory, exclude_pid=os.getpid()))
+        self.assertIn('codeblocks_blocks_saved_total 5', text)
+        self.assertIn('codeblocks_stage_duration_seconds_count{stage="save"} 1', text)
+class MetricsEndpointTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        fd, self.temp_db = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.temp_db)
+        self.registry = metrics.Registry()
+        self.registry.add_collector(app.collect_counters)
+        for patcher in (patch.object(app, 'DB_PATH', self.temp_db),
+                        patch.object(app, 'STORAGE_DIR', Path(self.temp_dir)),
+                        patch.object(app, 'metrics_registry', self.registry),
+                        patch.object(db, 'observer', self.registry.observe_stage)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        init_db()
+        app.app.config['TESTING'] = True
+        self.client = app.app.test_client()
+    def post(self, *codes):
+        return self.client.post('/code-blocks', json={"blocks": [{
+            "code": code, "language": "python", "platform": "test",
+            "url": "https://test.com", "timestamp": "2024-01-01T00:00:00Z"
+        } for code in codes]})
+    def test_stages_routes_and_counters(self):
+        base = "def handler(request):\n    value = request.args.get('x')\n    return value * 2\n"
+        self.assertEqual(self.post(base, base.replace('* 2', '* 3')).status_code, 200)
+        hashes = [r['hash'] for r in self.client.get('/code-blocks').get_json()]
+        self.client.get(f'/code-blocks/{hashes[0]}/diff/{hashes[1]}')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        for stage in ('parse', 'dedupe', 'signatures', 'find_similar', 'db_lock_wait',
+                      'write_storage', 'save', 'diff', 'db_transaction', 'db_commit'):
+            self.assertIn(f'codeblocks_stage_duration_seconds_count{{stage="{stage}"}}', text)
+        self.assertIn('codeblocks_http_request_duration_seconds_count'
+                      '{method="POST",route="/code-blocks",status="200"} 1', text)
+        self.assertIn('route="/code-blocks/<hash>/diff/<other_hash>"', text)
+        self.assertIn('codeblocks_blocks_saved_total 2', text)
+        self.assertIn(f'codeblocks_bytes_written_total{{backend="{app.STORAGE_BACKEND}"}} {len(base.strip()) * 2}', text)
+        self.assertIn('codeblocks_scoring_ratio_calls_total', text)
+        self.assertIn('codeblocks_diff_cache_misses_total', text)
+    def test_disabled(self):
+        self.registry.enabled = False
+        before = self.registry.snapshot()['histograms']
+        self.post("print('hello')")
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.registry.snapshot()['histograms'], before)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import pstats
+import time
+from pathlib import Path
+from unittest.mock import patch
+import app
+import profiling
+from base import AppTestCase, block
+class ProfilingTests(AppTestCase):
+    def settings(self):
+        return {'PROFILING': True, 'PROFILE_DIR': self.profile_dir}
+    @property
+    def profile_dir(self):
+        return Path(self.temp_dir) / 'profiles'
+    def profiled(self, **kwargs):
+        # Profil zapisuje się przy zamknięciu odpowiedzi - buffered czyta ją do końca i zamyka
+        return self.post(block("print('profiled')", platform="test"), headers={'X-Profile': '1'},
+                         buffered=True, **kwargs)
+    def test_cprofile_on_request(self):
+        response = self.profiled()
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers['X-Profile-Id']
+        stats = pstats.Stats(str(self.profile_dir / f'{profile_id}.pstats'))
+        self.assertIn('save_code_blocks', {func[2] for func in stats.stats})
+        captures = self.client.get('/debug/profiles').get_json()
+        self.assertEqual(len(captures), 1)
+        self.assertEqual(captures[0]['id'], profile_id)
+        self.assertEqual(captures[0]['route'], '/code-blocks')
+        self.assertEqual(captures[0]['method'], 'POST')
+        self.assertEqual(captures[0]['kind'], profiling.CPROFILE)
+        self.assertGreater(captures[0]['duration_ms'], 0)
+        download = self.client.get(f'/debug/profiles/{profile_id}')
+        self.assertEqual(download.status_code, 200)
+        download.close()
+        self.assertEqual(self.client.get('/debug/profiles/../app').status_code, 404)
+    def test_streamed_body_is_profiled(self):
+        self.profiled()
+        response = self.client.get('/code-blocks?format=ndjson&profile=1', buffered=True)
+        stats = pstats.Stats(str(self.profile_dir / f"{response.headers['X-Profile-Id']}.pstats"))
+        self.assertIn('_list_code_blocks', {func[2] for func in stats.stats})
+    def test_one_cprofile_at_a_time(self):
+        running = profiling.Profile(profiling.CPROFILE)
+        self.addCleanup(running.cancel)
+        response = self.profiled()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(response.headers['X-Profile-Skipped'], 'busy')
+        running.cancel()
+        self.assertIn('X-Profile-Id', self.profiled().headers)
+    def test_sampled_traffic(self):
+        def slow_list(*args):
+            time.sleep(0.05)
+            return []
+        with patch.object(app, 'PROFILE_SAMPLE_RATE', 1.0), \
+                patch.object(app, 'list_code_blocks', side_effect=slow_list), \
+                patch.object(profiling, 'SAMPLE_INTERVAL', 0.001):
+            response = self.client.get('/code-blocks', environ_base={'REMOTE_ADDR': '10.0.0.1'}, buffered=True)
+        capture = profiling.list_profiles(self.profile_dir)[0]
+        self.assertEqual(capture['id'], response.headers['X-Profile-Id'])
+        self.assertEqual(capture['kind'], profiling.SAMPLING)
+        self.assertGreater(capture['samples'], 5)
+        lines = Path(capture['file']).read_text().splitlines()
+        self.assertTrue(any('app.py:get_code_blocks' in line for line in lines))
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+    def test_only_from_localhost_and_when_enabled(self):
+        remote = {'REMOTE_ADDR': '10.0.0.1'}
+        response = self.profiled(environ_base=remote)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self.client.get('/debug/profiles', environ_base=remote).status_code, 404)
+        with patch.object(app, 'PROFILING', False):
+            self.assertNotIn('X-Profile-Id', self.client.get('/code-blocks?profile=1').headers)
+            self.assertEqual(self.client.get('/debug/profiles').status_code, 404)
+        self.assertEqual(self.client.get('/debug/profiles').get_json(), [])
+    def test_old_profiles_are_pruned(self):
+        with patch.object(profiling, 'KEEP', 2):
+            for _ in range(4):
+                self.client.get('/code-blocks?profile=1', buffered=True)
+        self.assertEqual(len(list(self.profile_dir.glob('*.json'))), 2)
+        self.assertEqual(len(list(self.profile_dir.glob('*.pstats'))), 2)
+if __name__ == '__main__':
+    unittest.main()
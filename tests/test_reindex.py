@@ -0,0 +1,59 @@
+import unittest
+import json
+from unittest.mock import patch
+import app
+from base import AppTestCase, block
+BODIES = [
+    "\n".join(f"def scale_{n}(x):\n    return x * {n}" for n in range(8)),
+    "\n".join(f"class Node{n}:\n    children = []\n    parent = None" for n in range(6)),
+]
+class ReindexTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        # Zapis z progiem, przy którym żaden wariant nie jest podobny
+        with patch.object(app.scoring_engine, 'threshold', 1.0):
+            for i in range(3):
+                self.save(*[block(body + f"\nvariant = {i}\n", platform="test" if b == 0 else "other")
+                            for b, body in enumerate(BODIES)])
+    def edges(self):
+        with app.get_db() as conn:
+            return sorted(conn.execute(
+                "SELECT block_hash, similar_hash, round(similarity_score, 6) FROM similar_blocks"
+            ).fetchall())
+    def test_reindex_builds_edges_and_clusters(self):
+        self.assertEqual(self.edges(), [])
+        result = app.reindex_similarity(workers=1)
+        self.assertEqual(result['processed'], 6)
+        self.assertEqual(result['edges'], 6)  # 3 pary w każdej z dwóch grup
+        self.assertEqual(len(self.edges()), 6)
+        sizes = [c['size'] for c in json.loads(self.client.get('/clusters').data)]
+        self.assertEqual(sizes, [3, 3])
+        # Ponowny przebieg nie dubluje krawędzi
+        app.reindex_similarity(workers=1)
+        self.assertEqual(len(self.edges()), 6)
+    def test_filters(self):
+        result = app.reindex_similarity(platform='other', workers=1)
+        self.assertEqual(result['processed'], 3)
+        self.assertEqual(len(self.edges()), 3)
+        self.assertEqual(app.reindex_similarity(since='2999-01-01', workers=1)['processed'], 0)
+    def test_interrupted_run_resumes(self):
+        def interrupt(processed, elapsed):
+            if processed >= 2:
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            app.reindex_similarity(workers=1, batch_size=2, progress=interrupt)
+        result = app.reindex_similarity(workers=1, batch_size=2)
+        self.assertEqual(result['resumed_from'], 2)
+        self.assertEqual(result['processed'], 4)
+        self.assertEqual(len(self.edges()), 6)
+        # Zakończony przebieg nie jest wznawiany
+        self.assertEqual(app.reindex_similarity(workers=1, batch_size=2)['resumed_from'], 0)
+    def test_parallel_matches_serial(self):
+        app.reindex_similarity(workers=1)
+        serial = self.edges()
+        result = app.reindex_similarity(workers=2, batch_size=1, restart=True)
+        self.assertEqual(result['processed'], 6)
+        self.assertEqual(self.edges(), serial)
+        self.assertGreater(result['blocks_per_second'], 0)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import json
+from unittest.mock import patch
+import app
+from base import AppTestCase, block
+class SearchTests(AppTestCase):
+    def test_substring_search_with_snippet(self):
+        self.save(block("def fetch_users(session):\n    return session.query(User).all()"))
+        self.save(block("console.log('users')", language="javascript"))
+        self.save(block("x = 1"))
+        results = json.loads(self.client.get('/code-blocks/search?q=query(User').data)
+        self.assertEqual(len(results), 1)
+        self.assertIn('<<query(User>>', results[0]['snippet'])
+        results = json.loads(self.client.get('/code-blocks/search?q=users').data)
+        self.assertEqual(len(results), 2)
+        results = json.loads(self.client.get('/code-blocks/search?q=users&language=javascript').data)
+        self.assertEqual([r['language'] for r in results], ['javascript'])
+    def test_paging(self):
+        for i in range(5):
+            self.save(block(f"print('needle {i}')" + " pad" * i))
+        seen = []
+        url = '/code-blocks/search?q=needle&limit=2'
+        while url:
+            response = self.client.get(url)
+            seen.extend(r['hash'] for r in json.loads(response.data))
+            cursor = response.headers.get('X-Next-Cursor')
+            url = f'/code-blocks/search?q=needle&limit=2&after={cursor}' if cursor else None
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+    def test_cursor_from_older_data_is_rejected(self):
+        for i in range(3):
+            self.save(block(f"print('needle {i}')"))
+        cursor = self.client.get('/code-blocks/search?q=needle&limit=2').headers['X-Next-Cursor']
+        self.save(block("print('needle 3')"))
+        response = self.client.get(f'/code-blocks/search?q=needle&limit=2&after={cursor}')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get('/code-blocks/search?q=needle&after=1.5').status_code, 400)
+    def test_limit_is_clamped(self):
+        for i in range(3):
+            self.save(block(f"print('needle {i}')"))
+        for limit in (0, -1):
+            response = self.client.get(f'/code-blocks/search?q=needle&limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.get_json()), 1)
+            self.assertIn('X-Next-Cursor', response.headers)
+        response = self.client.get('/code-blocks/search?q=needle&after=x,y,z')
+        self.assertEqual(response.get_json(), {'error': 'Invalid cursor'})
+    def test_short_query(self):
+        self.assertEqual(self.client.get('/code-blocks/search?q=ab').status_code, 400)
+    def test_pack_blocks_and_backfill(self):
+        with patch.object(app, 'STORAGE_BACKEND', 'pack'):
+            self.save(block("SELECT * FROM needle_table"))
+        self.assertEqual(len(json.loads(self.client.get('/code-blocks/search?q=needle_table').data)), 1)
+        self.assertEqual(app.backfill_search_index(rebuild=True), 1)
+        self.assertEqual(app.backfill_search_index(), 0)
+        self.assertEqual(len(json.loads(self.client.get('/code-blocks/search?q=needle_table').data)), 1)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import shutil
+import threading
+import urllib.request
+from pathlib import Path
+import app
+import events
+from base import AppTestCase, block
+APP = str(Path(__file__).resolve().parent.parent / 'app.py')
+SLOW_SERVER = '''
+import time
+import server
+def application(environ, start_response):
+    if environ['PATH_INFO'] == '/slow':
+        time.sleep(60)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'ok']
+server.PreforkServer(application, port=0, workers=1, threads=2, timeout=1, graceful_timeout=1).run()
+'''
+@unittest.skipUnless(hasattr(os, 'fork'), 'prefork server requires POSIX')
+class PreforkServerTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        env = dict(os.environ, PYTHONPATH=str(Path(APP).parent), PYTHONUNBUFFERED='1')
+        self.process = subprocess.Popen(
+            [sys.executable, APP, 'serve', '--port', '0', '--workers', '2', '--threads', '2',
+             '--graceful-timeout', '5'],
+            cwd=self.temp_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        self.addCleanup(self.stop)
+        line = self.process.stdout.readline()
+        self.port = int(re.search(r':(\d+) ', line).group(1))
+        self.workers = [self.read_worker_pid(), self.read_worker_pid()]
+    def read_worker_pid(self):
+        for line in self.process.stdout:
+            match = re.search(r'uruchomiony \(pid (\d+)\)', line)
+            if match:
+                return int(match.group(1))
+        self.fail('server exited before starting a worker')
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+    def request(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(f'http://127.0.0.1:{self.port}{path}', data=data,
+                                     headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return json.loads(response.read())
+    def test_serves_requests_and_stops_gracefully(self):
+        for i in range(6):
+            result = self.request('/code-blocks', {"blocks": [{
+                "code": f"print({i})", "language": "python", "platform": "test",
+                "url": "https://test.com", "timestamp": "2024-01-01T00:00:00Z"
+            }]})
+            self.assertEqual(result['saved_blocks'], 1)
+        self.assertEqual(len(self.request('/code-blocks')), 6)
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(timeout=10), 0)
+    def test_dead_worker_is_replaced(self):
+        os.kill(self.workers[0], signal.SIGKILL)
+        replacement = self.read_worker_pid()
+        self.assertNotIn(replacement, self.workers)
+        for _ in range(4):
+            self.assertEqual(self.request('/code-blocks'), [])
+@unittest.skipUnless(hasattr(os, 'fork'), 'prefork server requires POSIX')
+class RequestTimeoutTests(unittest.TestCase):
+    def test_worker_with_overdue_request_is_replaced(self):
+        env = dict(os.environ, PYTHONPATH=str(Path(APP).parent), PYTHONUNBUFFERED='1')
+        process = subprocess.Popen([sys.executable, '-c', SLOW_SERVER], env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        self.addCleanup(process.stdout.close)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.send_signal, signal.SIGTERM)
+        port = int(re.search(r':(\d+) ', process.stdout.readline()).group(1))
+        with self.assertRaises(OSError):
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/slow', timeout=10)
+        lines = [process.stdout.readline() for _ in range(3)]
+        self.assertTrue(any('trwa dłużej niż 1' in line for line in lines), lines)
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=10) as response:
+            self.assertEqual(response.read(), b'ok')
+class WorkerServicesTests(AppTestCase):
+    def settings(self):
+        return {'ASYNC_INGEST': True, 'INGEST_WORKERS': 2, 'event_bus': events.EventBus(),
+                'event_relay': None, 'metrics_writer': None}
+    def start_worker(self, index):
+        app.start_worker_services(index)
+        self.addCleanup(app.stop_worker_services, index)
+    def ingest_threads(self):
+        return [thread for thread in threading.enumerate() if thread.name.startswith('ingest-worker')]
+    def test_only_worker_zero_runs_ingest_queue(self):
+        self.start_worker(1)
+        self.assertEqual(self.post(block("print('queued')")).status_code, 202)
+        self.assertIsNone(app.ingest_workers)
+        self.assertEqual(self.ingest_threads(), [])
+        app.stop_worker_services(1)
+        self.start_worker(0)
+        self.assertEqual(len(self.ingest_threads()), 2)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import sqlite3
+from pathlib import Path
+from unittest.mock import patch
+from click.testing import CliRunner
+import app
+import archive
+import db
+import dedupe
+import shards
+from app import init_db
+from base import AppTestCase, block
+BASE = ("def handler(request, limit=10):\n    value = request.args.get('x')\n"
+        "    if value is None or limit > 5:\n        return None\n"
+        "    items = [value * 2 for value in request.items if value]\n"
+        "    logger.debug('handled %s', value)\n    return len(items) * limit\n")
+class ShardTestCase(AppTestCase):
+    count = 2
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.remove_shards)
+    def settings(self):
+        return {'PAYLOAD_DEDUPE': False, 'SHARDS': self.count}
+    def remove_shards(self):
+        db.close_all()
+        for path in [shards.shard_path(self.temp_db, index) for index in range(4)] + [archive.archive_path(self.temp_db)]:
+            for name in (path, path + '-wal', path + '-shm'):
+                Path(name).unlink(missing_ok=True)
+    def hashes(self, path, table='code_blocks'):
+        with sqlite3.connect(path) as conn:
+            return {row[0] for row in conn.execute(f"SELECT hash FROM {table}")}
+    def snapshot(self, first, second):
+        """Odpowiedzi, które muszą być takie same przed i po podziale na shardy"""
+        return (self.client.get('/code-blocks').get_json(),
+                self.client.get('/code-blocks?limit=2').headers['X-Next-Cursor'],
+                self.client.get(f'/code-blocks/{second}/similar').get_json(),
+                self.client.get(f'/code-blocks/{first}/diff/{second}').get_json(),
+                self.client.post('/code-blocks/similar-query', json={"code": BASE}).get_json())
+class ShardedStorageTests(ShardTestCase):
+    def test_blocks_go_to_shard_of_their_pair(self):
+        github, gitlab = self.save(block(BASE), block(BASE + "done = 1\n", platform="gitlab"))
+        self.assertEqual(self.hashes(shards.shard_path(self.temp_db, 0)), {github})
+        self.assertEqual(self.hashes(shards.shard_path(self.temp_db, 1)), {gitlab})
+        self.assertEqual(self.hashes(self.temp_db), set())
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(dict(conn.execute("SELECT hash, shard FROM block_shards")), {github: 0, gitlab: 1})
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM change_events").fetchone()[0], 2)
+    def test_listing_merges_shards(self):
+        saved = []
+        for i in range(6):
+            saved += self.save(block(f"print({i})", platform=("github", "gitlab")[i % 2]))
+        listed = [item['hash'] for item in self.client.get('/code-blocks').get_json()]
+        self.assertEqual(listed, saved[::-1])
+        first = self.client.get('/code-blocks?limit=4')
+        rest = self.client.get(f"/code-blocks?after={first.headers['X-Next-Cursor']}")
+        self.assertEqual([item['hash'] for item in first.get_json() + rest.get_json()], listed)
+        gitlab = self.client.get('/code-blocks?platform=gitlab').get_json()
+        self.assertEqual([item['hash'] for item in gitlab], saved[1::2][::-1])
+        with patch.object(app, 'NDJSON_BATCH_SIZE', 4):
+            lines = self.client.get('/code-blocks?format=ndjson').get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertIn(listed[0], lines[0])
+    def test_similar_diff_and_query_across_shards(self):
+        github, gitlab = self.save(block(BASE), block(BASE + "done = 1\n", platform="gitlab"))
+        close, = self.save(block(BASE + "done = 2\n", platform="gitlab"))
+        similar = self.client.get(f'/code-blocks/{close}/similar').get_json()
+        self.assertEqual([item['hash'] for item in similar], [gitlab])
+        diff = self.client.get(f'/code-blocks/{github}/diff/{close}')
+        self.assertEqual(diff.status_code, 200)
+        self.assertIn('+done = 2', diff.get_json()['diff'])
+        results = self.client.post('/code-blocks/similar-query', json={"code": BASE}).get_json()
+        self.assertEqual([result['hash'] for result in results][0], github)
+        self.assertEqual({result['hash'] for result in results}, {github, gitlab, close})
+        only = self.client.post('/code-blocks/similar-query', json={"code": BASE, "platform": "gitlab"})
+        self.assertEqual({result['hash'] for result in only.get_json()}, {gitlab, close})
+    def test_duplicate_is_not_saved_again(self):
+        self.save(block(BASE))
+        response = self.client.post('/code-blocks', json={"blocks": [block(BASE), block(BASE, platform="gitlab")]})
+        self.assertEqual(response.get_json()['saved_blocks'], 0)
+        self.assertEqual(self.hashes(shards.shard_path(self.temp_db, 1)), set())
+    def test_search_merges_shards(self):
+        saved = [self.save(block(BASE + f"done = {i}\n", platform=("github", "gitlab")[i % 2]))[0] for i in range(4)]
+        results = self.client.get('/code-blocks/search?q=handler').get_json()
+        self.assertEqual({result['hash'] for result in results}, set(saved))
+        first = self.client.get('/code-blocks/search?q=handler&limit=3')
+        rest = self.client.get(f"/code-blocks/search?q=handler&after={first.headers['X-Next-Cursor']}")
+        self.assertEqual([result['hash'] for result in first.get_json() + rest.get_json()],
+                         [result['hash'] for result in results])
+        gitlab = self.client.get('/code-blocks/search?q=done&platform=gitlab&language=python').get_json()
+        self.assertEqual({result['hash'] for result in gitlab}, {saved[1], saved[3]})
+    def test_clusters_merge_shards(self):
+        github = self.save(block(BASE), block(BASE + "done = 1\n"))
+        gitlab = self.save(*[block(BASE + f"done = {i}\n", platform="gitlab") for i in range(2, 5)])
+        listed = self.client.get('/clusters').get_json()
+        self.assertEqual([cluster['size'] for cluster in listed], [3, 2])
+        self.assertNotEqual(listed[0]['id'], listed[1]['id'])
+        first = self.client.get('/clusters?limit=1')
+        rest = self.client.get(f"/clusters?after={first.headers['X-Next-Cursor']}").get_json()
+        self.assertEqual([cluster['id'] for cluster in first.get_json() + rest], [cluster['id'] for cluster in listed])
+        for cluster, hashes in zip(listed, (gitlab, github)):
+            members = self.client.get(f"/clusters/{cluster['id']}").get_json()['members']
+            self.assertEqual({member['hash'] for member in members}, set(hashes))
+    def test_shard_count_must_match(self):
+        with patch.object(app, 'SHARDS', 3), self.assertRaisesRegex(RuntimeError, 'SHARDS=2'):
+            init_db()
+        with patch.object(app, 'SHARDS', 0), self.assertRaisesRegex(RuntimeError, 'SHARDS=2'):
+            init_db()
+    def test_archive_from_shards(self):
+        github, gitlab = self.save(block(BASE), block(BASE + "done = 1\n", platform="gitlab"))
+        close, = self.save(block(BASE + "done = 2\n", platform="gitlab"))
+        similar = self.client.get(f'/code-blocks/{close}/similar').get_json()
+        for index in range(2):
+            with sqlite3.connect(shards.shard_path(self.temp_db, index)) as conn:
+                conn.execute("UPDATE code_blocks SET created_at = '2020-01-01' WHERE hash != ?", (close,))
+        self.assertEqual(app.archive_blocks(before='2023-01-01'), 2)
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(dict(conn.execute("SELECT hash, shard FROM block_shards")), {close: 1})
+        self.assertEqual(self.client.get(f'/code-blocks/{close}/similar').get_json()[0]['hash'], similar[0]['hash'])
+        self.assertEqual(self.client.get(f'/code-blocks/{github}/diff/{close}').status_code, 200)
+class SplitShardsTests(ShardTestCase):
+    count = 0
+    def test_split_keeps_responses(self):
+        first, second = self.save(block(BASE), block(BASE + "done = 1\n", language="go", platform="gitlab"))
+        close, script = self.save(block(BASE + "done = 2\n", language="go", platform="gitlab"),
+                                  block("print(1)", language="javascript", platform="gitlab"))
+        before = self.snapshot(first, close)
+        self.assertEqual(before[2][0]['hash'], second)
+        result = CliRunner().invoke(app.cli, ['split-shards', '--shards', '4'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('SHARDS=4', result.output)
+        self.assertIsNone(dedupe.get_cache(self.temp_db))
+        self.assertEqual(self.hashes(self.temp_db), set())
+        self.assertEqual(self.hashes(shards.shard_path(self.temp_db, 3)), {second, close, script})
+        with patch.object(app, 'SHARDS', 4):
+            init_db()
+            self.assertEqual(self.snapshot(first, close), before)
+        with patch.object(app, 'SHARDS', 4), self.assertRaises(RuntimeError):
+            app.split_into_shards(4)
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import sqlite3
+from pathlib import Path
+import lsh
+from app import init_db
+from base import AppTestCase, block
+BASE = ("def handler(request, limit=10):\n    value = request.args.get('x')\n"
+        "    if value is None or limit > 5:\n        return None\n"
+        "    items = [value * 2 for value in request.items if value]\n"
+        "    logger.debug('handled %s', value)\n    return len(items) * limit\n")
+class SimilarQueryTests(AppTestCase):
+    def settings(self):
+        return {'PAYLOAD_DEDUPE': False}
+    def query(self, **data):
+        response = self.client.post('/code-blocks/similar-query', json=data)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+    def test_top_k_sorted_by_similarity(self):
+        exact, close, far = self.save(
+            block(BASE),
+            block(BASE.replace("return None", "raise ValueError(value)")),
+            block(BASE.replace("'x'", "'y'").replace("* 2", "* 3").replace("limit > 5", "limit < 1")
+                  .replace("handled %s", "done").replace("* limit", "+ 1"), platform="gitlab"),
+        )
+        results = self.query(code=BASE)
+        self.assertEqual([result['hash'] for result in results], [exact, close, far])
+        self.assertEqual(results[0]['similarity'], 1.0)
+        self.assertGreater(results[1]['similarity'], results[2]['similarity'])
+        self.assertEqual(results[0]['platform'], 'github')
+        self.assertEqual([result['hash'] for result in self.query(code=BASE, k=2)], [exact, close])
+        self.assertEqual([result['hash'] for result in self.query(code=BASE, min_score=0.99)], [exact])
+    def test_language_and_platform_filters(self):
+        python, = self.save(block(BASE))
+        other_platform, = self.save(block(BASE + "done = 1\n", platform="gitlab"))
+        other_language, = self.save(block(BASE + "done = 2\n", language="javascript"))
+        self.assertEqual({result['hash'] for result in self.query(code=BASE)},
+                         {python, other_platform, other_language})
+        self.assertEqual({result['hash'] for result in self.query(code=BASE, language="python")},
+                         {python, other_platform})
+        self.assertEqual([result['hash'] for result in self.query(code=BASE, language="python",
+                                                                   platform="gitlab")], [other_platform])
+        self.assertEqual(self.query(code=BASE, platform="discord"), [])
+    def test_query_writes_nothing(self):
+        self.save(block(BASE))
+        tables = ('code_blocks', 'similar_blocks', 'lsh_buckets', 'block_signatures', 'block_tokens')
+        def counts():
+            with sqlite3.connect(self.temp_db) as conn:
+                return [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables]
+        before = counts()
+        files = sorted(Path(self.temp_dir).rglob('*'))
+        self.assertEqual(len(self.query(code=BASE.replace("limit", "size"))), 1)
+        self.assertEqual(counts(), before)
+        self.assertEqual(sorted(Path(self.temp_dir).rglob('*')), files)
+    def test_validation_errors(self):
+        for data, error in (
+            (None, 'Invalid JSON'),
+            ({}, 'Missing code'),
+            ({"code": "   "}, 'Missing code'),
+            ({"code": "x = 1", "language": 3}, 'Invalid language'),
+            ({"code": "x = 1", "k": 0}, 'k must be an integer between 1 and 100'),
+            ({"code": "x = 1", "k": True}, 'k must be an integer between 1 and 100'),
+            ({"code": "x = 1", "min_score": 2}, 'min_score must be a number between 0 and 1'),
+            ({"code": "x = 1", "include_archive": 1}, 'include_archive must be a boolean'),
+        ):
+            if data is None:
+                response = self.client.post('/code-blocks/similar-query', data='{',
+                                            content_type='application/json')
+            else:
+                response = self.client.post('/code-blocks/similar-query', json=data)
+            self.assertEqual(response.status_code, 400, data)
+            self.assertEqual(response.get_json(), {'error': error})
+    def test_groups_backfilled_for_old_index(self):
+        self.save(block(BASE), block(BASE + "done = 1\n", language="go", platform="gitlab"))
+        with sqlite3.connect(self.temp_db) as conn:
+            conn.execute("DROP TABLE lsh_groups")
+        init_db()
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(sorted(lsh.groups(conn)), [('go', 'gitlab'), ('python', 'github')])
+            self.assertEqual(lsh.groups(conn, platform='gitlab'), [('go', 'gitlab')])
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import sqlite3
+import app
+import lsh
+from app import CodeBlock, init_db, save_code_block, find_similar_blocks, calculate_hash
+from base import AppTestCase
+from scoring import ScoringEngine, length_bound
+class SimilarityIndexTests(AppTestCase):
+    def make_block(self, code, language="python", platform="test"):
+        return CodeBlock(
+            code=code,
+            language=language,
+            platform=platform,
+            url="https://test.com",
+            timestamp="2024-01-01T00:00:00Z",
+            title="Test",
+            hash=calculate_hash(code)
+        )
+    def test_signature_is_stable(self):
+        code = "def hello():\n    print('Hello')"
+        self.assertEqual(lsh.minhash_signature(code), lsh.minhash_signature(code))
+        self.assertEqual(len(lsh.minhash_signature(code)), lsh.NUM_PERM * 4)
+        self.assertEqual(len(lsh.band_buckets(lsh.minhash_signature(code))), lsh.BANDS)
+    def test_near_duplicate_is_candidate(self):
+        original = save_code_block(self.make_block("def hello():\n    print('Hello')"))
+        result = save_code_block(self.make_block("def hello():\n    print('Hello!')"))
+        hashes = [b['hash'] for b in result['similar_blocks']]
+        self.assertIn(original['hash'], hashes)
+        self.assertTrue(all(b['similarity'] >= app.SIMILARITY_THRESHOLD for b in result['similar_blocks']))
+    def test_unrelated_and_other_bucket_blocks_are_skipped(self):
+        save_code_block(self.make_block("SELECT * FROM users WHERE id = 1"))
+        save_code_block(self.make_block("def hello():\n    print('Hello')", platform="github"))
+        block = self.make_block("def hello():\n    print('Hello!')")
+        with sqlite3.connect(self.temp_db) as conn:
+            self.assertEqual(find_similar_blocks(block, conn), [])
+    def test_candidate_limit_keeps_most_shared_bands(self):
+        base = "".join(f"def handler_{n}(request):\n    return request.args.get('k{n}')\n" for n in range(12))
+        weak = save_code_block(self.make_block(base[:len(base) // 2] + "class Other:\n    pass\n" * 12))
+        strong = save_code_block(self.make_block(base + "# v1\n"))
+        block = self.make_block(base + "# v2\n")
+        with sqlite3.connect(self.temp_db) as conn:
+            counts = lsh.query_candidate_counts(conn, "python", "test", lsh.minhash_signature(block.code), None)
+            self.assertEqual([h for h, _ in counts], [strong['hash'], weak['hash']])
+            self.patch(app, LSH_MAX_CANDIDATES=1)
+            self.assertEqual([b['hash'] for b in find_similar_blocks(block, conn)], [strong['hash']])
+    def test_backfill_of_unindexed_blocks(self):
+        block = self.make_block("def hello():\n    print('Hello')")
+        with sqlite3.connect(self.temp_db) as conn:
+            conn.execute("""
+                INSERT INTO code_blocks
+                (hash, code, language, platform, url, timestamp, title, file_path, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (block.hash, block.code, block.language, block.platform, block.url,
+                  block.timestamp, block.title, 'legacy', '2024-01-01T00:00:00'))
+        init_db()
+        similar = save_code_block(self.make_block("def hello():\n    print('Hello!')"))
+        self.assertEqual([b['hash'] for b in similar['similar_blocks']], [block.hash])
+class ScoringEngineTests(unittest.TestCase):
+    def test_length_bound(self):
+        self.assertEqual(length_bound(10, 10), 1.0)
+        self.assertAlmostEqual(length_bound(100, 1000000), 200 / 1000100)
+    def test_cascade_matches_exact_ratio(self):
+        engine = ScoringEngine(0.85, pool_size=0)
+        texts = {
+            'close': "def hello():\n    print('Hello!')",
+            'short': "x = 1",
+            'other': "SELECT name FROM users ORDER BY id",
+        }
+        loaded = []
+        def load(keys):
+            loaded.extend(keys)
+            return {key: texts[key] for key in keys}
+        text = "def hello():\n    print('Hello')"
+        matches = engine.score(text, [(k, len(v)) for k, v in texts.items()], load)
+        self.assertEqual([key for key, _ in matches], ['close'])
+        self.assertAlmostEqual(matches[0][1], app.compute_similarity(text, texts['close']))
+        self.assertNotIn('short', loaded)
+        self.assertEqual(engine.stats['candidates'], 3)
+        self.assertEqual(engine.stats['length_rejected'], 1)
+        self.assertEqual(engine.stats['ratio_calls'], 1)
+    def test_pool_scoring(self):
+        engine = ScoringEngine(0.85, pool_size=2, parallel_min_chars=10)
+        self.addCleanup(engine.shutdown)
+        text = "def hello():\n    print('Hello')"
+        matches = engine.score(text, [('a', len(text) + 1)], lambda keys: {'a': text + '!'})
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(engine.stats['pool_ratio_calls'], 1)
+if __name__ == '__main__':
+    unittest.main()
@@ -46,3 +46,107 @@ class StorageTests(unittest.TestCase):
         self.assertTrue(file_name.endswith('.python'))
         self.assertIn('20240101_000000', file_name)
         self.assertIn('testhash', file_name)
+class PackStorageTests(unittest.TestCase):
+    def setUp(self):
+        import shutil
+        import app
+        from unittest.mock import patch
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        fd, self.temp_db = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.temp_db)
+        self.storage_path = Path(self.temp_dir)
+        for patcher in (patch.object(app, 'DB_PATH', self.temp_db),
+                        patch.object(app, 'STORAGE_DIR', self.storage_path)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        app.init_db()
+        self.app = app
+        self.client = app.app.test_client()
+    def post(self, code):
+        response = self.client.post('/code-blocks', json={"blocks": [{
+            "code": code,
+            "language": "python",
+            "platform": "test",
+            "url": "https://test.com",
+            "timestamp": "2024-01-01T00:00:00Z",
+            "title": "Test"
+        }]})
+        return response.json['results'][0]
+    def test_pack_backend(self):
+        from unittest.mock import patch
+        with patch.object(self.app, 'STORAGE_BACKEND', 'pack'):
+            first = self.post("def test():\n    return 1")
+            second = self.post("def test():\n    return 2")
+        self.assertEqual(list(self.storage_path.glob('**/*.python')), [])
+        self.assertTrue(first['file_path'].endswith('.pack'))
+        with self.app.get_db() as conn:
+            row = conn.execute("SELECT code, blob_length FROM code_blocks WHERE hash = ?",
+                               (first['hash'],)).fetchone()
+        self.assertEqual(row, ('', len("def test():\n    return 1")))
+        diff = self.client.get(f"/code-blocks/{first['hash']}/diff/{second['hash']}").json['diff']
+        self.assertIn('-    return 1', diff)
+        self.assertIn('+    return 2', diff)
+        store = self.app.get_blob_store()
+        self.assertEqual([record[0] for record in store.scan()], [first['hash'], second['hash']])
+    def test_segment_rotation(self):
+        from blobstore import BlobStore
+        store = BlobStore(self.storage_path / 'packs', segment_size=64)
+        first = store.put('a' * 64, b'x' * 40)
+        second = store.put('b' * 64, b'y' * 40)
+        self.assertEqual((first[0], second[0]), (1, 2))
+        self.assertEqual(bytes(store.get(*second)), b'y' * 40)
+    def test_migration_and_export(self):
+        block = self.post("print('migrated')")
+        self.assertEqual(self.app.migrate_to_pack(), 1)
+        self.assertFalse(Path(block['file_path']).exists())
+        with self.app.get_db() as conn:
+            self.assertEqual(self.app.load_code(conn, [block['hash']]),
+                             {block['hash']: "print('migrated')"})
+        target = self.storage_path / 'export'
+        self.assertEqual(self.app.export_files(target), 1)
+        files = list(target.glob('test/python/*.python'))
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[0].read_text(), "print('migrated')")
+class CompressionTests(PackStorageTests):
+    def setUp(self):
+        super().setUp()
+        from unittest.mock import patch
+        patcher = patch.object(self.app, 'COMPRESSION', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    def test_dictionary_roundtrip(self):
+        import compression
+        samples = ["import os\nimport sys\nprint(%d)\n" % i for i in range(10)]
+        dictionary = compression.train_dictionary(samples)
+        self.assertIn(b"import os\n", dictionary)
+        data = "import os\nimport sys\nprint('other')\n".encode()
+        packed = compression.compress(data, dictionary)
+        self.assertLess(len(packed), len(compression.compress(data)))
+        self.assertEqual(compression.decompress(packed, dictionary), data)
+    def test_compressed_column_and_file(self):
+        code = "import os\nimport sys\n\ndef main():\n    print(os.getcwd(), sys.argv)\n    return 0"
+        self.post(code)
+        dict_id, _ = self.app.train_compression_dictionary()
+        block = self.post(code + "main()")
+        self.assertTrue(block['file_path'].endswith('.python.z'))
+        with self.app.get_db() as conn:
+            row = conn.execute("SELECT code, codec, dict_id FROM code_blocks WHERE hash = ?",
+                               (block['hash'],)).fetchone()
+            self.assertIsInstance(row[0], bytes)
+            self.assertEqual(row[1:], ('zlib', dict_id))
+            self.assertEqual(self.app.load_code(conn, [block['hash']])[block['hash']], code + "main()")
+        self.assertEqual([b['hash'] for b in block['similar_blocks']], [self.app.calculate_hash(code)])
+    def test_recompress(self):
+        code = "import os\nimport sys\n\ndef main():\n    print(os.getcwd(), sys.argv)\n    return 0"
+        from unittest.mock import patch
+        with patch.object(self.app, 'COMPRESSION', False):
+            first = self.post(code)
+        dict_id, _ = self.app.train_compression_dictionary()
+        self.assertEqual(self.app.recompress_blocks(), 1)
+        self.assertFalse(Path(first['file_path']).exists())
+        self.assertTrue(Path(first['file_path'] + '.z').exists())
+        with self.app.get_db() as conn:
+            self.assertEqual(conn.execute("SELECT dict_id FROM code_blocks").fetchone()[0], dict_id)
+            self.assertEqual(self.app.load_code(conn, [first['hash']])[first['hash']], code)